@@ -0,0 +1,100 @@
+"""
+任意日期的库存结存
+
+某仓库在某天的库存 = 该日期之前最近一个已结账月份的期末结存（BalanceSnapshot）
++ 此后到该日期（含）已完成出入库记录的数量合计。
+没有已结账月份时以库存记录的期初库存为起点，合计全部出入库记录。
+
+出入库记录的合计是一条按(品项, 规格)分组的SUM，走(仓库, 状态, 日期)索引，
+只扫描起点之后的记录，不随历史数据增长而变慢。
+"""
+from dateutil.relativedelta import relativedelta
+from django.db.models import Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.warehouse.ledger import month_start
+from apps.warehouse.models import MonthClose, BalanceSnapshot
+from .models import Inventory, Transaction
+
+
+def base_month(warehouse_id, day):
+    """day之前最近一个已结账的月份，没有时返回None"""
+    return MonthClose.objects.filter(
+        warehouse_id=warehouse_id,
+        month__lt=month_start(day),
+        status='completed'
+    ).order_by('-month').values_list('month', flat=True).first()
+
+
+def _opening_balances(warehouse_id, month):
+    """起点的结存：已结账月份的期末结存，没有时为库存记录的期初库存"""
+    if month is not None:
+        return {
+            (row['product'], row['spec']): row
+            for row in BalanceSnapshot.objects.filter(warehouse_id=warehouse_id, month=month)
+            .order_by('id').values('product', 'spec', 'unit', 'closing_quantity')
+        }
+    openings = Inventory.objects.filter(warehouse_id=warehouse_id).order_by() \
+        .annotate(spec_key=Coalesce('spec', Value(''))) \
+        .values('product__name', 'spec_key').annotate(unit_name=Max('unit'), opening=Sum('initial_quantity'))
+    return {
+        (row['product__name'], row['spec_key']): {
+            'product': row['product__name'],
+            'spec': row['spec_key'],
+            'unit': row['unit_name'],
+            'closing_quantity': row['opening'],
+        }
+        for row in openings
+    }
+
+
+def stock_as_of(warehouse_id, day):
+    """
+    返回仓库在day当天结束时的库存
+
+    返回:
+        (起点月份或None, [{'product', 'spec', 'unit', 'opening_quantity', 'in_quantity',
+                           'out_quantity', 'quantity'}, ...])
+    """
+    month = base_month(warehouse_id, day)
+    rows = {
+        key: {
+            'product': row['product'],
+            'spec': row['spec'],
+            'unit': row['unit'],
+            'opening_quantity': row['closing_quantity'],
+        }
+        for key, row in _opening_balances(warehouse_id, month).items()
+    }
+
+    transactions = Transaction.objects.filter(warehouse_id=warehouse_id, status='completed', transaction_date__lte=day)
+    if month is not None:
+        transactions = transactions.filter(transaction_date__gte=month + relativedelta(months=1))
+    totals = transactions.order_by().annotate(spec_key=Coalesce('spec', Value(''))) \
+        .values('product__name', 'spec_key').annotate(
+            unit_name=Max('unit'),
+            inbound=Sum('quantity', filter=Q(transaction_type='IN')),
+            outbound=Sum('quantity', filter=Q(transaction_type='OUT')),
+        )
+
+    for row in totals:
+        key = (row['product__name'], row['spec_key'])
+        item = rows.get(key)
+        if item is None:
+            item = rows[key] = {
+                'product': key[0],
+                'spec': key[1],
+                'unit': row['unit_name'],
+                'opening_quantity': 0,
+            }
+        item['unit'] = item['unit'] or row['unit_name']
+        item['in_quantity'] = row['inbound'] or 0
+        item['out_quantity'] = row['outbound'] or 0
+
+    results = []
+    for item in rows.values():
+        item.setdefault('in_quantity', 0)
+        item.setdefault('out_quantity', 0)
+        item['quantity'] = item['opening_quantity'] + item['in_quantity'] - item['out_quantity']
+        results.append(item)
+    return month, results
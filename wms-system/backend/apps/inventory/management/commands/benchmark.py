@@ -0,0 +1,442 @@
+"""
+性能基准测试
+
+在事务中生成测试数据，测量后回滚，不影响现有数据。
+sqlite基准在临时数据库文件上运行，不使用项目数据库。
+database基准在当前配置的数据库上运行，结束后删除测试数据；切换DB_ENGINE分别运行即可对比SQLite和PostgreSQL。
+
+用法:
+    python manage.py benchmark serializers --rows 1000
+    python manage.py benchmark sqlite --workers 4 --seconds 5
+    DB_ENGINE=postgresql python manage.py benchmark database --rows 5000 --workers 8
+    python manage.py benchmark compression --report-id 12 --bandwidth 2
+"""
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from decimal import Decimal
+
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from apps.inventory.models import Inventory, Transaction
+from apps.inventory.serializers import (
+    InventorySerializer, TransactionSerializer, InventoryRowSerializer, TransactionRowSerializer
+)
+from apps.inventory.posting import stock_posting_suspended
+from apps.product.models import Product, Unit
+from apps.warehouse import ledger
+from apps.warehouse.backup import BUFFER_SIZE, WarehouseBackup
+from apps.warehouse.importers import WarehouseExcelImporter
+from apps.warehouse.models import Warehouse, WarehouseArea, WarehouseLocation, Report, MonthlyLedgerLine
+from apps.warehouse.reporting import report_updates_suspended
+from utils.db import apply_sqlite_pragmas, sqlite_pragmas
+from utils.middleware import CompressionMiddleware, brotli
+from utils.renderers import FastJSONRenderer
+
+
+class Rollback(Exception):
+    """测量结束后回滚测试数据"""
+
+
+SQLITE_PRODUCTS = 1000
+
+
+def _sqlite_worker(path, pragmas, timeout, begin, seconds, write_ratio, seed, results):
+    """
+    在独立进程中混合执行读写，结果放入results队列
+
+    写操作模拟出入库记录保存：先读库存再更新库存并插入记录，与信号中的过账在同一事务中，begin为开始事务的语句；
+    读操作模拟库存汇总查询。
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    apply_sqlite_pragmas(conn.cursor(), pragmas)
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        product_id = rng.randrange(SQLITE_PRODUCTS)
+        try:
+            if rng.random() < write_ratio:
+                conn.execute(begin)
+                conn.execute('SELECT quantity FROM stock WHERE product_id = ?', (product_id,)).fetchone()
+                conn.execute('UPDATE stock SET quantity = quantity + 1 WHERE product_id = ?', (product_id,))
+                conn.execute('INSERT INTO txn (product_id, quantity) VALUES (?, 1)', (product_id,))
+                conn.execute('COMMIT')
+                counts['writes'] += 1
+            else:
+                conn.execute('SELECT COUNT(*), SUM(quantity) FROM txn WHERE product_id = ?', (product_id,)).fetchone()
+                conn.execute('SELECT SUM(quantity) FROM stock').fetchone()
+                counts['reads'] += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            counts['locked'] += 1
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+    conn.close()
+    results.put(counts)
+
+
+def _posting_worker(warehouse_id, product_ids, seconds, seed, results):
+    """
+    在独立进程中连续保存已完成的出入库记录，结果放入results队列
+
+    每条记录经信号过账库存并更新月度报表，与月末集中录入时的写入路径相同
+    """
+    rng = random.Random(seed)
+    counts = {'writes': 0, 'errors': 0}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            Transaction.objects.create(
+                warehouse_id=warehouse_id,
+                product_id=rng.choice(product_ids),
+                transaction_type=rng.choice(('IN', 'OUT')),
+                quantity=Decimal('1'),
+                unit_price=Decimal('2.5'),
+                amount=Decimal('2.5'),
+                status='completed',
+            )
+            counts['writes'] += 1
+        except DatabaseError:
+            counts['errors'] += 1
+    connections.close_all()
+    results.put(counts)
+
+
+class Command(BaseCommand):
+    help = '运行性能基准测试'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+        serializers_parser = subparsers.add_parser('serializers', help='库存/出入库列表序列化耗时')
+        serializers_parser.add_argument('--rows', type=int, default=1000, help='测试数据行数')
+        serializers_parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最快一次')
+
+        sqlite_parser = subparsers.add_parser('sqlite', help='SQLite默认配置与调优配置的多进程读写吞吐')
+        sqlite_parser.add_argument('--workers', type=int, default=4, help='并发进程数')
+        sqlite_parser.add_argument('--seconds', type=float, default=5, help='每种配置的运行秒数')
+        sqlite_parser.add_argument('--write-ratio', type=float, default=0.2, help='写操作比例')
+
+        database_parser = subparsers.add_parser('database', help='当前数据库上的导入和并发出入库吞吐')
+        database_parser.add_argument('--rows', type=int, default=5000, help='导入的出入库和库存行数')
+        database_parser.add_argument('--workers', type=int, default=4, help='并发保存出入库记录的进程数')
+        database_parser.add_argument('--seconds', type=float, default=5, help='并发保存的运行秒数')
+
+        renderers_parser = subparsers.add_parser('renderers', help='月度报表JSON渲染耗时')
+        renderers_parser.add_argument('--rows', type=int, default=50000, help='报表明细行数')
+        renderers_parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最快一次')
+
+        compression_parser = subparsers.add_parser('compression', help='月度报表和备份响应的压缩率与耗时')
+        compression_parser.add_argument('--report-id', type=int, help='使用已有的月度报表，不指定时生成测试报表')
+        compression_parser.add_argument('--rows', type=int, default=20000, help='测试报表明细行数和备份的库存行数')
+        compression_parser.add_argument('--bandwidth', type=float, default=2, help='估算传输时间的带宽（Mbit/s）')
+
+    def handle(self, *args, **options):
+        handler = getattr(self, f"benchmark_{options['benchmark']}")
+        if options['benchmark'] in ('sqlite', 'database'):
+            # 多进程需要读到已提交的数据，自行清理测试数据
+            handler(**options)
+            return
+        try:
+            with transaction.atomic():
+                handler(**options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, label, func, repeat, rows):
+        """执行func若干次，输出最快一次的耗时和查询数"""
+        best = None
+        for _ in range(repeat):
+            # 查询日志有长度上限，每次测量前清空以保证计数准确
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, len(queries))
+        elapsed, query_count = best
+        per_thousand = elapsed * 1000 / rows * 1000
+        self.stdout.write(f'{label:<40} {per_thousand:>10.1f} ms/1000行 {query_count:>8} 次查询')
+        return elapsed
+
+    def create_fixture(self, rows):
+        """生成一个仓库及rows条库存和出入库记录"""
+        warehouse = Warehouse.objects.create(name='基准测试仓库', code='BENCHMARK')
+        area = WarehouseArea.objects.create(warehouse=warehouse, name='基准测试库区', code='BENCHMARK')
+        unit = Unit.objects.create(name='个', code='BENCHMARK')
+        locations = WarehouseLocation.objects.bulk_create([
+            WarehouseLocation(area=area, code=f'L{i:05d}', name=f'库位{i}') for i in range(rows)
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f'商品{i}', code=f'BENCHMARK{i:06d}', spec=f'规格{i}', unit=unit) for i in range(rows)
+        ])
+        Inventory.objects.bulk_create([
+            Inventory(warehouse=warehouse, location=location, product=product, spec=product.spec, unit='个',
+                      quantity=Decimal('10'), unit_price=Decimal('2.5'), amount=Decimal('25'))
+            for location, product in zip(locations, products)
+        ], batch_size=1000)
+        Transaction.objects.bulk_create([
+            Transaction(transaction_code=f'BENCHMARK-{i:06d}', warehouse=warehouse, product=product,
+                        transaction_type='IN', quantity=Decimal('1'), unit_price=Decimal('2.5'),
+                        amount=Decimal('2.5'), status='completed')
+            for i, product in enumerate(products)
+        ], batch_size=1000)
+        return warehouse
+
+    def benchmark_serializers(self, rows, repeat, **options):
+        warehouse = self.create_fixture(rows)
+        inventories = Inventory.objects.filter(warehouse=warehouse)
+        transactions = Transaction.objects.filter(warehouse=warehouse)
+
+        self.stdout.write(f'序列化 {rows} 行，重复 {repeat} 次取最快一次')
+        before = self.measure(
+            '库存 嵌套序列化器（优化前）',
+            lambda: InventorySerializer(inventories.all(), many=True).data, repeat, rows)
+        after = self.measure(
+            '库存 values()投影（优化后）',
+            lambda: InventoryRowSerializer(inventories.values(*InventoryRowSerializer.values_fields), many=True).data,
+            repeat, rows)
+        self.stdout.write(self.style.SUCCESS(f'库存列表提速 {before / after:.1f} 倍'))
+
+        before = self.measure(
+            '出入库 嵌套序列化器（优化前）',
+            lambda: TransactionSerializer(transactions.all(), many=True).data, repeat, rows)
+        after = self.measure(
+            '出入库 values()投影（优化后）',
+            lambda: TransactionRowSerializer(transactions.values(*TransactionRowSerializer.values_fields), many=True).data,
+            repeat, rows)
+        self.stdout.write(self.style.SUCCESS(f'出入库列表提速 {before / after:.1f} 倍'))
+
+    def benchmark_sqlite(self, workers, seconds, write_ratio, **options):
+        profiles = [
+            # Django默认：回滚日志，sqlite3模块默认等待5秒
+            ('默认配置', [], 5.0, 'BEGIN'),
+            ('调优配置', sqlite_pragmas(), settings.SQLITE_BUSY_TIMEOUT / 1000, 'BEGIN IMMEDIATE'),
+        ]
+        self.stdout.write(f'{workers} 个进程，每种配置运行 {seconds:g} 秒，写操作比例 {write_ratio:.0%}')
+        self.stdout.write(f'{"配置":<12} {"读/秒":>10} {"写/秒":>10} {"锁错误":>8}')
+        with tempfile.TemporaryDirectory() as directory:
+            for label, pragmas, timeout, begin in profiles:
+                path = os.path.join(directory, f'{len(os.listdir(directory))}.sqlite3')
+                self.create_sqlite_fixture(path)
+                context = multiprocessing.get_context('fork')
+                results = context.Queue()
+                processes = [
+                    context.Process(target=_sqlite_worker,
+                                    args=(path, pragmas, timeout, begin, seconds, write_ratio, seed, results))
+                    for seed in range(workers)
+                ]
+                for process in processes:
+                    process.start()
+                totals = {'reads': 0, 'writes': 0, 'locked': 0}
+                for _ in processes:
+                    for key, value in results.get().items():
+                        totals[key] += value
+                for process in processes:
+                    process.join()
+                self.stdout.write(
+                    f'{label:<12} {totals["reads"] / seconds:>10.0f} {totals["writes"] / seconds:>10.0f} '
+                    f'{totals["locked"]:>8}'
+                )
+
+    def create_sqlite_fixture(self, path):
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE stock (product_id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL);
+            CREATE TABLE txn (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, quantity INTEGER NOT NULL);
+            CREATE INDEX txn_product_idx ON txn (product_id);
+        """)
+        conn.executemany('INSERT INTO stock VALUES (?, 0)', [(i,) for i in range(SQLITE_PRODUCTS)])
+        conn.executemany('INSERT INTO txn (product_id, quantity) VALUES (?, 1)',
+                         [(i % SQLITE_PRODUCTS,) for i in range(SQLITE_PRODUCTS * 10)])
+        conn.commit()
+        conn.close()
+
+    def benchmark_database(self, rows, workers, seconds, **options):
+        self.stdout.write(f'数据库: {connection.vendor}')
+
+        # 导入：在事务中执行后回滚
+        excel_data = self.import_fixture(rows)
+        try:
+            with transaction.atomic():
+                importer = WarehouseExcelImporter(
+                    None,
+                    {'inbound': '入库', 'outbound': '出库', 'inventory': '库存'},
+                    ['日期', '品项', '规格/型号', '单位', '数量', '单价'],
+                    ['位置', '品项', '规格/型号', '单位', '期初库存', '累计入库', '累计出库', '库存', '单价'],
+                )
+                importer.parse(excel_data)
+                start = time.perf_counter()
+                importer.run('基准测试导入仓库', 'BENCHMARK-IMPORT')
+                elapsed = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        total = rows * 3
+        self.stdout.write(f'{"导入":<16} {total / elapsed:>10.0f} 行/秒 （{total}行 {elapsed:.2f}秒）')
+
+        # 并发出入库：每条记录过账库存并更新本月报表
+        warehouse = Warehouse.objects.create(name='基准测试仓库', code='BENCHMARK-DB')
+        try:
+            unit = Unit.objects.create(name='个', code='BENCHMARK-DB')
+            products = Product.objects.bulk_create([
+                Product(name=f'商品{i}', code=f'BENCHMARK-DB{i:05d}', spec=f'规格{i}', unit=unit) for i in range(200)
+            ])
+            Inventory.objects.bulk_create([
+                Inventory(warehouse=warehouse, product=product, spec=product.spec, quantity=Decimal('1000'))
+                for product in products
+            ])
+            Report.objects.create(title='基准测试报表', warehouse=warehouse, report_date=timezone.localdate())
+            product_ids = [product.id for product in products]
+
+            # 子进程通过fork继承已初始化的Django环境，各自建立数据库连接
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            processes = [
+                context.Process(target=_posting_worker, args=(warehouse.id, product_ids, seconds, seed, results))
+                for seed in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            totals = {'writes': 0, 'errors': 0}
+            for _ in processes:
+                for key, value in results.get().items():
+                    totals[key] += value
+            for process in processes:
+                process.join()
+            self.stdout.write(
+                f'{"并发出入库":<16} {totals["writes"] / seconds:>10.0f} 条/秒 '
+                f'（{workers}个进程，错误{totals["errors"]}次）'
+            )
+        finally:
+            with stock_posting_suspended(), report_updates_suspended():
+                Transaction.objects.filter(warehouse=warehouse).delete()
+                warehouse.delete()
+                Product.objects.filter(code__startswith='BENCHMARK-DB').delete()
+                Unit.objects.filter(code='BENCHMARK-DB').delete()
+
+    def import_fixture(self, rows):
+        """生成导入模板格式的入库、出库和库存数据，各rows行"""
+        today = timezone.localdate()
+        transactions = [
+            {'日期': today, '品项': f'商品{i}', '规格/型号': f'规格{i}', '单位': '个', '数量': 1, '单价': 2.5}
+            for i in range(rows)
+        ]
+        inventory = [
+            {'位置': f'L{i % 100:03d}', '品项': f'商品{i}', '规格/型号': f'规格{i}', '单位': '个',
+             '期初库存': 10, '累计入库': 1, '累计出库': 1, '库存': 10, '单价': 2.5}
+            for i in range(rows)
+        ]
+        return {
+            '入库': pd.DataFrame(transactions),
+            '出库': pd.DataFrame(transactions),
+            '库存': pd.DataFrame(inventory),
+        }
+
+    def benchmark_renderers(self, rows, repeat, **options):
+        """渲染rows行的月度报表，数据结构与ledger.get_report_data的返回值相同"""
+        record_types = list(ledger.RECORD_TYPES)
+        data = {record_type: [] for record_type in record_types}
+        for i in range(rows):
+            record_type = record_types[i % len(record_types)]
+            line = MonthlyLedgerLine(
+                record_type=record_type, record_id=f'{i:036d}', position=i,
+                product=f'商品{i}', spec=f'规格{i % 50}', unit='个', location=f'L{i % 100:03d}', handler='张三',
+                quantity=Decimal('3.5'), opening_quantity=Decimal('10'), in_quantity=Decimal('2'),
+                out_quantity=Decimal('1.25'), closing_quantity=Decimal('10.75'), unit_price=Decimal('12.3456'),
+                amount=Decimal('132.7152'), record_date=str(timezone.localdate()),
+            )
+            data[record_type].append(ledger.line_to_record(line))
+
+        # 库存查询等接口直接返回Decimal
+        decimals = [
+            {'product': f'商品{i}', 'spec': f'规格{i}', 'opening_quantity': Decimal('10'),
+             'in_quantity': Decimal('2'), 'out_quantity': Decimal('1.25'), 'quantity': Decimal('10.75')}
+            for i in range(rows)
+        ]
+
+        self.stdout.write(f'渲染 {rows} 行，重复 {repeat} 次取最快一次')
+        for label, payload in (('月度报表', data), ('Decimal结果', decimals)):
+            before = self.measure(f'{label} JSONRenderer（优化前）', lambda: JSONRenderer().render(payload), repeat, rows)
+            after = self.measure(f'{label} FastJSONRenderer（优化后）', lambda: FastJSONRenderer().render(payload),
+                                 repeat, rows)
+            if JSONRenderer().render(payload) != FastJSONRenderer().render(payload):
+                self.stdout.write(self.style.WARNING(f'{label} 两种渲染结果不一致'))
+            self.stdout.write(self.style.SUCCESS(f'{label}渲染提速 {before / after:.1f} 倍'))
+
+    def create_report(self, warehouse, rows):
+        """生成rows行明细的月度报表，数量、金额等取随机值"""
+        rng = random.Random(0)
+        today = timezone.localdate()
+        report = Report.objects.create(title='基准测试报表', warehouse=warehouse, report_date=today)
+        data = {record_type: [] for record_type in ledger.RECORD_TYPES}
+        for i in range(rows):
+            record_type = ledger.RECORD_TYPES[i % len(ledger.RECORD_TYPES)]
+            product = rng.randrange(rows)
+            quantity = Decimal(rng.randrange(1, 100000)) / 100
+            price = Decimal(rng.randrange(1, 1000000)) / 10000
+            record = {'品项': f'商品{product}', '规格/型号': f'规格{product}', '单位': '个', '单价': price}
+            if record_type == 'inventory':
+                record.update({'位置': f'L{product:05d}', '期初库存': quantity, '累计入库': rng.randrange(100),
+                               '累计出库': rng.randrange(100), '库存': quantity, '库存金额': quantity * price})
+            else:
+                record.update({'日期': str(today.replace(day=rng.randrange(1, 29))), '数量': quantity,
+                               '金额': quantity * price, '经手人': rng.choice(['张三', '李四', '王五'])})
+            data[record_type].append(record)
+        ledger.replace_report_data(report, data)
+        return report
+
+    def benchmark_compression(self, report_id, rows, bandwidth, **options):
+        """经CompressionMiddleware压缩月度报表JSON和流式备份，对比字节数、压缩耗时和估算的传输时间"""
+        warehouse = self.create_fixture(rows)
+        if report_id:
+            report = Report.objects.get(pk=report_id)
+        else:
+            report = self.create_report(warehouse, rows)
+        report_json = FastJSONRenderer().render(ledger.get_report_data(report))
+        backup = b''.join(WarehouseBackup(warehouse).stream('ndjson'))
+        backup_chunks = [backup[i:i + BUFFER_SIZE] for i in range(0, len(backup), BUFFER_SIZE)]
+
+        payloads = (
+            (f'月度报表#{report.id}', lambda: HttpResponse(report_json, content_type='application/json')),
+            ('流式备份', lambda: StreamingHttpResponse(iter(backup_chunks), content_type='application/x-ndjson')),
+        )
+        encodings = ['identity', 'gzip', *(['br'] if brotli else [])]
+        factory = RequestFactory()
+
+        self.stdout.write(f'带宽 {bandwidth} Mbit/s，总耗时 = 压缩耗时 + 传输时间')
+        with override_settings(RESPONSE_COMPRESSION=True):
+            for label, make_response in payloads:
+                baseline = None
+                for encoding in encodings:
+                    middleware = CompressionMiddleware(lambda request: make_response())
+                    start = time.perf_counter()
+                    response = middleware(factory.get('/', HTTP_ACCEPT_ENCODING=encoding))
+                    body = b''.join(response.streaming_content) if response.streaming else response.content
+                    elapsed = time.perf_counter() - start
+                    total = elapsed + len(body) * 8 / (bandwidth * 1000 * 1000)
+                    if baseline is None:
+                        baseline = (len(body), total)
+                    self.stdout.write(
+                        f'{label:<14} {encoding:<9} {len(body) / 1024:>10.1f} KB {len(body) / baseline[0]:>7.1%} '
+                        f'压缩 {elapsed * 1000:>7.1f} ms  总耗时 {total * 1000:>8.0f} ms'
+                    )
+                self.stdout.write(self.style.SUCCESS(
+                    f'{label} 压缩后传输字节减少 {1 - len(body) / baseline[0]:.0%}，总耗时缩短 {baseline[1] / total:.1f} 倍'
+                ))
@@ -0,0 +1,59 @@
+"""
+按出入库记录重算库存
+
+库存过账上线前库存的累计入库/累计出库没有维护，执行一次本命令使其与已完成的出入库记录一致：
+库存 = 期初库存 + 累计入库 - 累计出库。
+
+用法:
+    python manage.py rebuild_stock
+    python manage.py rebuild_stock --warehouse-id 3
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from apps.inventory.models import Inventory, Transaction
+from apps.inventory.posting import StockDeltas
+
+
+class Command(BaseCommand):
+    help = '按已完成的出入库记录重算库存数量和累计出入库'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warehouse-id', type=int, help='只重算指定仓库')
+
+    def handle(self, *args, **options):
+        inventories = Inventory.objects.all()
+        transactions = Transaction.objects.filter(status='completed')
+        if options['warehouse_id']:
+            inventories = inventories.filter(warehouse_id=options['warehouse_id'])
+            transactions = transactions.filter(warehouse_id=options['warehouse_id'])
+
+        totals = transactions.order_by().values('warehouse_id', 'product_id').annotate(
+            inbound=Sum('quantity', filter=Q(transaction_type='IN')),
+            outbound=Sum('quantity', filter=Q(transaction_type='OUT')),
+        )
+
+        deltas = StockDeltas()
+        for row in totals.iterator():
+            for transaction_type, quantity in (('IN', row['inbound']), ('OUT', row['outbound'])):
+                deltas.add({
+                    'warehouse_id': row['warehouse_id'],
+                    'product_id': row['product_id'],
+                    'transaction_type': transaction_type,
+                    'quantity': quantity or 0,
+                    'spec': '',
+                    'unit': '',
+                    'unit_price': 0,
+                })
+
+        with transaction.atomic():
+            reset = inventories.update(
+                total_in=0,
+                total_out=0,
+                quantity=F('initial_quantity'),
+                amount=F('initial_quantity') * F('unit_price'),
+            )
+            posted = deltas.apply()
+
+        self.stdout.write(self.style.SUCCESS(f'库存重算完成: 重置{reset}行，过账{posted}行'))
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:54
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_inventory_initial_quantity_inventory_total_in_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_date',
+            field=models.DateField(default=django.utils.timezone.localdate, verbose_name='日期'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_transaction_date_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['warehouse', 'product', 'transaction_type', 'status'], name='txn_wh_product_type_status_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0008_report_summary'),
+        ('inventory', '0009_transaction_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=20, verbose_name='前缀')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('last_value', models.PositiveBigIntegerField(default=0, verbose_name='已分配序号')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='code_sequences', to='warehouse.warehouse', verbose_name='仓库')),
+            ],
+            options={
+                'verbose_name': '单据编号序列',
+                'verbose_name_plural': '单据编号序列',
+                'unique_together': {('prefix', 'warehouse', 'date')},
+            },
+        ),
+    ]
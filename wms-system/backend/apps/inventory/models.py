@@ -1,12 +1,17 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction as db_transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from apps.warehouse.models import Warehouse, WarehouseLocation
 from apps.product.models import Product
 from apps.user.models import User
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-import calendar
-from datetime import datetime, timedelta
+from apps.warehouse.reporting import ReportDeltas, transaction_posting, report_updates_enabled
+from apps.warehouse.periods import ensure_postings_open
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class Inventory(models.Model):
@@ -34,6 +39,9 @@ class Inventory(models.Model):
         verbose_name_plural = verbose_name
         ordering = ['-updated_time']
         unique_together = ['warehouse', 'location', 'product']
+        indexes = [
+            models.Index(fields=['warehouse', 'is_active'], name='inv_wh_active_idx'),
+        ]
 
     def __str__(self):
         return f"{self.warehouse.name}-{self.product.name}({self.quantity})"
@@ -58,7 +66,7 @@ class Transaction(models.Model):
     )
     
     transaction_code = models.CharField(_('序号'), max_length=50, unique=True)
-    transaction_date = models.DateField(_('日期'), auto_now_add=True)
+    transaction_date = models.DateField(_('日期'), default=timezone.localdate)
     product = models.ForeignKey(Product, on_delete=models.CASCADE,
                               related_name='product_transactions', verbose_name=_('品项'))
     spec = models.CharField(_('规格/型号'), max_length=100, blank=True, null=True)
@@ -76,133 +84,116 @@ class Transaction(models.Model):
     created_time = models.DateTimeField(_('创建时间'), auto_now_add=True)
     updated_time = models.DateTimeField(_('更新时间'), auto_now=True)
     
-    _original_status = None
-    _original_quantity = None
-    _original_transaction_date = None
+    _original_posting = None
 
     class Meta:
         verbose_name = _('出入库记录')
         verbose_name_plural = verbose_name
         ordering = ['-transaction_date', '-created_time']
+        indexes = [
+            # 按仓库、商品统计出入库数量
+            models.Index(fields=['warehouse', 'product', 'transaction_type', 'status'],
+                         name='txn_wh_product_type_status_idx'),
+            # 按仓库、状态、日期筛选出入库记录（备份、月度报表）
+            models.Index(fields=['warehouse', 'status', 'transaction_date'], name='txn_wh_status_date_idx'),
+            # 出入库记录列表的键集分页
+            models.Index(fields=['transaction_date', 'created_time', 'id'], name='txn_keyset_idx'),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # 保存原始状态，用于比较是否发生变化
-        self._original_status = self.status
-        self._original_quantity = self.quantity
-        self._original_transaction_date = self.transaction_date
+        # 保存原始状态，用于在保存后计算对报表的差额
+        self._original_posting = transaction_posting(self)
 
     def __str__(self):
         return f"{self.transaction_code}({self.get_transaction_type_display()})"
 
     def save(self, *args, **kwargs):
+        # 未填写编号时自动分配，在进入保存事务前领取，避免长时间锁住计数器
+        if not self.transaction_code:
+            from .sequences import next_code
+            self.transaction_code = next_code(self.transaction_type, self.warehouse)
+
         # 自动计算金额
         self.amount = self.quantity * self.unit_price
+
+        # 已结账月份的记录不能修改，也不能改到已结账月份
+        ensure_postings_open(self._original_posting, transaction_posting(self))
         
         # 保存前先保存对象，以便在post_save信号中可以获取到原始值和新值
-        super().save(*args, **kwargs)
+        # 库存过账在post_save中进行，与记录本身的保存处于同一个数据库事务
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        ensure_postings_open(self._original_posting)
+        with db_transaction.atomic():
+            return super().delete(*args, **kwargs)
 
 # 添加信号处理器，用于在Transaction保存后处理相关报表更新
 @receiver(post_save, sender=Transaction)
-def update_monthly_reports_after_transaction_save(sender, instance, **kwargs):
+def update_monthly_reports_after_transaction_save(sender, instance, created=False, **kwargs):
     """
-    当Transaction保存后，检查并更新相关月份的报表数据
+    当Transaction保存后，把本次变化的差额过账到库存，并增量应用到相关月份的报表
     """
-    # 只处理已完成的事务
-    if instance.status != 'completed':
+    # posting模块依赖本模块的模型，在函数内导入避免循环引用
+    from .posting import StockDeltas, stock_posting_enabled
+
+    posting = transaction_posting(instance)
+    original = None if created else instance._original_posting
+    instance._original_posting = posting
+
+    # 库存过账失败时抛出异常，使记录的保存一起回滚
+    if stock_posting_enabled():
+        stock = StockDeltas()
+        stock.add(original, sign=-1)
+        stock.add(posting)
+        stock.apply()
+
+    if not report_updates_enabled():
         return
-    
-    # 获取事务所属月份
-    transaction_month = instance.transaction_date.strftime("%Y-%m")
-    
-    # 导入这里是为了避免循环导入问题
-    from apps.warehouse.views import MonthlyReportViewSet
-    
-    # 创建视图集实例
-    report_viewset = MonthlyReportViewSet()
-    
-    # 1. 先更新当月报表
-    try:
-        # 通过视图集更新当月报表
-        report_viewset.update_monthly_report_for_transaction(
-            warehouse_id=instance.warehouse.id,
-            month=transaction_month,
-            transaction=instance
-        )
-    except Exception as e:
-        print(f"更新当月报表失败: {e}")
-    
-    # 2. 获取并更新后续月份的报表
+
+    if settings.REPORT_UPDATES_IN_BACKGROUND:
+        from apps.warehouse.jobs import enqueue_report_postings
+        enqueue_report_postings([(original, -1), (posting, 1)])
+        return
+
+    deltas = ReportDeltas()
+    deltas.add(original, sign=-1)
+    deltas.add(posting)
+
     try:
-        # 计算事务月份之后的所有月份
-        current_date = datetime.now().date()
-        transaction_date = datetime.strptime(transaction_month + "-01", "%Y-%m-%d").date()
-        
-        # 生成从事务发生月份到当前月份的所有月份列表
-        months_to_update = []
-        next_month = transaction_date.replace(day=1) + timedelta(days=32)
-        next_month = next_month.replace(day=1)  # 下一个月的第一天
-        
-        while next_month.replace(day=1) <= current_date.replace(day=1):
-            months_to_update.append(next_month.strftime("%Y-%m"))
-            next_month = next_month.replace(day=1) + timedelta(days=32)
-            next_month = next_month.replace(day=1)
-        
-        # 更新每个后续月份的期初库存
-        for month in months_to_update:
-            report_viewset.update_initial_inventory_for_month(
-                warehouse_id=instance.warehouse.id,
-                month=month
-            )
+        deltas.apply()
     except Exception as e:
-        print(f"更新后续月份报表失败: {e}")
+        logger.error(f"更新月度报表失败: transaction_id={instance.id}, error={str(e)}", exc_info=True)
 
 @receiver(post_delete, sender=Transaction)
 def update_monthly_reports_after_transaction_delete(sender, instance, **kwargs):
     """
-    当Transaction删除后，检查并更新相关月份的报表数据
+    当Transaction删除后，从库存和相关月份的报表中冲回该记录的影响
     """
-    # 只处理已完成的事务
-    if instance.status != 'completed':
+    from .posting import StockDeltas, stock_posting_enabled
+
+    if stock_posting_enabled():
+        stock = StockDeltas()
+        stock.add(instance._original_posting, sign=-1)
+        stock.apply()
+
+    if not report_updates_enabled():
         return
-        
-    # 类似于保存后的处理逻辑
-    transaction_month = instance.transaction_date.strftime("%Y-%m")
-    
-    from apps.warehouse.views import MonthlyReportViewSet
-    report_viewset = MonthlyReportViewSet()
-    
+
+    if settings.REPORT_UPDATES_IN_BACKGROUND:
+        from apps.warehouse.jobs import enqueue_report_postings
+        enqueue_report_postings([(instance._original_posting, -1)])
+        return
+
+    deltas = ReportDeltas()
+    deltas.add(instance._original_posting, sign=-1)
+
     try:
-        # 通过视图集更新当月报表
-        report_viewset.update_monthly_report_for_transaction(
-            warehouse_id=instance.warehouse.id,
-            month=transaction_month,
-            transaction=None,  # 传递None表示删除操作
-            deleted_transaction=instance  # 传递被删除的事务
-        )
-        
-        # 更新后续月份
-        current_date = datetime.now().date()
-        transaction_date = datetime.strptime(transaction_month + "-01", "%Y-%m-%d").date()
-        
-        # 生成后续月份列表
-        months_to_update = []
-        next_month = transaction_date.replace(day=1) + timedelta(days=32)
-        next_month = next_month.replace(day=1)
-        
-        while next_month.replace(day=1) <= current_date.replace(day=1):
-            months_to_update.append(next_month.strftime("%Y-%m"))
-            next_month = next_month.replace(day=1) + timedelta(days=32)
-            next_month = next_month.replace(day=1)
-        
-        # 更新每个后续月份
-        for month in months_to_update:
-            report_viewset.update_initial_inventory_for_month(
-                warehouse_id=instance.warehouse.id,
-                month=month
-            )
+        deltas.apply()
     except Exception as e:
-        print(f"删除事务后更新报表失败: {e}")
+        logger.error(f"删除事务后更新报表失败: transaction_id={instance.id}, error={str(e)}", exc_info=True)
 
 class StockCheck(models.Model):
     """库存盘点模型"""
@@ -237,6 +228,12 @@ class StockCheck(models.Model):
     def __str__(self):
         return f"{self.check_code} - {self.warehouse.name}"
 
+    def save(self, *args, **kwargs):
+        if not self.check_code:
+            from .sequences import next_code
+            self.check_code = next_code('PD', self.warehouse)
+        super().save(*args, **kwargs)
+
 
 class StockCheckItem(models.Model):
     """库存盘点明细模型"""
@@ -262,4 +259,21 @@ class StockCheckItem(models.Model):
         unique_together = ['stock_check', 'product', 'location', 'batch_number']
 
     def __str__(self):
-        return f"{self.stock_check.check_code} - {self.product.name}" 
\ No newline at end of file
+        return f"{self.stock_check.check_code} - {self.product.name}"
+
+
+class CodeSequence(models.Model):
+    """单据编号计数器，按前缀、仓库、日期分别计数，由sequences模块按号段领取"""
+    prefix = models.CharField(_('前缀'), max_length=20)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='code_sequences',
+                                  verbose_name=_('仓库'))
+    date = models.DateField(_('日期'))
+    last_value = models.PositiveBigIntegerField(_('已分配序号'), default=0)
+
+    class Meta:
+        verbose_name = _('单据编号序列')
+        verbose_name_plural = verbose_name
+        unique_together = ['prefix', 'warehouse', 'date']
+
+    def __str__(self):
+        return f"{self.prefix}-{self.warehouse_id}-{self.date}: {self.last_value}"
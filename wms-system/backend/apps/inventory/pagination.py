@@ -0,0 +1,171 @@
+"""
+出入库记录的键集分页
+
+按(transaction_date, created_time, id)组成的复合键定位下一页，
+游标中保存当前页边界行的完整键值，翻到任意深度都只需一次索引范围查询，
+不执行COUNT(*)，也不使用OFFSET。
+"""
+import base64
+import json
+from datetime import date, datetime
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    复合键游标分页
+
+    ordering中的字段必须能唯一确定一行（最后一个字段通常为id），且都在查询结果中。
+    """
+    ordering = ('-transaction_date', '-created_time', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = '无效的游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        reverse, key = self.decode_cursor(request)
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if key is not None:
+            queryset = queryset.filter(self._after(ordering, key))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # 向前翻页时，起点之后一定还有数据；向后翻页时同理
+        if reverse:
+            self.has_next = key is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = key is not None
+
+        self.first_key = self._row_key(rows[0]) if rows else None
+        self.last_key = self._row_key(rows[-1]) if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or self.last_key is None:
+            return None
+        return self.encode_cursor(False, self.last_key)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_key is None:
+            return None
+        return self.encode_cursor(True, self.first_key)
+
+    # ------------------------------------------------------------------
+    # 游标编码
+    # ------------------------------------------------------------------
+    def encode_cursor(self, reverse, key):
+        payload = json.dumps({'r': int(reverse), 'k': [_encode_value(value) for value in key]})
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """返回(是否向前翻页, 边界行键值)，没有游标时键值为None"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(parse.unquote(encoded).encode('ascii')))
+            values = payload['k']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            key = [self._parse_value(field, value) for field, value in zip(self.ordering, values)]
+            return bool(payload.get('r')), key
+        except (TypeError, ValueError, KeyError, json.JSONDecodeError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _parse_value(self, field, value):
+        """按字段名还原游标中的键值"""
+        name = field.lstrip('-')
+        if value is None:
+            return None
+        if name.endswith('_time'):
+            parsed = parse_datetime(value)
+        elif name.endswith('_date'):
+            parsed = parse_date(value)
+        else:
+            parsed = int(value)
+        if parsed is None:
+            raise ValueError
+        return parsed
+
+    # ------------------------------------------------------------------
+    # 查询条件
+    # ------------------------------------------------------------------
+    def _reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def _row_key(self, row):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def _after(self, ordering, key):
+        """
+        排在边界行之后的行：
+        (a < x) OR (a = x AND b < y) OR (a = x AND b = y AND c < z)
+        再附加冗余条件 a <= x，便于数据库直接在索引上定位范围
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, key):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': key[0]}) & condition
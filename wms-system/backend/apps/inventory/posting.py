@@ -0,0 +1,188 @@
+"""
+库存过账
+
+出入库记录变为已完成时，把数量过账到对应(仓库, 商品)的库存记录上；
+取消或删除已完成的记录时冲回。库存的库存/累计入库/累计出库因此始终与出入库记录一致，
+读取库存数量不再需要对出入库记录做聚合。
+
+过账使用F()表达式在数据库端更新，批量过账时所有库存行合并为一条带Case/When的UPDATE。
+"""
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from apps.warehouse.periods import ensure_postings_open
+from apps.warehouse.reporting import ReportDeltas, transaction_posting
+from .models import Inventory, Transaction
+
+logger = logging.getLogger(__name__)
+
+# 单条UPDATE语句中最多包含的库存行数
+UPDATE_BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+@contextmanager
+def stock_posting_suspended():
+    """
+    暂停出入库记录信号的库存过账
+
+    用于导入、恢复等直接写入库存快照的场景
+    """
+    previous = getattr(_local, 'suspended', False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+def stock_posting_enabled():
+    return not getattr(_local, 'suspended', False)
+
+
+class StockDeltas:
+    """按(仓库, 商品)累计的库存差额"""
+
+    def __init__(self):
+        self._deltas = defaultdict(lambda: {'in': Decimal('0'), 'out': Decimal('0')})
+        self._meta = {}
+
+    def add(self, posting, sign=1):
+        if not posting:
+            return
+        key = (posting['warehouse_id'], posting['product_id'])
+        field = 'in' if posting['transaction_type'] == 'IN' else 'out'
+        self._deltas[key][field] += sign * Decimal(str(posting['quantity']))
+        self._meta.setdefault(key, posting)
+
+    def add_transactions(self, transactions, sign=1):
+        for instance in transactions:
+            self.add(transaction_posting(instance), sign)
+
+    def __bool__(self):
+        return any(d['in'] or d['out'] for d in self._deltas.values())
+
+    def apply(self):
+        """把累计差额过账到库存，返回更新的库存行数"""
+        deltas = {key: delta for key, delta in self._deltas.items() if delta['in'] or delta['out']}
+        if not deltas:
+            return 0
+
+        with transaction.atomic():
+            targets = self._lock_targets(deltas.keys())
+            updates = [(targets[key], delta) for key, delta in deltas.items()]
+            for start in range(0, len(updates), UPDATE_BATCH_SIZE):
+                _update_inventory(updates[start:start + UPDATE_BATCH_SIZE])
+        return len(updates)
+
+    def _lock_targets(self, keys):
+        """
+        锁定并返回每个(仓库, 商品)对应的库存行ID
+
+        同一商品在多个库位都有库存时过账到最早建立的一行，没有库存行时新建一行（未分配库位）
+        """
+        warehouse_ids = {warehouse_id for warehouse_id, _ in keys}
+        product_ids = {product_id for _, product_id in keys}
+
+        def load():
+            rows = Inventory.objects.select_for_update() \
+                .filter(warehouse_id__in=warehouse_ids, product_id__in=product_ids) \
+                .order_by('id').values_list('id', 'warehouse_id', 'product_id')
+            found = {}
+            for inventory_id, warehouse_id, product_id in rows:
+                found.setdefault((warehouse_id, product_id), inventory_id)
+            return found
+
+        targets = load()
+        missing = [key for key in keys if key not in targets]
+        if missing:
+            Inventory.objects.bulk_create([
+                Inventory(
+                    warehouse_id=warehouse_id,
+                    product_id=product_id,
+                    spec=self._meta[(warehouse_id, product_id)]['spec'],
+                    unit=self._meta[(warehouse_id, product_id)]['unit'] or '个',
+                    unit_price=Decimal(str(self._meta[(warehouse_id, product_id)]['unit_price'])),
+                    is_active=True,
+                )
+                for warehouse_id, product_id in missing
+            ])
+            targets = load()
+        return targets
+
+
+def _update_inventory(updates):
+    """用一条UPDATE把一批差额写入库存行"""
+    def case(values):
+        return Case(
+            *[When(id=inventory_id, then=Value(value)) for inventory_id, value in values],
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    total_in = case([(inventory_id, delta['in']) for inventory_id, delta in updates])
+    total_out = case([(inventory_id, delta['out']) for inventory_id, delta in updates])
+    net = case([(inventory_id, delta['in'] - delta['out']) for inventory_id, delta in updates])
+
+    Inventory.objects.filter(id__in=[inventory_id for inventory_id, _ in updates]).update(
+        total_in=F('total_in') + total_in,
+        total_out=F('total_out') + total_out,
+        quantity=F('quantity') + net,
+        amount=(F('quantity') + net) * F('unit_price'),
+        updated_time=timezone.now(),
+    )
+
+
+def post_transactions(transactions, sign=1):
+    """把一批出入库记录一次性过账到库存，sign=-1时冲回"""
+    deltas = StockDeltas()
+    deltas.add_transactions(transactions, sign)
+    return deltas.apply()
+
+
+def set_transactions_status(queryset, status):
+    """
+    批量修改出入库记录状态，并在同一事务中完成库存过账和报表更新
+
+    返回实际修改的记录数
+    """
+    with transaction.atomic():
+        changed = list(queryset.select_for_update().exclude(status=status))
+        if not changed:
+            return 0
+
+        postings = []
+        for instance in changed:
+            postings.append((instance._original_posting, -1))
+            instance.status = status
+            instance._original_posting = transaction_posting(instance)
+            postings.append((instance._original_posting, 1))
+
+        ensure_postings_open(*[posting for posting, _ in postings])
+
+        stock = StockDeltas()
+        reports = ReportDeltas()
+        for posting, sign in postings:
+            stock.add(posting, sign)
+            reports.add(posting, sign)
+
+        Transaction.objects.filter(id__in=[instance.id for instance in changed]) \
+            .update(status=status, updated_time=timezone.now())
+        stock.apply()
+        if settings.REPORT_UPDATES_IN_BACKGROUND:
+            from apps.warehouse.jobs import enqueue_report_postings
+            enqueue_report_postings(postings)
+        else:
+            reports.apply()
+
+    logger.info(f"出入库记录状态批量更新: status={status}, 数量={len(changed)}")
+    return len(changed)
@@ -0,0 +1,140 @@
+"""
+单据编号分配
+
+出入库记录、订单、盘点单的编号按“前缀 + 日期 + 仓库ID + 序号”生成，
+序号由CodeSequence按(前缀, 仓库, 日期)计数：
+- 每次从数据库领取一段序号（一条UPDATE），号段缓存在进程内，用完再领
+- 各进程领取的号段互不重叠，多个worker并发录入不会撞号
+- 进程重启或事务回滚时未用完的号段直接作废，编号可能不连续
+
+仓库编码最长50个字符，与单据编号字段等长，因此编号中使用仓库ID而不是仓库编码。
+"""
+import re
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CodeSequence
+
+CODE_PATTERN = re.compile(r'(?P<prefix>[A-Z]+)(?P<day>\d{8})-(?P<warehouse_id>\d+)-(?P<value>\d+)')
+
+# {(前缀, 仓库ID, 日期): [下一个序号, 号段最后一个序号]}
+_blocks = {}
+_lock = threading.Lock()
+
+
+def block_size():
+    return getattr(settings, 'CODE_SEQUENCE_BLOCK_SIZE', 100)
+
+
+def format_code(prefix, warehouse_id, day, value):
+    return f"{prefix}{day:%Y%m%d}-{warehouse_id}-{value:04d}"
+
+
+def parse_code(code):
+    """拆分format_code生成的编号，返回(前缀, 仓库ID, 日期, 序号)，其他格式的编号返回None"""
+    match = CODE_PATTERN.fullmatch(code or '')
+    if not match:
+        return None
+    try:
+        day = datetime.strptime(match['day'], '%Y%m%d').date()
+    except ValueError:
+        return None
+    return match['prefix'], int(match['warehouse_id']), day, int(match['value'])
+
+
+def allocate(prefix, warehouse_id, day, count):
+    """从数据库领取count个连续序号，返回(第一个, 最后一个)"""
+    sequences = CodeSequence.objects.filter(prefix=prefix, warehouse_id=warehouse_id, date=day)
+    with transaction.atomic():
+        if not sequences.update(last_value=F('last_value') + count):
+            try:
+                with transaction.atomic():
+                    CodeSequence.objects.create(
+                        prefix=prefix, warehouse_id=warehouse_id, date=day, last_value=count
+                    )
+                return 1, count
+            except IntegrityError:
+                # 其他进程同时创建了计数器
+                sequences.update(last_value=F('last_value') + count)
+        # UPDATE已锁定该行，事务提交前读到的就是本次领取后的值
+        last = sequences.values_list('last_value', flat=True).get()
+    return last - count + 1, last
+
+
+def _store_block(key, first, last):
+    today = timezone.localdate()
+    with _lock:
+        # 顺带清理往日的号段
+        for stale in [k for k in _blocks if k[2] < today]:
+            del _blocks[stale]
+        _blocks[key] = [first, last]
+
+
+def next_values(prefix, warehouse_id, count=1, day=None):
+    """取count个序号，优先使用进程内缓存的号段，不够时再向数据库领取"""
+    day = day or timezone.localdate()
+    key = (prefix, warehouse_id, day)
+
+    values = []
+    with _lock:
+        block = _blocks.get(key)
+        if block:
+            taken = min(count, block[1] - block[0] + 1)
+            values.extend(range(block[0], block[0] + taken))
+            block[0] += taken
+            if block[0] > block[1]:
+                del _blocks[key]
+
+    remaining = count - len(values)
+    if remaining:
+        first, last = allocate(prefix, warehouse_id, day, max(remaining, block_size()))
+        values.extend(range(first, first + remaining))
+        if first + remaining <= last:
+            # 号段随外层事务提交后才能给其他请求使用，回滚时整段作废
+            transaction.on_commit(lambda: _store_block(key, first + remaining, last))
+    return values
+
+
+def next_codes(prefix, warehouse, count=1, day=None):
+    """为仓库生成count个单据编号"""
+    day = day or timezone.localdate()
+    return [format_code(prefix, warehouse.id, day, value)
+            for value in next_values(prefix, warehouse.id, count, day)]
+
+
+def next_code(prefix, warehouse, day=None):
+    return next_codes(prefix, warehouse, 1, day)[0]
+
+
+def advance_past(warehouse, codes):
+    """
+    直接写入已有编号（如恢复备份）后，把计数器推进到这些编号之后，避免之后分配到相同编号
+
+    只处理本仓库按format_code生成的编号
+    """
+    latest = {}
+    for code in codes:
+        parsed = parse_code(code)
+        if parsed and parsed[1] == warehouse.id:
+            key = (parsed[0], parsed[2])
+            latest[key] = max(latest.get(key, 0), parsed[3])
+
+    for (prefix, day), value in latest.items():
+        sequences = CodeSequence.objects.filter(prefix=prefix, warehouse=warehouse, date=day)
+        if not sequences.filter(last_value__lt=value).update(last_value=value):
+            CodeSequence.objects.get_or_create(
+                prefix=prefix, warehouse=warehouse, date=day, defaults={'last_value': value}
+            )
+    # 本进程缓存的号段可能与写入的编号重叠
+    reset_cache()
+
+
+def reset_cache():
+    """清空进程内号段，用于测试和基准测试"""
+    with _lock:
+        _blocks.clear()
@@ -38,6 +38,8 @@ class TransactionSerializer(serializers.ModelSerializer):
             'transaction_date'
         ]
         read_only_fields = ['created_time', 'updated_time', 'amount']
+        # 不填写时由保存时自动分配
+        extra_kwargs = {'transaction_code': {'required': False}}
         
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -88,4 +90,66 @@ class InventorySerializer(serializers.ModelSerializer):
             '单价': data['unit_price'],
             '库存金额': data['amount'],
             '状态': '启用' if data['is_active'] else '禁用'
-        } 
\ No newline at end of file
+        }
+
+
+def _decimal(value):
+    """与DecimalField(decimal_places=2)的输出格式一致"""
+    return None if value is None else f'{value:.2f}'
+
+
+class InventoryRowSerializer(serializers.BaseSerializer):
+    """
+    库存列表的只读快速路径
+
+    直接把values()投影转换为模板格式，不经过嵌套序列化器，
+    关联表字段在同一条查询中通过JOIN取得。
+    """
+    values_fields = (
+        'id', 'location__code', 'product__name', 'product__spec', 'spec', 'unit',
+        'initial_quantity', 'total_in', 'total_out', 'quantity', 'unit_price', 'amount', 'is_active',
+    )
+
+    def to_representation(self, row):
+        return {
+            '序号': row['id'],
+            '位置': row['location__code'] or '未分配',
+            '品项': row['product__name'] or '',
+            '规格/型号': row['spec'] or row['product__spec'] or '',
+            '单位': row['unit'],
+            '期初库存': _decimal(row['initial_quantity']),
+            '累计入库': _decimal(row['total_in']),
+            '累计出库': _decimal(row['total_out']),
+            '库存': _decimal(row['quantity']),
+            '单价': _decimal(row['unit_price']),
+            '库存金额': _decimal(row['amount']),
+            '状态': '启用' if row['is_active'] else '禁用'
+        }
+
+
+class TransactionRowSerializer(serializers.BaseSerializer):
+    """出入库记录列表的只读快速路径，输出与TransactionSerializer相同的模板格式"""
+    values_fields = (
+        'id', 'transaction_date', 'transaction_code', 'product__name', 'product__spec', 'spec', 'unit',
+        'quantity', 'unit_price', 'amount', 'operator__name', 'operator__username',
+        'transaction_type', 'status', 'remark', 'created_time',
+    )
+    status_display = dict(Transaction.TRANSACTION_STATUS)
+
+    def to_representation(self, row):
+        transaction_date = row['transaction_date']
+        return {
+            '序号': row['id'],
+            '日期': transaction_date.strftime('%Y-%m-%d') if transaction_date else '',
+            '单据编号': row['transaction_code'],
+            '品项': row['product__name'] or '',
+            '规格/型号': row['spec'] or row['product__spec'] or '',
+            '单位': row['unit'],
+            '数量': _decimal(row['quantity']),
+            '单价': _decimal(row['unit_price']),
+            '金额': _decimal(row['amount']),
+            '经手人': row['operator__name'] or row['operator__username'] or '',
+            '类型': '入库' if row['transaction_type'] == 'IN' else '出库',
+            '状态': self.status_display.get(row['status'], row['status']),
+            '备注': row['remark'] or ''
+        }
@@ -0,0 +1,55 @@
+from datetime import date
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Transaction
+from apps.product.models import Product, Unit
+from apps.user.models import User
+from apps.warehouse.models import Warehouse
+
+
+class KeysetPaginationTests(TestCase):
+    """出入库记录列表的键集分页"""
+
+    def setUp(self):
+        warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        unit = Unit.objects.create(name='个', code='PCS')
+        product = Product.objects.create(name='商品', code='P001', unit=unit)
+        # 同一天的多条记录，分页键需要依靠created_time和id区分
+        for day in (1, 2, 2, 2, 3, 3, 4):
+            Transaction.objects.create(
+                warehouse=warehouse, product=product, unit='个', transaction_type='IN', quantity=1,
+                unit_price=1, status='pending', transaction_date=date(2026, 9, day)
+            )
+        self.expected = list(Transaction.objects.order_by('-transaction_date', '-created_time', '-id')
+                             .values_list('id', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='admin', level=3))
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_pages_cover_all_rows_in_order(self):
+        pages = []
+        url = reverse('transaction-list') + '?page_size=3'
+        while url:
+            page = self.get(url)
+            pages.append([row['序号'] for row in page['results']])
+            url = page['next']
+
+        self.assertEqual(pages, [self.expected[:3], self.expected[3:6], self.expected[6:]])
+
+        # 从最后一页向前翻页
+        page = self.get(reverse('transaction-list') + '?page_size=3')
+        last = self.get(self.get(page['next'])['next'])
+        previous = self.get(last['previous'])
+        self.assertEqual([row['序号'] for row in previous['results']], self.expected[3:6])
+        self.assertIsNotNone(previous['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('transaction-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
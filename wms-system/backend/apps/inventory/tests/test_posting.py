@@ -0,0 +1,70 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from apps.inventory.models import Inventory, Transaction
+from apps.inventory.posting import set_transactions_status
+from apps.product.models import Product, Unit
+from apps.warehouse.models import Warehouse, WarehouseArea, WarehouseLocation
+
+
+@override_settings(REPORT_UPDATES_IN_BACKGROUND=False)
+class StockPostingTests(TestCase):
+    """已完成的出入库记录过账到库存累计"""
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        area = WarehouseArea.objects.create(warehouse=self.warehouse, name='A区', code='A')
+        self.location = WarehouseLocation.objects.create(area=area, code='A1', name='A1')
+        unit = Unit.objects.create(name='个', code='PCS')
+        self.product = Product.objects.create(name='商品', code='P001', unit=unit)
+        self.inventory = Inventory.objects.create(
+            warehouse=self.warehouse, location=self.location, product=self.product, unit='个',
+            initial_quantity=10, quantity=10, unit_price=2
+        )
+
+    def create_transaction(self, transaction_type, quantity, status='completed', product=None):
+        return Transaction.objects.create(
+            warehouse=self.warehouse, product=product or self.product, unit='个',
+            transaction_type=transaction_type, quantity=quantity, unit_price=2, status=status,
+            transaction_date=date(2026, 9, 5)
+        )
+
+    def totals(self):
+        self.inventory.refresh_from_db()
+        return self.inventory.total_in, self.inventory.total_out, self.inventory.quantity, self.inventory.amount
+
+    def test_completed_transactions_posted(self):
+        self.create_transaction('IN', 5)
+        self.create_transaction('OUT', Decimal('2.5'))
+        self.create_transaction('IN', 100, status='pending')
+        self.assertEqual(self.totals(), (5, Decimal('2.5'), Decimal('12.5'), 25))
+
+    def test_changes_and_delete_reposted(self):
+        transaction = self.create_transaction('IN', 5)
+        transaction.quantity = 8
+        transaction.save()
+        self.assertEqual(self.totals(), (8, 0, 18, 36))
+
+        transaction.transaction_type = 'OUT'
+        transaction.save()
+        self.assertEqual(self.totals(), (0, 8, 2, 4))
+
+        transaction.delete()
+        self.assertEqual(self.totals(), (0, 0, 10, 20))
+
+    def test_status_changes_posted(self):
+        transactions = [self.create_transaction('IN', 3, status='pending') for _ in range(2)]
+        queryset = Transaction.objects.filter(id__in=[t.id for t in transactions])
+
+        self.assertEqual(set_transactions_status(queryset, 'completed'), 2)
+        self.assertEqual(self.totals(), (6, 0, 16, 32))
+        self.assertEqual(set_transactions_status(queryset, 'cancelled'), 2)
+        self.assertEqual(self.totals(), (0, 0, 10, 20))
+
+    def test_missing_inventory_created(self):
+        other = Product.objects.create(name='新商品', code='P002', unit=self.product.unit)
+        self.create_transaction('IN', 4, product=other)
+        inventory = Inventory.objects.get(warehouse=self.warehouse, product=other)
+        self.assertEqual((inventory.initial_quantity, inventory.total_in, inventory.quantity), (0, 4, 4))
@@ -0,0 +1,52 @@
+from datetime import date
+
+from django.test import TestCase, override_settings
+
+from apps.inventory import sequences
+from apps.inventory.models import CodeSequence, Transaction
+from apps.product.models import Product, Unit
+from apps.warehouse.models import Warehouse
+
+
+@override_settings(CODE_SEQUENCE_BLOCK_SIZE=5)
+class SequenceTests(TestCase):
+    """单据编号按号段分配"""
+
+    def setUp(self):
+        sequences.reset_cache()
+        self.addCleanup(sequences.reset_cache)
+        # 仓库编码与单据编号字段等长
+        self.warehouse = Warehouse.objects.create(name='测试仓库', code='W' * 50)
+        self.day = date(2026, 9, 5)
+
+    def counter(self, prefix='IN'):
+        return CodeSequence.objects.get(prefix=prefix, warehouse=self.warehouse, date=self.day).last_value
+
+    def test_code_fits_column(self):
+        code = sequences.next_code('OUT', self.warehouse, self.day)
+        self.assertEqual(code, f'OUT20260905-{self.warehouse.id}-0001')
+
+        unit = Unit.objects.create(name='个', code='PCS')
+        product = Product.objects.create(name='商品', code='P001', unit=unit)
+        transaction = Transaction.objects.create(
+            warehouse=self.warehouse, product=product, unit='个', transaction_type='OUT',
+            quantity=1, unit_price=1, status='pending', transaction_date=self.day
+        )
+        max_length = Transaction._meta.get_field('transaction_code').max_length
+        self.assertLessEqual(len(transaction.transaction_code), max_length)
+
+    def test_block_reused_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = sequences.next_codes('IN', self.warehouse, 2, self.day)
+        second = sequences.next_codes('IN', self.warehouse, 5, self.day)
+
+        values = [int(code.rsplit('-', 1)[1]) for code in first + second]
+        self.assertEqual(values, list(range(1, 8)))
+        # 第一次领取1-5，剩余3个用完后再领取6-10
+        self.assertEqual(self.counter(), 10)
+
+    def test_block_dropped_without_commit(self):
+        # 未提交的号段不进入缓存，下次重新领取
+        sequences.next_codes('IN', self.warehouse, 2, self.day)
+        codes = sequences.next_codes('IN', self.warehouse, 1, self.day)
+        self.assertEqual(codes, [f'IN20260905-{self.warehouse.id}-0006'])
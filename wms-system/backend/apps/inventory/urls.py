@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import InventoryViewSet
+from .views import InventoryViewSet, TransactionViewSet
 
 router = DefaultRouter()
 router.register('inventories', InventoryViewSet)
+router.register('transactions', TransactionViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -3,11 +3,19 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.http import FileResponse
 from django.db.models import Sum, F
+from django.utils.dateparse import parse_date
 from django.utils.timezone import now
 import pandas as pd
 import io
 from .models import Inventory, Transaction
-from .serializers import InventorySerializer, TransactionSerializer
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import SearchFilter
+from .pagination import KeysetPagination
+from .posting import set_transactions_status
+from .balances import stock_as_of
+from apps.warehouse.models import Warehouse
+from apps.warehouse.periods import PeriodClosedError
+from .serializers import InventorySerializer, TransactionSerializer, InventoryRowSerializer, TransactionRowSerializer
 from ..user.views import InventoryViewPermission
 
 class InventoryViewSet(viewsets.ModelViewSet):
@@ -19,6 +27,52 @@ class InventoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['id', 'created_time', 'quantity', 'amount']
     ordering = ['-created_time']
 
+    # 列表和详情只读，使用values()投影的快速路径
+    read_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.read_actions:
+            return queryset.values(*InventoryRowSerializer.values_fields)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in self.read_actions:
+            return InventoryRowSerializer
+        return super().get_serializer_class()
+
+    @action(detail=False, methods=['get'])
+    def as_of(self, request):
+        """
+        查询仓库在某天结束时的库存
+
+        参数: warehouse_id 仓库ID, date 日期（YYYY-MM-DD）
+        以该日期之前最近一个已结账月份的期末结存为起点，加上此后到该日期的出入库记录
+        """
+        warehouse_id = request.query_params.get('warehouse_id')
+        date_param = request.query_params.get('date')
+        if not warehouse_id or not date_param:
+            return Response({'error': '请提供仓库ID和日期'}, status=status.HTTP_400_BAD_REQUEST)
+        if not warehouse_id.isdigit():
+            return Response({'error': f'仓库ID格式错误: {warehouse_id}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            day = parse_date(date_param)
+        except ValueError:
+            day = None
+        if day is None:
+            return Response({'error': f'日期格式错误: {date_param}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Warehouse.objects.filter(id=warehouse_id).exists():
+            return Response({'error': '仓库不存在'}, status=status.HTTP_404_NOT_FOUND)
+
+        month, results = stock_as_of(warehouse_id, day)
+        return Response({
+            'warehouse_id': int(warehouse_id),
+            'date': day,
+            'base_month': month.strftime('%Y-%m') if month else None,
+            'count': len(results),
+            'results': results,
+        })
+
     @action(detail=False, methods=['get'])
     def export_inventory(self, request):
         """导出库存详情"""
@@ -99,10 +153,58 @@ class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [InventoryViewPermission]
+    # 出入库记录是数据量最大的表，使用键集分页，排序固定为分页键
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ['warehouse', 'product', 'transaction_type', 'status']
     search_fields = ['transaction_code', 'product__name', 'product__code']
-    ordering_fields = ['transaction_date', 'created_time', 'amount']
-    ordering = ['-transaction_date', '-created_time']
+    ordering = ['-transaction_date', '-created_time', '-id']
+
+    # 列表和详情只读，使用values()投影的快速路径
+    read_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.read_actions:
+            return queryset.values(*TransactionRowSerializer.values_fields)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in self.read_actions:
+            return TransactionRowSerializer
+        return super().get_serializer_class()
+
+    def handle_exception(self, exc):
+        # 修改已结账月份的出入库记录
+        if isinstance(exc, PeriodClosedError):
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().handle_exception(exc)
+
+    @action(detail=False, methods=['post'])
+    def batch_status(self, request):
+        """
+        批量修改出入库记录状态
+
+        参数: ids 记录ID列表, status 目标状态（completed/cancelled/pending）
+        状态修改、库存过账和报表更新在同一事务中完成
+        """
+        ids = request.data.get('ids')
+        new_status = request.data.get('status')
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': '请提供要修改的记录ID列表'}, status=status.HTTP_400_BAD_REQUEST)
+        if new_status not in dict(Transaction.TRANSACTION_STATUS):
+            return Response({'error': f'无效的状态: {new_status}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            updated = set_transactions_status(self.get_queryset().filter(id__in=ids), new_status)
+            return Response({'updated': updated})
+        except PeriodClosedError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(
+                {'error': f'批量修改状态失败: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
     @action(detail=False, methods=['get'])
     def export_transactions(self, request):
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class JobConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.job'
+    verbose_name = '后台任务'
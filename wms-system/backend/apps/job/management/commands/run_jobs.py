@@ -0,0 +1,45 @@
+"""
+启动后台任务worker
+
+用法:
+    python manage.py run_jobs --workers 2
+    python manage.py run_jobs --once        # 执行完当前等待中的任务后退出
+"""
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.job.runner import WorkerPool, fail_stale_jobs, purge_finished_jobs, run_pending
+
+
+class Command(BaseCommand):
+    help = '执行后台任务（导入、导出、备份、恢复、报表更新）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS, help='worker线程数')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='没有任务时的轮询间隔（秒）')
+        parser.add_argument('--once', action='store_true', help='执行完当前等待中的任务后退出')
+
+    def handle(self, *args, **options):
+        stale = fail_stale_jobs(settings.JOB_TIMEOUT)
+        purged = purge_finished_jobs(settings.JOB_RETENTION_DAYS)
+        if stale or purged:
+            self.stdout.write(f'超时任务{stale}个已标记失败，清理过期任务{purged}个')
+
+        if options['once']:
+            count = run_pending()
+            self.stdout.write(self.style.SUCCESS(f'执行任务{count}个'))
+            return
+
+        pool = WorkerPool(options['workers'], options['poll_interval'], job_timeout=settings.JOB_TIMEOUT)
+        stop = lambda *_: pool.stopping.set()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(f'任务worker已启动: {options["workers"]}个线程'))
+        while not pool.stopping.wait(1):
+            pass
+        self.stdout.write('正在等待执行中的任务完成...')
+        pool.stop()
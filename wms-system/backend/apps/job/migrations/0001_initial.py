@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=200, verbose_name='任务函数')),
+                ('name', models.CharField(blank=True, default='', max_length=100, verbose_name='任务名称')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='参数')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '执行中'), ('completed', '已完成'), ('failed', '失败'), ('cancelled', '已取消')], default='pending', max_length=20, verbose_name='状态')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='进度')),
+                ('message', models.CharField(blank=True, default='', max_length=200, verbose_name='进度说明')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='结果')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误信息')),
+                ('input_file', models.FileField(blank=True, upload_to='jobs/input/%Y%m%d', verbose_name='输入文件')),
+                ('result_file', models.FileField(blank=True, upload_to='jobs/result/%Y%m%d', verbose_name='结果文件')),
+                ('result_filename', models.CharField(blank=True, default='', max_length=200, verbose_name='结果文件名')),
+                ('worker', models.CharField(blank=True, default='', max_length=100, verbose_name='执行进程')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='创建者')),
+            ],
+            options={
+                'verbose_name': '后台任务',
+                'verbose_name_plural': '后台任务',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='job_status_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.core.files import File
+from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from apps.user.models import User
+
+
+class Job(models.Model):
+    """后台任务，由run_jobs命令启动的worker执行"""
+    STATUS_CHOICES = (
+        ('pending', '等待中'),
+        ('running', '执行中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+        ('cancelled', '已取消'),
+    )
+    FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+    task = models.CharField(_('任务函数'), max_length=200)
+    name = models.CharField(_('任务名称'), max_length=100, blank=True, default='')
+    params = models.JSONField(_('参数'), default=dict, blank=True)
+    status = models.CharField(_('状态'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress = models.PositiveSmallIntegerField(_('进度'), default=0)
+    message = models.CharField(_('进度说明'), max_length=200, blank=True, default='')
+    result = models.JSONField(_('结果'), null=True, blank=True)
+    error = models.TextField(_('错误信息'), blank=True, default='')
+    input_file = models.FileField(_('输入文件'), upload_to='jobs/input/%Y%m%d', blank=True)
+    result_file = models.FileField(_('结果文件'), upload_to='jobs/result/%Y%m%d', blank=True)
+    result_filename = models.CharField(_('结果文件名'), max_length=200, blank=True, default='')
+    creator = models.ForeignKey(User, verbose_name=_('创建者'), on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='jobs')
+    worker = models.CharField(_('执行进程'), max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    started_at = models.DateTimeField(_('开始时间'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('结束时间'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('后台任务')
+        verbose_name_plural = verbose_name
+        ordering = ['-created_at']
+        indexes = [
+            # worker按创建顺序领取等待中的任务
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name or self.task}({self.get_status_display()})"
+
+    def set_progress(self, progress, message=''):
+        """更新进度，只写进度字段，不覆盖其他进程对任务的修改"""
+        self.progress = progress
+        self.message = message
+        Job.objects.filter(pk=self.pk).update(progress=progress, message=message)
+
+    def save_result_file(self, filename, fileobj):
+        """保存结果文件，随任务完成一起写入数据库"""
+        self.result_filename = filename
+        self.result_file.save(filename, File(fileobj), save=False)
+
+
+# 删除任务时一并删除输入和结果文件
+@receiver(post_delete, sender=Job)
+def delete_job_files(sender, instance, **kwargs):
+    for field in (instance.input_file, instance.result_file):
+        if field:
+            field.delete(save=False)
@@ -0,0 +1,148 @@
+"""
+后台任务的执行
+
+worker按创建顺序领取等待中的任务，领取用带状态条件的UPDATE完成，
+多个进程、多个线程同时领取时每个任务只会被一个worker执行，不需要外部消息队列。
+worker运行期间定期把超时的任务标记为失败，其他worker进程异常退出后遗留的任务不会一直显示为执行中。
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CANDIDATES = 10
+# 检查超时任务的间隔（秒）
+REAP_INTERVAL = 60
+
+
+def worker_name(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def claim_job(worker):
+    """领取一个等待中的任务，没有可领取的任务时返回None"""
+    candidates = Job.objects.filter(status='pending').order_by('created_at', 'id')
+    for job_id in candidates.values_list('id', flat=True)[:CLAIM_CANDIDATES]:
+        claimed = Job.objects.filter(id=job_id, status='pending').update(
+            status='running', worker=worker, started_at=timezone.now()
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """执行任务并记录结果，任务函数抛出的异常记为失败"""
+    logger.info(f"开始执行任务: job_id={job.id}, task={job.task}, worker={job.worker}")
+    try:
+        func = import_string(job.task)
+        result = func(job)
+    except Exception as e:
+        logger.error(f"任务执行失败: job_id={job.id}, task={job.task}, error={str(e)}", exc_info=True)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+    job.status = 'completed'
+    job.progress = 100
+    job.result = result
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'result', 'result_file', 'result_filename', 'finished_at'])
+    logger.info(f"任务执行完成: job_id={job.id}, task={job.task}")
+    return job
+
+
+def run_pending(worker=None):
+    """依次执行当前等待中的任务，全部完成后返回执行的任务数"""
+    worker = worker or worker_name()
+    count = 0
+    while True:
+        job = claim_job(worker)
+        if job is None:
+            return count
+        run_job(job)
+        count += 1
+
+
+def fail_stale_jobs(seconds):
+    """把执行时间超过seconds的任务标记为失败（worker进程异常退出后遗留的任务）"""
+    deadline = timezone.now() - timedelta(seconds=seconds)
+    return Job.objects.filter(status='running', started_at__lt=deadline).update(
+        status='failed', error='任务执行超时或执行进程已退出', finished_at=timezone.now()
+    )
+
+
+def purge_finished_jobs(days):
+    """删除完成超过days天的任务及其文件"""
+    deadline = timezone.now() - timedelta(days=days)
+    count = 0
+    for job in Job.objects.filter(status__in=Job.FINISHED_STATUSES, finished_at__lt=deadline).iterator():
+        job.delete()
+        count += 1
+    return count
+
+
+class WorkerPool:
+    """在当前进程中启动若干线程轮询执行任务"""
+
+    def __init__(self, workers=1, poll_interval=2.0, job_timeout=None, reap_interval=REAP_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.reap_interval = reap_interval
+        self.stopping = threading.Event()
+        self.threads = []
+        self._reap_lock = threading.Lock()
+        self._next_reap = 0
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._loop, args=(worker_name(index),), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """不再领取新任务，等待执行中的任务完成"""
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+
+    def reap_stale_jobs(self):
+        """每隔reap_interval秒把超时任务标记为失败，多个线程中只有一个执行"""
+        if self.job_timeout is None:
+            return 0
+        with self._reap_lock:
+            now = time.monotonic()
+            if now < self._next_reap:
+                return 0
+            self._next_reap = now + self.reap_interval
+        stale = fail_stale_jobs(self.job_timeout)
+        if stale:
+            logger.warning(f"超时任务已标记失败: {stale}个")
+        return stale
+
+    def _loop(self, worker):
+        while not self.stopping.is_set():
+            close_old_connections()
+            try:
+                self.reap_stale_jobs()
+                job = claim_job(worker)
+                if job is not None:
+                    run_job(job)
+                    continue
+            except Exception as e:
+                logger.error(f"任务worker异常: worker={worker}, error={str(e)}", exc_info=True)
+            self.stopping.wait(self.poll_interval)
+        close_old_connections()
@@ -0,0 +1,26 @@
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    creator_name = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'name', 'task', 'status', 'status_display', 'progress', 'message',
+            'result', 'error', 'result_filename', 'download_url', 'creator_name',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+    def get_creator_name(self, obj):
+        return obj.creator.username if obj.creator else ''
+
+    def get_download_url(self, obj):
+        if not obj.result_file:
+            return None
+        return reverse('job-download', args=[obj.id], request=self.context.get('request'))
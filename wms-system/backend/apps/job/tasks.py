@@ -0,0 +1,42 @@
+"""
+后台任务的提交
+
+任务函数是普通的模块级函数，接收Job实例并返回可JSON序列化的结果：
+
+    def export_excel(job):
+        job.set_progress(50, '生成文件')
+        job.save_result_file(filename, fileobj)
+        return {'rows': 100}
+
+    job = enqueue(export_excel, {'warehouse_id': 1}, user=request.user, name='导出库存')
+
+任务在调用方的事务中创建，事务回滚时任务一起撤销，提交后worker才能看到。
+"""
+from django.core.files.base import ContentFile
+
+from .models import Job
+
+
+def task_path(func):
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def enqueue(func, params=None, user=None, name='', input_file=None, input_filename=None):
+    """
+    提交后台任务，返回Job
+
+    参数:
+        input_file: 任务需要的输入文件，上传文件对象或bytes
+    """
+    job = Job(
+        task=task_path(func),
+        name=name,
+        params=params or {},
+        creator=user if user is not None and user.is_authenticated else None,
+    )
+    if input_file is not None:
+        if isinstance(input_file, bytes):
+            input_file = ContentFile(input_file)
+        job.input_file.save(input_filename or getattr(input_file, 'name', None) or 'input', input_file, save=False)
+    job.save()
+    return job
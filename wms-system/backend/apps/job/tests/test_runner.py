@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.job.models import Job
+from apps.job.runner import WorkerPool
+
+
+class ReapStaleJobsTests(TestCase):
+    """worker运行期间定期把超时任务标记为失败"""
+
+    def create_job(self, started_ago):
+        return Job.objects.create(task='apps.job.tasks.enqueue', status='running',
+                                  started_at=timezone.now() - started_ago)
+
+    def test_stale_jobs_failed_once_per_interval(self):
+        stale = self.create_job(timedelta(hours=2))
+        running = self.create_job(timedelta(minutes=5))
+        pool = WorkerPool(job_timeout=3600, reap_interval=60)
+
+        self.assertEqual(pool.reap_stale_jobs(), 1)
+        stale.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((stale.status, running.status), ('failed', 'running'))
+
+        # 间隔内不再查询
+        self.create_job(timedelta(hours=2))
+        with self.assertNumQueries(0):
+            self.assertEqual(pool.reap_stale_jobs(), 0)
+
+    def test_disabled_without_timeout(self):
+        self.create_job(timedelta(hours=2))
+        with self.assertNumQueries(0):
+            self.assertEqual(WorkerPool().reap_stale_jobs(), 0)
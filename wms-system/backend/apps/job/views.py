@@ -0,0 +1,63 @@
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from django.http import FileResponse
+from django.utils import timezone
+from .models import Job
+from .serializers import JobSerializer
+
+
+def job_accepted(request, job):
+    """任务已提交的响应，客户端通过url查询进度"""
+    return Response(
+        {
+            'message': '任务已提交，正在后台执行',
+            'job_id': job.id,
+            'status': job.status,
+            'url': reverse('job-detail', args=[job.id], request=request),
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+def run_in_background(request):
+    """请求是否要求在后台执行（?async=1）"""
+    return request.query_params.get('async', '').lower() in ('1', 'true', 'yes')
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """后台任务进度查询，普通用户只能看到自己提交的任务"""
+    queryset = Job.objects.select_related('creator')
+    serializer_class = JobSerializer
+    filterset_fields = ['status', 'task']
+    ordering_fields = ['id', 'created_at', 'finished_at']
+    ordering = ['-created_at']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.level < 3 and not self.request.user.is_superuser:
+            queryset = queryset.filter(creator=self.request.user)
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """下载任务的结果文件"""
+        job = self.get_object()
+        if job.status != 'completed' or not job.result_file:
+            return Response({'error': '任务没有可下载的结果文件'}, status=status.HTTP_404_NOT_FOUND)
+        response = FileResponse(job.result_file.open('rb'), as_attachment=True, filename=job.result_filename)
+        response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+        return response
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """取消等待中的任务，已开始执行的任务不能取消"""
+        job = self.get_object()
+        cancelled = Job.objects.filter(id=job.id, status='pending').update(
+            status='cancelled', finished_at=timezone.now()
+        )
+        if not cancelled:
+            return Response({'error': '只能取消等待中的任务'}, status=status.HTTP_400_BAD_REQUEST)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
@@ -70,9 +70,23 @@ class Order(models.Model):
         verbose_name_plural = verbose_name
         ordering = ['-created_time']
 
+    # 自动分配订单编号时使用的前缀
+    ORDER_CODE_PREFIXES = {
+        'inbound': 'RK',
+        'outbound': 'CK',
+        'transfer': 'DB',
+        'return': 'TH',
+    }
+
     def __str__(self):
         return f"{self.order_code} - {self.get_order_type_display()}"
 
+    def save(self, *args, **kwargs):
+        if not self.order_code:
+            from apps.inventory.sequences import next_code
+            self.order_code = next_code(self.ORDER_CODE_PREFIXES.get(self.order_type, 'DD'), self.warehouse)
+        super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     """订单明细模型"""
@@ -19,4 +19,6 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
-        read_only_fields = ['created_at', 'updated_at'] 
\ No newline at end of file
+        read_only_fields = ['created_at', 'updated_at']
+        # 不填写时由保存时自动分配
+        extra_kwargs = {'order_code': {'required': False}} 
\ No newline at end of file
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
 
@@ -33,6 +35,10 @@ class Unit(models.Model):
         verbose_name = _('计量单位')
         verbose_name_plural = verbose_name
         ordering = ['code']
+        indexes = [
+            # 导入时按名称解析单位
+            models.Index(fields=['name'], name='unit_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -89,6 +95,24 @@ class Product(models.Model):
         verbose_name = _('商品')
         verbose_name_plural = verbose_name
         ordering = ['code']
+        indexes = [
+            # 导入、恢复时按(名称, 规格)解析商品
+            models.Index(fields=['name', 'spec'], name='product_name_spec_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.name}({self.code})" 
\ No newline at end of file
+        return f"{self.name}({self.code})" 
+
+
+# 商品、单位变化后使解析缓存失效
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_resolver(sender, **kwargs):
+    # resolvers模块依赖本模块的模型，在函数内导入避免循环引用
+    from .resolvers import product_resolver
+    product_resolver.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Unit)
+def invalidate_unit_resolver(sender, **kwargs):
+    from .resolvers import unit_resolver
+    unit_resolver.invalidate()
@@ -0,0 +1,157 @@
+"""
+主数据解析缓存
+
+导入、恢复等批量写入按自然键查找商品、单位、库位的主键：
+- 每类主数据一个进程内的LRU缓存，按规范化后的自然键缓存主键，容量为settings.RESOLVER_CACHE_SIZE
+- resolve_many()先查缓存，未命中的自然键用一次IN查询补齐
+- 模型的post_save/post_delete信号调用invalidate()，递增共享缓存中的版本号，
+  各进程下次解析时发现版本变化即清空本地缓存
+- settings.CACHES为进程内缓存（LocMem）时其他进程收不到失效通知，RESOLVER_CACHE_SIZE默认为0，
+  不缓存，每次解析都查询数据库；此时显式开启会在启动时记录警告
+- 在事务中查到或新建的主键等事务提交后才写入缓存，事务回滚不会留下不存在的主键
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Product, Unit
+
+logger = logging.getLogger(__name__)
+
+
+def check_cache_backend():
+    """启动时检查：开启了解析缓存但CACHES为进程内缓存时记录警告"""
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.RESOLVER_CACHE_SIZE > 0 and backend in settings.LOCAL_CACHE_BACKENDS:
+        logger.warning(
+            f"解析缓存已开启(RESOLVER_CACHE_SIZE={settings.RESOLVER_CACHE_SIZE})，但缓存后端{backend}只在本进程内有效，"
+            f"多进程部署时其他进程中已删除或改名的商品、单位、库位不会失效，请配置共享缓存或设置RESOLVER_CACHE_SIZE=0"
+        )
+
+
+class Resolver:
+    """按自然键解析主键的LRU缓存，子类实现normalize和fetch"""
+
+    def __init__(self, name):
+        self.name = name
+        self._version_key = f'resolver:{name}:version'
+        self._version = None
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def normalize(self, key):
+        return key
+
+    def fetch(self, keys):
+        """一次查询返回[(自然键, 主键), ...]，同一自然键有多条记录时按主键从小到大返回"""
+        raise NotImplementedError
+
+    def resolve_many(self, keys):
+        """返回{自然键: 主键}，不存在的自然键不在结果中"""
+        normalized = {key: self.normalize(key) for key in keys}
+        if settings.RESOLVER_CACHE_SIZE <= 0:
+            ids = {}
+            for key, pk in self.fetch(set(normalized.values())):
+                ids.setdefault(key, pk)
+            return {key: ids[value] for key, value in normalized.items() if value in ids}
+
+        ids = {}
+        with self._lock:
+            self._check_version()
+            version = self._version
+            for key in set(normalized.values()):
+                pk = self._ids.get(key)
+                if pk is not None:
+                    self._ids.move_to_end(key)
+                    ids[key] = pk
+
+        missing = set(normalized.values()) - ids.keys()
+        if missing:
+            found = {}
+            for key, pk in self.fetch(missing):
+                found.setdefault(key, pk)
+            ids.update(found)
+            self._add(found, version)
+
+        return {key: ids[value] for key, value in normalized.items() if value in ids}
+
+    def resolve(self, key):
+        return self.resolve_many([key]).get(key)
+
+    def add(self, mapping):
+        """写入新建记录的{自然键: 主键}"""
+        if settings.RESOLVER_CACHE_SIZE <= 0:
+            return
+        with self._lock:
+            self._check_version()
+            version = self._version
+        self._add({self.normalize(key): pk for key, pk in mapping.items()}, version)
+
+    def invalidate(self):
+        """递增版本号，所有进程的本地缓存失效"""
+        with self._lock:
+            self._ids.clear()
+            # 尚未写入的查询结果作废
+            self._version = None
+        try:
+            cache.incr(self._version_key)
+        except ValueError:
+            cache.set(self._version_key, 2, None)
+
+    def _check_version(self):
+        version = cache.get(self._version_key)
+        if version is None:
+            version = 1
+            cache.add(self._version_key, version, None)
+        if version != self._version:
+            self._ids.clear()
+            self._version = version
+
+    def _add(self, mapping, version):
+        if mapping:
+            # 在事务中时等提交后再写入；期间版本变化说明数据已被修改，不再写入
+            transaction.on_commit(lambda: self._store(mapping, version))
+
+    def _store(self, mapping, version):
+        with self._lock:
+            if version != self._version:
+                return
+            for key, pk in mapping.items():
+                self._ids[key] = pk
+                self._ids.move_to_end(key)
+            while len(self._ids) > settings.RESOLVER_CACHE_SIZE:
+                self._ids.popitem(last=False)
+
+
+class ProductResolver(Resolver):
+    """按(名称, 规格)解析商品"""
+
+    def normalize(self, key):
+        name, spec = key
+        return (name or '').strip(), (spec or '').strip()
+
+    def fetch(self, keys):
+        rows = Product.objects.filter(name__in={name for name, _ in keys}) \
+            .order_by('id').values_list('name', 'spec', 'id')
+        for name, spec, pk in rows:
+            key = (name, spec or '')
+            if key in keys:
+                yield key, pk
+
+
+class UnitResolver(Resolver):
+    """按名称解析计量单位"""
+
+    def normalize(self, key):
+        return (key or '').strip()
+
+    def fetch(self, keys):
+        return Unit.objects.filter(name__in=keys).order_by('id').values_list('name', 'id')
+
+
+product_resolver = ProductResolver('product')
+unit_resolver = UnitResolver('unit')
@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class WarehouseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.warehouse'
-    verbose_name = '仓库管理' 
\ No newline at end of file
+    verbose_name = '仓库管理'
+
+    def ready(self):
+        # 注册数据库连接建立时的配置
+        from utils import db  # noqa: F401
@@ -0,0 +1,190 @@
+"""
+仓库数据流式备份
+
+备份内容按查询集分批读取、逐条编码后直接写入响应，内存占用与仓库数据量无关。
+支持两种格式：
+- json: 与原备份文件结构相同的单个JSON对象 {warehouse, inventory, transactions, reports, backup_time}
+- ndjson: 每行一个 {"type": ..., "data": ...} 对象，便于逐行处理
+两种格式都可以选择gzip压缩。
+"""
+import json
+import logging
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from apps.inventory.models import Inventory, Transaction
+from .models import Report
+from .serializers import WarehouseSerializer, ReportSerializer
+
+logger = logging.getLogger(__name__)
+
+# 分批从数据库读取的行数
+CHUNK_SIZE = 2000
+# 响应分块的目标大小
+BUFFER_SIZE = 64 * 1024
+
+BACKUP_FORMATS = ('json', 'ndjson')
+
+
+def backup_filename(warehouse, backup_format='json', compress=False):
+    filename = f'warehouse_{warehouse.code}_backup_{timezone.now().strftime("%Y%m%d_%H%M%S")}.{backup_format}'
+    return filename + '.gz' if compress else filename
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+
+
+def _product_unit(product):
+    return product.unit.name if product.unit_id else '个'
+
+
+def inventory_record(item):
+    """库存记录的备份格式"""
+    return {
+        'location': item.location.code if item.location else None,
+        'product': item.product.name,
+        'specification': item.product.spec or '',
+        'unit': _product_unit(item.product),
+        'quantity': str(item.quantity or 0),
+        'unit_price': str(item.unit_price or 0),
+        'total_value': str(item.amount or 0),
+        'initial_quantity': str(item.initial_quantity or 0),
+        'total_in': str(item.total_in or 0),
+        'total_out': str(item.total_out or 0),
+    }
+
+
+def transaction_record(item):
+    """出入库记录的备份格式"""
+    return {
+        'code': item.transaction_code,
+        'date': item.transaction_date.isoformat() if item.transaction_date else None,
+        'type': item.transaction_type,
+        'product': item.product.name,
+        'specification': item.product.spec or '',
+        'unit': _product_unit(item.product),
+        'quantity': str(item.quantity or 0),
+        'unit_price': str(item.unit_price or 0),
+        'total_value': str(item.amount or 0),
+        'handler': item.operator.username if item.operator else '',
+    }
+
+
+class WarehouseBackup:
+    """
+    单个仓库的备份数据
+
+    用法:
+        backup = WarehouseBackup(warehouse)
+        for chunk in backup.stream('json', compress=True):
+            ...
+    """
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+        self.counts = {'inventory': 0, 'transactions': 0, 'reports': 0}
+
+    def sections(self):
+        """按备份文件中的顺序返回各部分的(名称, 记录迭代器)"""
+        return [
+            ('inventory', self._inventory()),
+            ('transactions', self._transactions()),
+            ('reports', self._reports()),
+        ]
+
+    def inventory_queryset(self):
+        return Inventory.objects.filter(warehouse=self.warehouse, is_active=True) \
+            .select_related('product__unit', 'location').order_by('id')
+
+    def transaction_queryset(self):
+        return Transaction.objects.filter(warehouse=self.warehouse, status='completed') \
+            .select_related('product__unit', 'operator').order_by('id')
+
+    def report_queryset(self):
+        return Report.objects.filter(warehouse=self.warehouse) \
+            .select_related('creator', 'warehouse').order_by('id')
+
+    def _inventory(self):
+        for item in self.inventory_queryset().iterator(chunk_size=CHUNK_SIZE):
+            self.counts['inventory'] += 1
+            yield inventory_record(item)
+
+    def _transactions(self):
+        for item in self.transaction_queryset().iterator(chunk_size=CHUNK_SIZE):
+            self.counts['transactions'] += 1
+            yield transaction_record(item)
+
+    def _reports(self):
+        # 报表明细在序列化时按报表分别读取，每次只保留一份报表
+        for report in self.report_queryset().iterator(chunk_size=100):
+            self.counts['reports'] += 1
+            yield ReportSerializer(report).data
+
+    def iter_json(self):
+        """逐段输出与原备份文件结构相同的JSON文档"""
+        yield '{"warehouse": ' + _dumps(WarehouseSerializer(self.warehouse).data)
+        for name, records in self.sections():
+            yield f', "{name}": ['
+            for index, record in enumerate(records):
+                yield (', ' if index else '') + _dumps(record)
+            yield ']'
+        yield ', "backup_time": ' + _dumps(timezone.now().isoformat()) + '}'
+
+    def iter_ndjson(self):
+        """每行输出一条 {"type": ..., "data": ...} 记录"""
+        yield _dumps({'type': 'warehouse', 'data': WarehouseSerializer(self.warehouse).data}) + '\n'
+        for name, records in self.sections():
+            for record in records:
+                yield _dumps({'type': name, 'data': record}) + '\n'
+        yield _dumps({'type': 'backup_time', 'data': timezone.now().isoformat()}) + '\n'
+
+    def stream(self, backup_format='json', compress=False):
+        """返回编码后的字节块迭代器"""
+        pieces = self.iter_ndjson() if backup_format == 'ndjson' else self.iter_json()
+        chunks = _buffered(pieces)
+        if compress:
+            chunks = _gzip(chunks)
+        return self._logged(chunks)
+
+    def _logged(self, chunks):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        except Exception as e:
+            logger.error(f"备份数据生成失败: warehouse_id={self.warehouse.id}, error={str(e)}", exc_info=True)
+            raise
+        logger.info(
+            f"备份数据生成成功: warehouse_id={self.warehouse.id}, 库存={self.counts['inventory']}条, "
+            f"交易={self.counts['transactions']}条, 报表={self.counts['reports']}条, size={size}字节"
+        )
+
+
+def _buffered(pieces):
+    """把零散的文本片段合并成固定大小左右的字节块"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        data = piece.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzip(chunks):
+    """流式gzip压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,78 @@
+"""
+仓库仪表盘统计
+
+统计结果整体缓存，仓库、库区、库位变化时递增缓存版本号使旧缓存失效。
+"""
+import logging
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Warehouse, WarehouseArea, WarehouseLocation
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_VERSION_KEY = 'warehouse:dashboard:version'
+# 兜底过期时间，覆盖绕过信号的批量更新
+DASHBOARD_TIMEOUT = 300
+
+
+def _dashboard_key():
+    version = cache.get(DASHBOARD_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(DASHBOARD_VERSION_KEY, version, None)
+    return f'warehouse:dashboard:v{version}'
+
+
+def invalidate_dashboard():
+    """递增缓存版本号，下次请求重新统计"""
+    try:
+        cache.incr(DASHBOARD_VERSION_KEY)
+    except ValueError:
+        cache.set(DASHBOARD_VERSION_KEY, 2, None)
+
+
+def build_dashboard_data():
+    """统计仪表盘数据，查询次数与仓库数量无关"""
+    location_totals = WarehouseLocation.objects.filter(is_active=True).aggregate(
+        total=Count('id'),
+        used=Count('id', filter=Q(is_empty=False)),
+    )
+    location_count = location_totals['total']
+    used_location_count = location_totals['used']
+    location_usage = round(used_location_count / location_count * 100, 2) if location_count > 0 else 0
+
+    # 每个仓库的库位数量
+    warehouses = Warehouse.objects.filter(is_active=True).annotate(
+        location_count=Count('areas__locations', filter=Q(areas__locations__is_active=True))
+    ).values('name', 'location_count').order_by('id')
+    warehouse_stats = list(warehouses)
+
+    # 库区类型分布
+    area_types = WarehouseArea.objects.filter(is_active=True).values('area_type') \
+        .annotate(count=Count('id')).order_by('area_type')
+    area_stats = [
+        {'name': area_type['area_type'] or '未分类', 'count': area_type['count']}
+        for area_type in area_types
+    ]
+
+    return {
+        'warehouse_count': len(warehouse_stats),
+        'area_count': sum(area['count'] for area in area_stats),
+        'location_count': location_count,
+        'location_usage': location_usage,
+        'warehouse_stats': warehouse_stats,
+        'area_stats': area_stats,
+    }
+
+
+def get_dashboard_data():
+    """读取仪表盘数据，缓存未命中时重新统计"""
+    key = _dashboard_key()
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard_data()
+        cache.set(key, data, DASHBOARD_TIMEOUT)
+        logger.info(f"仪表盘数据已重新统计: {key}")
+    return data
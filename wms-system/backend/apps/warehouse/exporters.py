@@ -0,0 +1,133 @@
+"""
+流式Excel导出
+
+使用openpyxl的write_only工作簿逐行写入临时文件，再通过FileResponse分块发送，
+导出过程中不在内存中保留完整的数据列表、DataFrame或工作簿对象树。
+"""
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+
+from apps.inventory.models import Inventory
+from . import ledger
+from .models import MonthlyLedgerLine
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# 分批从数据库读取的行数
+CHUNK_SIZE = 2000
+
+
+def _cell_value(value):
+    """单元格只能写入标量，其他类型转为文本"""
+    if isinstance(value, (dict, list, tuple, set)):
+        return str(value)
+    return value
+
+
+def _header_row(worksheet, columns):
+    """生成带格式的标题行"""
+    cells = []
+    for column in columns:
+        cell = WriteOnlyCell(worksheet, value=column)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        cell.fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
+        cells.append(cell)
+    return cells
+
+
+def write_workbook(fileobj, sheets):
+    """
+    把多个sheet逐行写入文件
+
+    参数:
+        fileobj: 可写的文件对象
+        sheets: (sheet名称, 列名列表, 行迭代器)组成的列表，行可以是列表或以列名为键的字典
+    """
+    workbook = Workbook(write_only=True)
+    for sheet_name, columns, rows in sheets:
+        worksheet = workbook.create_sheet(title=sheet_name)
+        worksheet.append(_header_row(worksheet, columns))
+        for row in rows:
+            if isinstance(row, dict):
+                row = [row.get(column) for column in columns]
+            worksheet.append([_cell_value(value) for value in row])
+    workbook.save(fileobj)
+
+
+def xlsx_response(sheets, filename):
+    """生成Excel文件并以流的方式返回"""
+    excel_file = tempfile.TemporaryFile()
+    write_workbook(excel_file, sheets)
+    excel_file.seek(0)
+
+    response = FileResponse(excel_file, content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+    return response
+
+
+def report_sheet(report, record_type, sheet_name):
+    """
+    报表某一类明细的sheet定义，行数据直接从明细表分批读取
+
+    标准列之外的自定义字段（如备注）追加在最后
+    """
+    columns = list(ledger.RECORD_COLUMNS[record_type])
+    lines = MonthlyLedgerLine.objects.filter(report=report, record_type=record_type)
+
+    extra_values = lines.exclude(extra={}).values_list('extra', flat=True)
+    for extra in extra_values.iterator(chunk_size=CHUNK_SIZE):
+        for key in extra:
+            if key not in columns:
+                columns.append(key)
+
+    rows = (
+        ledger.line_to_record(line)
+        for line in lines.order_by('position', 'id').iterator(chunk_size=CHUNK_SIZE)
+    )
+    return sheet_name, columns, rows
+
+
+INVENTORY_LIST_COLUMNS = ['序号', '位置', '品项', '规格/型号', '单位', '期初库存', '累计入库', '累计出库', '库存', '单价', '金额']
+
+
+def inventory_list_queryset(warehouse_id=None):
+    """库存清单导出的记录，未指定仓库时导出全部启用的库存"""
+    query_params = {'is_active': True}
+    if warehouse_id:
+        query_params['warehouse_id'] = warehouse_id
+    return Inventory.objects.filter(**query_params).order_by('location__code', 'product__code')
+
+
+def inventory_list_filename():
+    return f'inventory_list_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+
+
+def inventory_list_sheet(inventory_records):
+    """库存清单sheet定义，累计入库/出库由库存过账维护，直接读取库存记录"""
+
+    def rows():
+        records = inventory_records.select_related('location', 'product', 'product__unit')
+        for index, record in enumerate(records.iterator(chunk_size=CHUNK_SIZE), 1):
+            unit_price = record.product.price or 0
+            yield [
+                index,
+                record.location.code if record.location else '未分配',
+                record.product.name,
+                record.product.spec or '',
+                record.product.unit.name if record.product.unit else '',
+                record.initial_quantity,
+                record.total_in,
+                record.total_out,
+                record.quantity,
+                unit_price,
+                unit_price * record.quantity,
+            ]
+
+    return 'Sheet1', INVENTORY_LIST_COLUMNS, rows()
@@ -0,0 +1,331 @@
+"""
+仓库Excel批量导入引擎
+
+按“解析 -> 批量解析主数据 -> 批量写入”三个阶段处理导入文件：
+- 所有行先在内存中解析校验，错误按行收集，不访问数据库
+- 商品、单位、库位通过解析缓存获取主键（见apps.product.resolvers），未命中的各用一次IN查询，缺失的用bulk_create补建
+- 出入库记录和库存记录在同一个事务中分批bulk_create
+- 报表只在导入结束后统一刷新一次
+"""
+import logging
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+from django.db import transaction
+
+from apps.inventory.models import Inventory, Transaction
+from apps.inventory.sequences import next_codes
+from apps.product.models import Product, Unit
+from apps.product.resolvers import product_resolver, unit_resolver
+from .models import Warehouse, WarehouseArea, WarehouseLocation
+from .dashboard import invalidate_dashboard
+from .reporting import apply_transaction_deltas
+from .resolvers import location_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def _clean_text(value):
+    """单元格文本清洗，空单元格返回空字符串"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    return str(value).strip()
+
+
+def _to_decimal(value):
+    """单元格数值转换，空单元格按0处理"""
+    if value is None or (isinstance(value, float) and pd.isna(value)) or value == '':
+        return Decimal('0')
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'数值格式错误: {value}')
+
+
+def code_prefix(prefix, random_length=6):
+    """生成批量编码前缀，时间戳加随机串避免并发导入撞号，长度为len(prefix) + 12 + random_length"""
+    return f"{prefix}{datetime.now().strftime('%y%m%d%H%M%S')}{uuid.uuid4().hex[:random_length].upper()}"
+
+
+def resolve_units(unit_names, batch_size=1000):
+    """按名称批量获取单位ID，缺失的统一补建"""
+    units = unit_resolver.resolve_many(unit_names)
+
+    missing = [name for name in unit_names if name not in units]
+    if missing:
+        # Unit.code最长20个字符：前缀16个字符加4位序号
+        prefix = code_prefix('U', 3)
+        codes = [f"{prefix}{i:04d}" for i in range(len(missing))]
+        Unit.objects.bulk_create(
+            [Unit(name=name, code=code) for name, code in zip(missing, codes)],
+            batch_size=batch_size
+        )
+        created = dict(Unit.objects.filter(code__in=codes).values_list('name', 'id'))
+        unit_resolver.add(created)
+        units.update(created)
+    return units
+
+
+def resolve_products(product_keys, batch_size=1000):
+    """
+    按(品项, 规格)批量获取商品ID，缺失的统一补建
+
+    参数:
+        product_keys: {(品项, 规格): 单位名称}
+    """
+    products = product_resolver.resolve_many(product_keys)
+
+    missing = [key for key in product_keys if key not in products]
+    if missing:
+        units = resolve_units({product_keys[key] for key in missing if product_keys[key]}, batch_size)
+        # Product.code最长50个字符：前缀19个字符加5位序号
+        prefix = code_prefix('P')
+        new_products = []
+        for i, (name, spec) in enumerate(missing):
+            new_products.append(Product(
+                name=name,
+                spec=spec,
+                unit_id=units.get(product_keys[(name, spec)]),
+                code=f"{prefix}{i:05d}",
+                is_active=True
+            ))
+        Product.objects.bulk_create(new_products, batch_size=batch_size)
+        created = {
+            (name, spec or ''): pk
+            for name, spec, pk in Product.objects.filter(code__startswith=prefix).values_list('name', 'spec', 'id')
+        }
+        product_resolver.add(created)
+        products.update(created)
+    return products
+
+
+def resolve_locations(warehouse, location_codes, batch_size=1000):
+    """按编码批量获取仓库的库位ID，缺失的统一建在默认库区下"""
+    location_codes = {code for code in location_codes if code}
+    if not location_codes:
+        return {}
+
+    locations = {
+        code: pk
+        for (_, code), pk in location_resolver.resolve_many({(warehouse.id, code) for code in location_codes}).items()
+    }
+
+    missing = [code for code in location_codes if code not in locations]
+    if missing:
+        default_area, _ = WarehouseArea.objects.get_or_create(
+            warehouse=warehouse,
+            code='DEFAULT',
+            defaults={'name': '默认库区', 'is_active': True}
+        )
+        WarehouseLocation.objects.bulk_create(
+            [
+                WarehouseLocation(area=default_area, code=code, name=f"库位{code}", is_active=True)
+                for code in missing
+            ],
+            batch_size=batch_size
+        )
+        created = dict(WarehouseLocation.objects.filter(area=default_area, code__in=missing).values_list('code', 'id'))
+        location_resolver.add({(warehouse.id, code): pk for code, pk in created.items()})
+        locations.update(created)
+    return locations
+
+
+class WarehouseExcelImporter:
+    """
+    将月度报表模板（入库/出库/库存三个sheet）导入为一个新仓库
+
+    用法:
+        importer = WarehouseExcelImporter(operator, sheet_names, transaction_columns, inventory_columns)
+        importer.parse(excel_data)
+        warehouse = importer.run(warehouse_name, warehouse_code)
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, operator, sheet_names, transaction_columns, inventory_columns, batch_size=None):
+        self.operator = operator
+        self.sheet_names = sheet_names
+        self.transaction_columns = transaction_columns
+        self.inventory_columns = inventory_columns
+        self.batch_size = batch_size or self.BATCH_SIZE
+
+        self.transaction_rows = {'inbound': [], 'outbound': []}
+        self.inventory_rows = []
+        self.errors = []
+        self.success_count = {'outbound': 0, 'inbound': 0, 'inventory': 0}
+
+    def missing_sheets(self, excel_data):
+        """返回文件中缺少的sheet名称"""
+        return set(self.sheet_names.values()) - set(excel_data.keys())
+
+    def result(self, warehouse):
+        """导入结果，接口响应和后台任务使用相同的结构"""
+        result = {
+            'message': f'Excel导入完成，成功创建仓库 "{warehouse.name}"',
+            'warehouse_id': warehouse.id,
+            'warehouse_name': warehouse.name,
+            'warehouse_code': warehouse.code,
+            'success_count': {
+                '出库记录': self.success_count['outbound'],
+                '入库记录': self.success_count['inbound'],
+                '库存记录': self.success_count['inventory']
+            }
+        }
+        if self.errors:
+            result['errors'] = self.errors
+        return result
+
+    # ------------------------------------------------------------------
+    # 解析阶段：只处理内存数据
+    # ------------------------------------------------------------------
+    def parse(self, excel_data):
+        """解析三个sheet的数据，收集行级错误"""
+        self._parse_transactions(excel_data[self.sheet_names['outbound']], 'outbound', '出库')
+        self._parse_transactions(excel_data[self.sheet_names['inbound']], 'inbound', '入库')
+        self._parse_inventory(excel_data[self.sheet_names['inventory']])
+
+    def _parse_transactions(self, df, record_type, label):
+        if not all(col in df.columns for col in self.transaction_columns):
+            missing_cols = set(self.transaction_columns) - set(df.columns)
+            self.errors.append(f'{label}明细缺少必要的列: {", ".join(missing_cols)}')
+            return
+
+        for index, row in enumerate(df.to_dict('records')):
+            try:
+                product_name = _clean_text(row['品项'])
+                if not product_name:
+                    continue
+                transaction_date = pd.to_datetime(row['日期'])
+                if pd.isna(transaction_date):
+                    raise ValueError('日期为空')
+                self.transaction_rows[record_type].append({
+                    'product_key': (product_name, _clean_text(row['规格/型号'])),
+                    'unit': _clean_text(row['单位']),
+                    'quantity': _to_decimal(row['数量']),
+                    'unit_price': _to_decimal(row['单价']),
+                    'transaction_date': transaction_date.date(),
+                    'row_number': index + 2,
+                })
+            except Exception as e:
+                self.errors.append(f"{label}明细第 {index + 2} 行处理失败: {str(e)}")
+
+    def _parse_inventory(self, df):
+        if not all(col in df.columns for col in self.inventory_columns):
+            missing_cols = set(self.inventory_columns) - set(df.columns)
+            self.errors.append(f'库存明细缺少必要的列: {", ".join(missing_cols)}')
+            return
+
+        for index, row in enumerate(df.to_dict('records')):
+            try:
+                product_name = _clean_text(row['品项'])
+                if not product_name:
+                    continue
+                self.inventory_rows.append({
+                    'product_key': (product_name, _clean_text(row['规格/型号'])),
+                    'unit': _clean_text(row['单位']),
+                    'location_code': _clean_text(row['位置']),
+                    'initial_quantity': _to_decimal(row['期初库存']),
+                    'total_in': _to_decimal(row['累计入库']),
+                    'total_out': _to_decimal(row['累计出库']),
+                    'quantity': _to_decimal(row['库存']),
+                    'unit_price': _to_decimal(row['单价']),
+                    'row_number': index + 2,
+                })
+            except Exception as e:
+                self.errors.append(f"库存明细第 {index + 2} 行处理失败: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # 写入阶段：一个事务内完成
+    # ------------------------------------------------------------------
+    def run(self, warehouse_name, warehouse_code):
+        """创建仓库并批量写入解析好的数据，返回新仓库"""
+        with transaction.atomic():
+            warehouse = Warehouse.objects.create(
+                name=warehouse_name,
+                code=warehouse_code,
+                is_active=True
+            )
+
+            product_keys = {}
+            for row in self.transaction_rows['inbound'] + self.transaction_rows['outbound'] + self.inventory_rows:
+                product_keys.setdefault(row['product_key'], row['unit'])
+            products = resolve_products(product_keys, self.batch_size)
+            locations = resolve_locations(
+                warehouse, {row['location_code'] for row in self.inventory_rows}, self.batch_size
+            )
+
+            transactions = self._create_transactions(warehouse, products)
+            self._create_inventory(warehouse, products, locations)
+
+            # bulk_create不触发post_save，报表差额在全部写入后统一应用一次
+            apply_transaction_deltas(transactions)
+
+        # 批量新建的库位同样不触发信号，导入完成后统一刷新仪表盘
+        invalidate_dashboard()
+
+        logger.info(
+            f"Excel导入完成: warehouse_id={warehouse.id}, "
+            f"入库={self.success_count['inbound']}, 出库={self.success_count['outbound']}, "
+            f"库存={self.success_count['inventory']}, 错误={len(self.errors)}"
+        )
+        return warehouse
+
+    def _create_transactions(self, warehouse, products):
+        """批量写入出入库记录"""
+        transactions = []
+        for record_type, transaction_type in (('outbound', 'OUT'), ('inbound', 'IN')):
+            rows = self.transaction_rows[record_type]
+            # 编号整批领取，一次UPDATE
+            codes = next_codes(transaction_type, warehouse, len(rows)) if rows else []
+            for code, row in zip(codes, rows):
+                transactions.append(Transaction(
+                    transaction_code=code,
+                    transaction_date=row['transaction_date'],
+                    warehouse=warehouse,
+                    product_id=products[row['product_key']],
+                    spec=row['product_key'][1],
+                    unit=row['unit'] or '个',
+                    transaction_type=transaction_type,
+                    quantity=row['quantity'],
+                    unit_price=row['unit_price'],
+                    amount=row['quantity'] * row['unit_price'],
+                    operator=self.operator,
+                    status='completed',
+                ))
+            self.success_count[record_type] = len(self.transaction_rows[record_type])
+
+        Transaction.objects.bulk_create(transactions, batch_size=self.batch_size)
+        return transactions
+
+    def _create_inventory(self, warehouse, products, locations):
+        """批量写入库存记录，同一库位同一商品只保留第一行"""
+        inventories = []
+        seen = set()
+        for row in self.inventory_rows:
+            product_id = products[row['product_key']]
+            location_id = locations.get(row['location_code'])
+            key = (location_id, product_id)
+            if key in seen:
+                self.errors.append(f"库存明细第 {row['row_number']} 行处理失败: 库位与品项重复")
+                continue
+            seen.add(key)
+
+            inventories.append(Inventory(
+                warehouse=warehouse,
+                product_id=product_id,
+                location_id=location_id,
+                spec=row['product_key'][1],
+                unit=row['unit'] or '个',
+                initial_quantity=row['initial_quantity'],
+                total_in=row['total_in'],
+                total_out=row['total_out'],
+                quantity=row['quantity'],
+                unit_price=row['unit_price'],
+                amount=row['quantity'] * row['unit_price'],
+                is_active=True,
+            ))
+
+        Inventory.objects.bulk_create(inventories, batch_size=self.batch_size)
+        self.success_count['inventory'] = len(inventories)
+        return inventories
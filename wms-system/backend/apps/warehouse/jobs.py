@@ -0,0 +1,109 @@
+"""
+仓库相关的后台任务
+
+导入、导出、备份、恢复和报表更新在接口中带?async=1时提交为后台任务，
+由run_jobs命令启动的worker执行，结果文件通过任务下载接口获取。
+"""
+import logging
+import tempfile
+
+import pandas as pd
+from django.utils.dateparse import parse_date
+
+from apps.job.tasks import enqueue
+from .backup import WarehouseBackup, backup_filename
+from .exporters import write_workbook, inventory_list_queryset, inventory_list_filename, inventory_list_sheet
+from .importers import WarehouseExcelImporter
+from .models import Warehouse
+from .reporting import ReportDeltas
+from .restore import WarehouseRestorer, load_backup
+
+logger = logging.getLogger(__name__)
+
+
+def import_excel(job):
+    """导入Excel文件创建新仓库，参数与WarehouseExcelImporter相同"""
+    params = job.params
+    with job.input_file.open('rb') as excel_file:
+        excel_data = pd.read_excel(excel_file, sheet_name=None)
+
+    importer = WarehouseExcelImporter(
+        operator=job.creator,
+        sheet_names=params['sheet_names'],
+        transaction_columns=params['transaction_columns'],
+        inventory_columns=params['inventory_columns']
+    )
+    missing_sheets = importer.missing_sheets(excel_data)
+    if missing_sheets:
+        raise ValueError(f'Excel文件缺少必要的sheet: {", ".join(missing_sheets)}')
+
+    job.set_progress(30, '解析数据')
+    importer.parse(excel_data)
+    job.set_progress(60, '写入数据')
+    warehouse = importer.run(params['warehouse_name'], params['warehouse_code'])
+    return importer.result(warehouse)
+
+
+def export_excel(job):
+    """导出库存清单Excel"""
+    inventory_records = inventory_list_queryset(job.params.get('warehouse_id'))
+    with tempfile.TemporaryFile() as excel_file:
+        write_workbook(excel_file, [inventory_list_sheet(inventory_records)])
+        excel_file.seek(0)
+        job.save_result_file(inventory_list_filename(), excel_file)
+    return {'message': '导出完成'}
+
+
+def backup(job):
+    """备份仓库数据到文件"""
+    params = job.params
+    warehouse = Warehouse.objects.get(id=params['warehouse_id'])
+    compress = params.get('compress', False)
+    backup_format = params.get('backup_format', 'json')
+
+    with tempfile.TemporaryFile() as backup_file:
+        for chunk in WarehouseBackup(warehouse).stream(backup_format, compress=compress):
+            backup_file.write(chunk)
+        backup_file.seek(0)
+        job.save_result_file(backup_filename(warehouse, backup_format, compress), backup_file)
+    return {'message': '备份完成', 'warehouse_id': warehouse.id}
+
+
+def restore(job):
+    """从上传的备份文件恢复仓库数据"""
+    warehouse = Warehouse.objects.get(id=job.params['warehouse_id'])
+    with job.input_file.open('rb') as backup_file:
+        backup_data = load_backup(backup_file)
+
+    restorer = WarehouseRestorer(warehouse)
+    job.set_progress(20, '校验备份数据')
+    restorer.parse(backup_data)
+    job.set_progress(50, '写入数据')
+    counts = restorer.run()
+    return {'message': '恢复备份成功', 'counts': counts}
+
+
+def apply_report_postings(job):
+    """把出入库记录变化的差额应用到月度报表"""
+    deltas = ReportDeltas()
+    for posting, sign in job.params['postings']:
+        deltas.add(dict(posting, month=parse_date(posting['month'])), sign)
+    return {'reports': deltas.apply()}
+
+
+def enqueue_report_postings(entries):
+    """
+    提交报表更新任务
+
+    参数:
+        entries: [(transaction_posting结果, 符号)]，空的posting会被忽略
+    """
+    postings = [
+        # 数量和单价以字符串保存，避免经过浮点数
+        [dict(posting, month=posting['month'].isoformat(),
+              quantity=str(posting['quantity']), unit_price=str(posting['unit_price'])), sign]
+        for posting, sign in entries if posting
+    ]
+    if postings:
+        return enqueue(apply_report_postings, {'postings': postings}, name='报表更新')
+    return None
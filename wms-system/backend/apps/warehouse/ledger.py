@@ -0,0 +1,260 @@
+"""
+月度报表明细存取
+
+报表内容按行存放在MonthlyLedgerLine中，对外仍然提供与原Report.data相同的结构：
+    {'inbound': [...], 'outbound': [...], 'inventory': [...]}
+单条记录的增删改只操作对应的一行，不再读写整份报表。
+已结账月份的报表不能通过这里修改，抛出PeriodClosedError。
+"""
+import uuid
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Report, MonthlyLedgerLine
+from .periods import ensure_month_open
+
+RECORD_TYPES = ('inbound', 'outbound', 'inventory')
+
+# 报表字段与明细行字段的对应关系
+TEXT_FIELDS = {
+    '品项': 'product',
+    '规格/型号': 'spec',
+    '单位': 'unit',
+    '位置': 'location',
+    '日期': 'record_date',
+    '经手人': 'handler',
+}
+
+NUMBER_FIELDS = {
+    '数量': 'quantity',
+    '期初库存': 'opening_quantity',
+    '累计入库': 'in_quantity',
+    '累计出库': 'out_quantity',
+    '库存': 'closing_quantity',
+    '单价': 'unit_price',
+}
+
+# 出入库明细与库存明细的金额列名不同，统一存放在amount中
+AMOUNT_FIELDS = {
+    'inbound': '金额',
+    'outbound': '金额',
+    'inventory': '库存金额',
+}
+
+# 各类明细输出时的列顺序
+RECORD_COLUMNS = {
+    'inbound': ['序号', '日期', '品项', '规格/型号', '单位', '数量', '单价', '金额', '经手人'],
+    'outbound': ['序号', '日期', '品项', '规格/型号', '单位', '数量', '单价', '金额', '经手人'],
+    'inventory': ['序号', '位置', '品项', '规格/型号', '单位', '期初库存', '累计入库', '累计出库', '库存', '单价', '库存金额'],
+}
+
+FIELD_NAMES = {**TEXT_FIELDS, **NUMBER_FIELDS}
+
+# 报表上由明细统计出的汇总字段
+SUMMARY_FIELDS = ('inbound_count', 'outbound_count', 'inventory_count', 'inventory_amount')
+
+
+def month_start(value):
+    """返回所在月份的第一天，兼容YYYY-MM-DD字符串"""
+    if isinstance(value, str):
+        value = parse_date(value)
+    return value.replace(day=1)
+
+
+def _parse_number(value):
+    """解析数值，空值返回0，无法解析返回None"""
+    if value is None or value == '':
+        return Decimal('0')
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    if not number.is_finite():
+        return None
+    return number
+
+
+def _format_number(value):
+    """整数输出为int，其余输出为float，保持与原报表数据一致"""
+    if value is None:
+        return 0
+    if value == value.to_integral_value():
+        return int(value)
+    return float(value)
+
+
+def line_fields(record_type, record):
+    """把一条报表记录转换为明细行字段"""
+    amount_key = AMOUNT_FIELDS[record_type]
+    fields = {'extra': {}}
+    for key, value in record.items():
+        if key == 'id':
+            continue
+        if key in TEXT_FIELDS:
+            field = TEXT_FIELDS[key]
+            text = '' if value is None else str(value).strip()
+            max_length = MonthlyLedgerLine._meta.get_field(field).max_length
+            if len(text) > max_length:
+                # 超长的原值保留在extra中，输出时优先使用extra
+                fields['extra'][key] = value
+                text = text[:max_length]
+            fields[field] = text
+        elif key in NUMBER_FIELDS or key == amount_key:
+            number = _parse_number(value)
+            if number is None:
+                # 无法解析的原始值保留在extra中，输出时原样返回
+                fields['extra'][key] = value
+            else:
+                fields[NUMBER_FIELDS.get(key, 'amount')] = number
+        else:
+            fields['extra'][key] = value
+    return fields
+
+
+def line_to_record(line):
+    """把明细行还原为报表记录"""
+    record = {}
+    extra = line.extra or {}
+    for key in RECORD_COLUMNS[line.record_type]:
+        if key in extra:
+            record[key] = extra[key]
+        elif key == AMOUNT_FIELDS[line.record_type]:
+            record[key] = _format_number(line.amount)
+        elif key in TEXT_FIELDS:
+            record[key] = getattr(line, TEXT_FIELDS[key])
+        elif key in NUMBER_FIELDS:
+            record[key] = _format_number(getattr(line, NUMBER_FIELDS[key]))
+    for key, value in extra.items():
+        record.setdefault(key, value)
+    record['id'] = line.record_id
+    return record
+
+
+def build_line(report, record_type, record, position):
+    """根据报表记录构建（未保存的）明细行"""
+    return MonthlyLedgerLine(
+        report=report,
+        warehouse_id=report.warehouse_id,
+        month=month_start(report.report_date),
+        record_type=record_type,
+        record_id=str(record.get('id') or uuid.uuid4()),
+        position=position,
+        **line_fields(record_type, record)
+    )
+
+
+def report_summaries(report_ids):
+    """按明细统计报表的汇总字段"""
+    summaries = {
+        report_id: {'inbound_count': 0, 'outbound_count': 0, 'inventory_count': 0, 'inventory_amount': Decimal('0')}
+        for report_id in report_ids
+    }
+    totals = MonthlyLedgerLine.objects.filter(report_id__in=report_ids).order_by() \
+        .values('report_id', 'record_type').annotate(count=Count('id'), amount=Sum('amount'))
+    for row in totals:
+        summary = summaries[row['report_id']]
+        summary[f"{row['record_type']}_count"] = row['count']
+        if row['record_type'] == 'inventory':
+            summary['inventory_amount'] = row['amount'] or Decimal('0')
+    return summaries
+
+
+def touch_reports(report_ids):
+    """明细变化后刷新报表的更新时间和汇总字段"""
+    report_ids = list(report_ids)
+    if not report_ids:
+        return
+    now = timezone.now()
+    reports = [
+        Report(id=report_id, updated_at=now, **summary)
+        for report_id, summary in report_summaries(report_ids).items()
+    ]
+    Report.objects.bulk_update(reports, ['updated_at', *SUMMARY_FIELDS])
+
+
+def report_etag(report):
+    """
+    报表明细的强ETag
+
+    明细的任何变化都经touch_reports刷新updated_at，报表重建时id也会变化，
+    因此只需读取id和updated_at，不需要加载明细
+    """
+    return f'"report-{report.id}-{report.updated_at:%Y%m%d%H%M%S%f}"'
+
+
+def ensure_report_open(report):
+    ensure_month_open(report.warehouse_id, month_start(report.report_date))
+
+
+def get_report_data(report, record_types=RECORD_TYPES):
+    """读取报表的全部明细，返回与原Report.data相同的结构"""
+    data = {record_type: [] for record_type in record_types}
+    lines = MonthlyLedgerLine.objects.filter(report=report, record_type__in=record_types) \
+        .order_by('record_type', 'position', 'id')
+    for line in lines.iterator():
+        data[line.record_type].append(line_to_record(line))
+    return data
+
+
+def get_month_data(warehouse, year, month):
+    """读取仓库某月报表的全部明细，报表不存在或没有明细时返回空字典"""
+    report = Report.objects.filter(warehouse=warehouse, report_date=date(year, month, 1)).order_by('id').first()
+    if report is None or not report.lines.exists():
+        return {}
+    return get_report_data(report)
+
+
+def replace_report_data(report, data):
+    """用新的报表数据整体替换报表明细"""
+    ensure_report_open(report)
+    MonthlyLedgerLine.objects.filter(report=report).delete()
+    lines = []
+    for record_type in RECORD_TYPES:
+        for position, record in enumerate((data or {}).get(record_type) or []):
+            lines.append(build_line(report, record_type, record, position))
+    MonthlyLedgerLine.objects.bulk_create(lines, batch_size=1000)
+    touch_reports([report.id])
+    report.refresh_from_db(fields=['updated_at', *SUMMARY_FIELDS])
+    return lines
+
+
+def add_record(report, record_type, record):
+    """追加一条报表记录，返回记录ID"""
+    ensure_report_open(report)
+    position = MonthlyLedgerLine.objects.filter(report=report, record_type=record_type) \
+        .aggregate(max_position=Max('position'))['max_position']
+    line = build_line(report, record_type, record, 0 if position is None else position + 1)
+    line.save()
+    touch_reports([report.id])
+    return line.record_id
+
+
+def update_record(report, record_type, record_id, record):
+    """更新一条报表记录，返回是否找到该记录"""
+    ensure_report_open(report)
+    fields = line_fields(record_type, record)
+    # 未出现在新数据中的列恢复为默认值，与整条替换的语义保持一致
+    for key, field in FIELD_NAMES.items():
+        fields.setdefault(field, '' if key in TEXT_FIELDS else Decimal('0'))
+    fields.setdefault('amount', Decimal('0'))
+    updated = MonthlyLedgerLine.objects.filter(
+        report=report, record_type=record_type, record_id=record_id
+    ).update(**fields)
+    if updated:
+        touch_reports([report.id])
+    return bool(updated)
+
+
+def delete_record(report, record_type, record_id):
+    """删除一条报表记录，返回是否找到该记录"""
+    ensure_report_open(report)
+    deleted, _ = MonthlyLedgerLine.objects.filter(
+        report=report, record_type=record_type, record_id=record_id
+    ).delete()
+    if deleted:
+        touch_reports([report.id])
+    return bool(deleted)
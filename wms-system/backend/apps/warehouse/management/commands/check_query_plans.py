@@ -0,0 +1,44 @@
+"""
+热点查询执行计划检查
+
+检查逻辑见apps.warehouse.query_plans，任何一个查询退化为全表扫描时命令以非零状态退出，
+可放在部署前的检查步骤中；manage.py test中的test_query_plans执行同样的检查。
+
+用法:
+    python manage.py check_query_plans
+    python manage.py check_query_plans --warehouse-id 3 --verbose
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.warehouse.models import Warehouse
+from apps.warehouse.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = '检查热点查询的执行计划，发现全表扫描时报错'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warehouse-id', type=int, help='用于生成查询的仓库ID，默认取第一个仓库')
+        parser.add_argument('--verbose', action='store_true', help='输出完整执行计划')
+
+    def handle(self, *args, **options):
+        warehouse_id = options['warehouse_id'] or Warehouse.objects.values_list('id', flat=True).first() or 1
+        try:
+            results = check_query_plans(warehouse_id)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        failures = []
+        for name, scans, plan in results:
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'[全表扫描] {name}'))
+                for line in scans:
+                    self.stdout.write(f'    {line}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'[OK] {name}'))
+            if options['verbose']:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'{len(failures)}个查询使用了全表扫描: {", ".join(failures)}')
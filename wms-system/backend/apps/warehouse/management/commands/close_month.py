@@ -0,0 +1,64 @@
+"""
+月结：写入各仓库指定月份的期末结存，并结转为下月报表的期初库存
+
+用法:
+    python manage.py close_month                     # 结转上个月，全部启用的仓库
+    python manage.py close_month --month 2025-03 --processes 8
+    python manage.py close_month --warehouse-id 3 --force
+    python manage.py close_month --month 2025-03 --warehouse-id 3 --reopen   # 反结账
+
+已完成的仓库自动跳过，中断后重新执行即可从未完成的仓库继续。
+"""
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.warehouse.month_close import close_month, previous_month, reopen_warehouse
+from apps.warehouse.periods import PeriodClosedError
+
+
+class Command(BaseCommand):
+    help = '月结：结转期末库存并创建下月报表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='结账月份，格式YYYY-MM，默认为上个月')
+        parser.add_argument('--warehouse-id', type=int, action='append', dest='warehouse_ids',
+                            help='只处理指定仓库，可重复')
+        parser.add_argument('--processes', type=int, default=settings.MONTH_CLOSE_PROCESSES, help='并行进程数')
+        parser.add_argument('--force', action='store_true', help='已结账的仓库先反结账再重新结账')
+        parser.add_argument('--reopen', action='store_true', help='反结账指定仓库的月份，需要--warehouse-id')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = datetime.strptime(f"{options['month']}-01", '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('月份格式错误，应为YYYY-MM')
+        else:
+            month = previous_month()
+
+        if options['reopen']:
+            if not options['warehouse_ids']:
+                raise CommandError('反结账需要指定--warehouse-id')
+            for warehouse_id in options['warehouse_ids']:
+                try:
+                    reopen_warehouse(warehouse_id, month)
+                except PeriodClosedError as e:
+                    raise CommandError(f'仓库{warehouse_id}反结账失败: {e}')
+                self.stdout.write(self.style.SUCCESS(f'仓库{warehouse_id} {month:%Y-%m}已反结账'))
+            return
+
+        started = time.perf_counter()
+        summary = {}
+        for result in close_month(month, options['warehouse_ids'], options['processes'], options['force']):
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+            line = (
+                f"仓库{result['warehouse_id']:>6}  {result['status']:<10}{result['duration']:>8.2f}s  "
+                f"{result['counts'] or ''} {result['message']}"
+            )
+            self.stdout.write(self.style.ERROR(line) if result['status'] == 'failed' else line)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"{month:%Y-%m}月结完成，总耗时{elapsed:.2f}s: {summary}"))
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0004_report_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyLedgerLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='月份')),
+                ('record_type', models.CharField(choices=[('inbound', '入库'), ('outbound', '出库'), ('inventory', '库存')], max_length=20, verbose_name='记录类型')),
+                ('record_id', models.CharField(max_length=64, verbose_name='记录标识')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='排序')),
+                ('product', models.CharField(blank=True, default='', max_length=200, verbose_name='品项')),
+                ('spec', models.CharField(blank=True, default='', max_length=200, verbose_name='规格/型号')),
+                ('unit', models.CharField(blank=True, default='', max_length=50, verbose_name='单位')),
+                ('location', models.CharField(blank=True, default='', max_length=100, verbose_name='位置')),
+                ('record_date', models.CharField(blank=True, default='', max_length=30, verbose_name='日期')),
+                ('handler', models.CharField(blank=True, default='', max_length=100, verbose_name='经手人')),
+                ('quantity', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='数量')),
+                ('opening_quantity', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='期初库存')),
+                ('in_quantity', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='累计入库')),
+                ('out_quantity', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='累计出库')),
+                ('closing_quantity', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='库存')),
+                ('unit_price', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='单价')),
+                ('amount', models.DecimalField(decimal_places=4, default=0, max_digits=18, verbose_name='金额')),
+                ('extra', models.JSONField(blank=True, default=dict, verbose_name='其他字段')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='warehouse.report', verbose_name='报表')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_lines', to='warehouse.warehouse', verbose_name='仓库')),
+            ],
+            options={
+                'verbose_name': '月度报表明细',
+                'verbose_name_plural': '月度报表明细',
+                'ordering': ['report', 'record_type', 'position', 'id'],
+                'indexes': [models.Index(fields=['warehouse', 'month', 'product', 'spec'], name='ledger_wh_month_product_idx'), models.Index(fields=['report', 'record_type', 'position'], name='ledger_report_type_pos_idx'), models.Index(fields=['report', 'record_id'], name='ledger_report_record_idx')],
+            },
+        ),
+    ]
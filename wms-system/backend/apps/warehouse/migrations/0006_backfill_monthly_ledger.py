@@ -0,0 +1,150 @@
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations
+
+TEXT_FIELDS = {
+    '品项': 'product',
+    '规格/型号': 'spec',
+    '单位': 'unit',
+    '位置': 'location',
+    '日期': 'record_date',
+    '经手人': 'handler',
+}
+
+NUMBER_FIELDS = {
+    '数量': 'quantity',
+    '期初库存': 'opening_quantity',
+    '累计入库': 'in_quantity',
+    '累计出库': 'out_quantity',
+    '库存': 'closing_quantity',
+    '单价': 'unit_price',
+}
+
+AMOUNT_FIELDS = {
+    'inbound': '金额',
+    'outbound': '金额',
+    'inventory': '库存金额',
+}
+
+RECORD_COLUMNS = {
+    'inbound': ['序号', '日期', '品项', '规格/型号', '单位', '数量', '单价', '金额', '经手人'],
+    'outbound': ['序号', '日期', '品项', '规格/型号', '单位', '数量', '单价', '金额', '经手人'],
+    'inventory': ['序号', '位置', '品项', '规格/型号', '单位', '期初库存', '累计入库', '累计出库', '库存', '单价', '库存金额'],
+}
+
+
+def _parse_number(value):
+    if value is None or value == '':
+        return Decimal('0')
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    return number if number.is_finite() else None
+
+
+def _format_number(value):
+    if value is None:
+        return 0
+    if value == value.to_integral_value():
+        return int(value)
+    return float(value)
+
+
+def _line_fields(record_type, record, max_lengths):
+    fields = {'extra': {}}
+    for key, value in record.items():
+        if key == 'id':
+            continue
+        if key in TEXT_FIELDS:
+            field = TEXT_FIELDS[key]
+            text = '' if value is None else str(value).strip()
+            if len(text) > max_lengths[field]:
+                # 超长的原值保留在extra中，还原报表时优先使用extra
+                fields['extra'][key] = value
+                text = text[:max_lengths[field]]
+            fields[field] = text
+        elif key in NUMBER_FIELDS or key == AMOUNT_FIELDS[record_type]:
+            number = _parse_number(value)
+            if number is None:
+                fields['extra'][key] = value
+            else:
+                fields[NUMBER_FIELDS.get(key, 'amount')] = number
+        else:
+            fields['extra'][key] = value
+    return fields
+
+
+def backfill_ledger(apps, schema_editor):
+    """把已有报表的Report.data拆分写入月度报表明细表"""
+    Report = apps.get_model('warehouse', 'Report')
+    MonthlyLedgerLine = apps.get_model('warehouse', 'MonthlyLedgerLine')
+    max_lengths = {field: MonthlyLedgerLine._meta.get_field(field).max_length for field in TEXT_FIELDS.values()}
+
+    for report in Report.objects.all().iterator():
+        data = report.data if isinstance(report.data, dict) else {}
+        lines = []
+        for record_type in AMOUNT_FIELDS:
+            records = data.get(record_type) or []
+            for position, record in enumerate(records):
+                if not isinstance(record, dict):
+                    continue
+                lines.append(MonthlyLedgerLine(
+                    report_id=report.id,
+                    warehouse_id=report.warehouse_id,
+                    month=report.report_date.replace(day=1),
+                    record_type=record_type,
+                    record_id=str(record.get('id') or uuid.uuid4()),
+                    position=position,
+                    **_line_fields(record_type, record, max_lengths)
+                ))
+        MonthlyLedgerLine.objects.bulk_create(lines, batch_size=1000)
+
+
+def _line_record(line):
+    record = {}
+    extra = line.extra or {}
+    for key in RECORD_COLUMNS[line.record_type]:
+        if key in extra:
+            record[key] = extra[key]
+        elif key == AMOUNT_FIELDS[line.record_type]:
+            record[key] = _format_number(line.amount)
+        elif key in TEXT_FIELDS:
+            record[key] = getattr(line, TEXT_FIELDS[key])
+        elif key in NUMBER_FIELDS:
+            record[key] = _format_number(getattr(line, NUMBER_FIELDS[key]))
+    for key, value in extra.items():
+        record.setdefault(key, value)
+    record['id'] = line.record_id
+    return record
+
+
+def restore_report_data(apps, schema_editor):
+    """把明细写回Report.data后删除明细，迁移之后对报表的修改不会丢失"""
+    Report = apps.get_model('warehouse', 'Report')
+    MonthlyLedgerLine = apps.get_model('warehouse', 'MonthlyLedgerLine')
+
+    for report in Report.objects.all().iterator():
+        data = dict(report.data) if isinstance(report.data, dict) else {}
+        records = {}
+        lines = MonthlyLedgerLine.objects.filter(report_id=report.id).order_by('record_type', 'position', 'id')
+        for line in lines.iterator():
+            records.setdefault(line.record_type, []).append(_line_record(line))
+        for record_type in AMOUNT_FIELDS:
+            if record_type in records or record_type in data:
+                data[record_type] = records.get(record_type, [])
+        Report.objects.filter(id=report.id).update(data=data)
+
+    MonthlyLedgerLine.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0005_monthlyledgerline'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ledger, restore_report_data),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0006_backfill_monthly_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['warehouse', 'report_date'], name='report_wh_date_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:06
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_report_summary(apps, schema_editor):
+    """按已有明细计算报表汇总字段"""
+    Report = apps.get_model('warehouse', 'Report')
+    MonthlyLedgerLine = apps.get_model('warehouse', 'MonthlyLedgerLine')
+
+    summaries = {}
+    totals = MonthlyLedgerLine.objects.order_by().values('report_id', 'record_type') \
+        .annotate(count=Count('id'), amount=Sum('amount'))
+    for row in totals:
+        summary = summaries.setdefault(row['report_id'], {})
+        summary[f"{row['record_type']}_count"] = row['count']
+        if row['record_type'] == 'inventory':
+            summary['inventory_amount'] = row['amount'] or 0
+    for report_id, summary in summaries.items():
+        Report.objects.filter(id=report_id).update(**summary)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_report_warehouse_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='inbound_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='入库明细数'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='inventory_amount',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=18, verbose_name='库存金额合计'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='inventory_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='库存明细数'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='outbound_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='出库明细数'),
+        ),
+        migrations.RunPython(fill_report_summary, migrations.RunPython.noop),
+    ]
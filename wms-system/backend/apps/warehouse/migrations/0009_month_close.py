@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0008_report_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='结账月份')),
+                ('status', models.CharField(choices=[('running', '执行中'), ('completed', '已完成'), ('skipped', '已跳过'), ('failed', '失败')], default='running', max_length=20, verbose_name='状态')),
+                ('counts', models.JSONField(blank=True, default=dict, verbose_name='处理数量')),
+                ('message', models.TextField(blank=True, default='', verbose_name='说明')),
+                ('duration', models.FloatField(default=0, verbose_name='耗时（秒）')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('next_report', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='warehouse.report', verbose_name='下月报表')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_closes', to='warehouse.warehouse', verbose_name='仓库')),
+            ],
+            options={
+                'verbose_name': '月结记录',
+                'verbose_name_plural': '月结记录',
+                'ordering': ['-month', 'warehouse'],
+                'unique_together': {('warehouse', 'month')},
+            },
+        ),
+    ]
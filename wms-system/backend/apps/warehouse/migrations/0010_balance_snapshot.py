@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0009_month_close'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='monthclose',
+            name='status',
+            field=models.CharField(choices=[('running', '执行中'), ('completed', '已完成'), ('skipped', '已跳过'), ('failed', '失败'), ('reopened', '已反结账')], default='running', max_length=20, verbose_name='状态'),
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='月份')),
+                ('product', models.CharField(max_length=200, verbose_name='品项')),
+                ('spec', models.CharField(blank=True, default='', max_length=200, verbose_name='规格/型号')),
+                ('unit', models.CharField(blank=True, default='', max_length=50, verbose_name='单位')),
+                ('location', models.CharField(blank=True, default='', max_length=100, verbose_name='位置')),
+                ('unit_price', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='单价')),
+                ('closing_quantity', models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='期末库存')),
+                ('amount', models.DecimalField(decimal_places=4, default=0, max_digits=18, verbose_name='期末金额')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='warehouse.warehouse', verbose_name='仓库')),
+            ],
+            options={
+                'verbose_name': '期末结存',
+                'verbose_name_plural': '期末结存',
+                'ordering': ['warehouse', 'month', 'id'],
+                'unique_together': {('warehouse', 'month', 'product', 'spec')},
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from apps.user.models import User
 
@@ -95,11 +97,136 @@ class Report(models.Model):
     created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
     updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
     creator = models.ForeignKey(User, verbose_name=_('创建者'), on_delete=models.SET_NULL, null=True, related_name="created_reports")
+    # 报表明细汇总，明细变化时由ledger.touch_reports刷新
+    inbound_count = models.PositiveIntegerField(_('入库明细数'), default=0)
+    outbound_count = models.PositiveIntegerField(_('出库明细数'), default=0)
+    inventory_count = models.PositiveIntegerField(_('库存明细数'), default=0)
+    inventory_amount = models.DecimalField(_('库存金额合计'), max_digits=18, decimal_places=4, default=0)
     
     class Meta:
         verbose_name = _('报表')
         verbose_name_plural = verbose_name
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['warehouse', 'report_date'], name='report_wh_date_idx'),
+        ]
         
     def __str__(self):
-        return f"{self.title} - {self.warehouse.name} - {self.report_date}" 
\ No newline at end of file
+        return f"{self.title} - {self.warehouse.name} - {self.report_date}" 
+
+class MonthlyLedgerLine(models.Model):
+    """月度报表明细行，每行对应报表中的一条入库、出库或库存记录"""
+    RECORD_TYPES = (
+        ('inbound', '入库'),
+        ('outbound', '出库'),
+        ('inventory', '库存'),
+    )
+
+    report = models.ForeignKey(Report, verbose_name=_('报表'), on_delete=models.CASCADE, related_name='lines')
+    warehouse = models.ForeignKey(Warehouse, verbose_name=_('仓库'), on_delete=models.CASCADE,
+                                  related_name='ledger_lines')
+    month = models.DateField(_('月份'))
+    record_type = models.CharField(_('记录类型'), max_length=20, choices=RECORD_TYPES)
+    record_id = models.CharField(_('记录标识'), max_length=64)
+    position = models.PositiveIntegerField(_('排序'), default=0)
+    product = models.CharField(_('品项'), max_length=200, blank=True, default='')
+    spec = models.CharField(_('规格/型号'), max_length=200, blank=True, default='')
+    unit = models.CharField(_('单位'), max_length=50, blank=True, default='')
+    location = models.CharField(_('位置'), max_length=100, blank=True, default='')
+    record_date = models.CharField(_('日期'), max_length=30, blank=True, default='')
+    handler = models.CharField(_('经手人'), max_length=100, blank=True, default='')
+    quantity = models.DecimalField(_('数量'), max_digits=16, decimal_places=4, default=0)
+    opening_quantity = models.DecimalField(_('期初库存'), max_digits=16, decimal_places=4, default=0)
+    in_quantity = models.DecimalField(_('累计入库'), max_digits=16, decimal_places=4, default=0)
+    out_quantity = models.DecimalField(_('累计出库'), max_digits=16, decimal_places=4, default=0)
+    closing_quantity = models.DecimalField(_('库存'), max_digits=16, decimal_places=4, default=0)
+    unit_price = models.DecimalField(_('单价'), max_digits=16, decimal_places=4, default=0)
+    amount = models.DecimalField(_('金额'), max_digits=18, decimal_places=4, default=0)
+    extra = models.JSONField(_('其他字段'), default=dict, blank=True)
+
+    class Meta:
+        verbose_name = _('月度报表明细')
+        verbose_name_plural = verbose_name
+        ordering = ['report', 'record_type', 'position', 'id']
+        indexes = [
+            models.Index(fields=['warehouse', 'month', 'product', 'spec'], name='ledger_wh_month_product_idx'),
+            models.Index(fields=['report', 'record_type', 'position'], name='ledger_report_type_pos_idx'),
+            models.Index(fields=['report', 'record_id'], name='ledger_report_record_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.report_id}-{self.get_record_type_display()}-{self.product}"
+
+
+class MonthClose(models.Model):
+    """仓库月结记录，每个仓库每个月一条，用于月结命令的断点续跑和耗时统计"""
+    STATUS_CHOICES = (
+        ('running', '执行中'),
+        ('completed', '已完成'),
+        ('skipped', '已跳过'),
+        ('failed', '失败'),
+        ('reopened', '已反结账'),
+    )
+
+    warehouse = models.ForeignKey(Warehouse, verbose_name=_('仓库'), on_delete=models.CASCADE,
+                                  related_name='month_closes')
+    month = models.DateField(_('结账月份'))
+    status = models.CharField(_('状态'), max_length=20, choices=STATUS_CHOICES, default='running')
+    next_report = models.ForeignKey(Report, verbose_name=_('下月报表'), on_delete=models.SET_NULL,
+                                    null=True, blank=True, related_name='+')
+    counts = models.JSONField(_('处理数量'), default=dict, blank=True)
+    message = models.TextField(_('说明'), blank=True, default='')
+    duration = models.FloatField(_('耗时（秒）'), default=0)
+    started_at = models.DateTimeField(_('开始时间'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('结束时间'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('月结记录')
+        verbose_name_plural = verbose_name
+        ordering = ['-month', 'warehouse']
+        unique_together = ['warehouse', 'month']
+
+    def __str__(self):
+        return f"{self.warehouse_id}-{self.month:%Y-%m}({self.get_status_display()})"
+
+
+class BalanceSnapshot(models.Model):
+    """月结时写入的期末结存快照，结账后不再变化，下月期初库存直接读取"""
+    warehouse = models.ForeignKey(Warehouse, verbose_name=_('仓库'), on_delete=models.CASCADE,
+                                  related_name='balance_snapshots')
+    month = models.DateField(_('月份'))
+    product = models.CharField(_('品项'), max_length=200)
+    spec = models.CharField(_('规格/型号'), max_length=200, blank=True, default='')
+    unit = models.CharField(_('单位'), max_length=50, blank=True, default='')
+    location = models.CharField(_('位置'), max_length=100, blank=True, default='')
+    unit_price = models.DecimalField(_('单价'), max_digits=16, decimal_places=4, default=0)
+    closing_quantity = models.DecimalField(_('期末库存'), max_digits=16, decimal_places=4, default=0)
+    amount = models.DecimalField(_('期末金额'), max_digits=18, decimal_places=4, default=0)
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('期末结存')
+        verbose_name_plural = verbose_name
+        ordering = ['warehouse', 'month', 'id']
+        unique_together = ['warehouse', 'month', 'product', 'spec']
+
+    def __str__(self):
+        return f"{self.warehouse_id}-{self.month:%Y-%m}-{self.product}"
+
+
+# 仓库、库区、库位变化后使仪表盘缓存失效
+@receiver([post_save, post_delete], sender=Warehouse)
+@receiver([post_save, post_delete], sender=WarehouseArea)
+@receiver([post_save, post_delete], sender=WarehouseLocation)
+def invalidate_dashboard_cache(sender, **kwargs):
+    # dashboard模块依赖本模块的模型，在函数内导入避免循环引用
+    from .dashboard import invalidate_dashboard
+    invalidate_dashboard()
+
+
+# 库区、库位变化后使库位解析缓存失效（库区改变所属仓库会改变其下库位的自然键）
+@receiver([post_save, post_delete], sender=WarehouseArea)
+@receiver([post_save, post_delete], sender=WarehouseLocation)
+def invalidate_location_resolver(sender, **kwargs):
+    from .resolvers import location_resolver
+    location_resolver.invalidate()
@@ -0,0 +1,358 @@
+"""
+月结
+
+结账某月时：
+- 把该月报表的库存明细按(品项, 规格)汇总，写入BalanceSnapshot作为不可变的期末结存
+- 以期末结存作为下月报表的期初库存：下月报表不存在时创建；已存在时只更新期初库存并重算库存，
+  已录入的入库/出库不受影响，本月新增的品项追加到下月
+每个仓库在一个事务中完成，结果记在MonthClose中。已结账的月份不能再修改（见periods模块），
+需要修改时先反结账，反结账会删除期末结存，修改后重新结账。
+
+多个仓库用进程池并行处理，每个进程使用自己的数据库连接（SQLite只能单进程执行）。
+"""
+import logging
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.db import connections, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from .ledger import month_start, touch_reports
+from .models import Warehouse, Report, MonthlyLedgerLine, MonthClose, BalanceSnapshot
+from .periods import PeriodClosedError, ensure_month_open
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+BALANCE_FIELDS = ('product', 'spec', 'unit', 'location', 'unit_price', 'closing_quantity', 'amount')
+
+
+def previous_month(today=None):
+    """月初执行时结账的月份（上个月）"""
+    today = today or timezone.localdate()
+    return month_start(today) - relativedelta(months=1)
+
+
+def month_report(warehouse_id, month):
+    return Report.objects.filter(
+        warehouse_id=warehouse_id,
+        report_date__gte=month,
+        report_date__lt=month + relativedelta(months=1)
+    ).order_by('id').first()
+
+
+def report_balances(report):
+    """报表库存明细按(品项, 规格)汇总的期末结存"""
+    rows = MonthlyLedgerLine.objects.filter(report=report, record_type='inventory').order_by() \
+        .values('product', 'spec').annotate(
+            first_position=Min('position'),
+            unit_name=Max('unit'),
+            location_code=Min('location'),
+            price=Max('unit_price'),
+            closing=Sum('closing_quantity'),
+            total_amount=Sum('amount'),
+        ).order_by('first_position', 'product', 'spec')
+    return [
+        {
+            'product': row['product'],
+            'spec': row['spec'],
+            'unit': row['unit_name'],
+            'location': row['location_code'],
+            'unit_price': row['price'],
+            'closing_quantity': row['closing'],
+            'amount': row['total_amount'],
+        }
+        for row in rows
+    ]
+
+
+def snapshot_balances(warehouse_id, month):
+    """已结账月份的期末结存，未结账时返回None"""
+    month = month_start(month)
+    if not MonthClose.objects.filter(warehouse_id=warehouse_id, month=month, status='completed').exists():
+        return None
+    return list(BalanceSnapshot.objects.filter(warehouse_id=warehouse_id, month=month)
+                .order_by('id').values(*BALANCE_FIELDS))
+
+
+def opening_balances(warehouse_id, month):
+    """
+    某月的期初库存，即上月的期末结存
+
+    上月已结账时直接读取结存快照；未结账时按上月报表的库存明细汇总；都没有时返回None
+    """
+    prev_month = month_start(month) - relativedelta(months=1)
+    balances = snapshot_balances(warehouse_id, prev_month)
+    if balances is not None:
+        return balances
+    report = month_report(warehouse_id, prev_month)
+    if report is None:
+        return None
+    return report_balances(report)
+
+
+def apply_opening_balances(report, balances):
+    """把期初库存写入报表的库存明细，返回(更新数, 新增数)"""
+    existing = {
+        (line.product, line.spec): line
+        for line in MonthlyLedgerLine.objects.select_for_update()
+        .filter(report=report, record_type='inventory').order_by('position', 'id')
+    }
+    position = MonthlyLedgerLine.objects.filter(report=report, record_type='inventory') \
+        .aggregate(max_position=Max('position'))['max_position']
+    position = -1 if position is None else position
+
+    updates = []
+    new_lines = []
+    for balance in balances:
+        key = (balance['product'], balance['spec'])
+        if key in existing:
+            target = existing[key]
+            target.opening_quantity = balance['closing_quantity']
+            target.closing_quantity = balance['closing_quantity'] + target.in_quantity - target.out_quantity
+            target.amount = target.closing_quantity * target.unit_price
+            updates.append(target)
+            continue
+
+        position += 1
+        new_lines.append(MonthlyLedgerLine(
+            report=report,
+            warehouse_id=report.warehouse_id,
+            month=month_start(report.report_date),
+            record_type='inventory',
+            record_id=str(uuid.uuid4()),
+            position=position,
+            product=balance['product'],
+            spec=balance['spec'],
+            unit=balance['unit'],
+            location=balance['location'],
+            opening_quantity=balance['closing_quantity'],
+            closing_quantity=balance['closing_quantity'],
+            unit_price=balance['unit_price'],
+            amount=balance['closing_quantity'] * balance['unit_price'],
+        ))
+
+    MonthlyLedgerLine.objects.bulk_update(
+        updates, ['opening_quantity', 'closing_quantity', 'amount'], batch_size=BATCH_SIZE
+    )
+    MonthlyLedgerLine.objects.bulk_create(new_lines, batch_size=BATCH_SIZE)
+    touch_reports([report.id])
+    return len(updates), len(new_lines)
+
+
+def refresh_opening_balances(warehouse, month):
+    """
+    用上月期末结存更新某月报表的期初库存，报表不存在时创建
+
+    返回{'success': True, 'message': ...}或{'error': ...}
+    """
+    month = month_start(month)
+    prev_month = month - relativedelta(months=1)
+    try:
+        ensure_month_open(warehouse.id, month)
+    except PeriodClosedError as e:
+        return {'error': str(e)}
+
+    balances = opening_balances(warehouse.id, month)
+    if not balances:
+        return {'error': f'上个月({prev_month:%Y-%m})没有库存数据，无法更新本月期初库存'}
+
+    with transaction.atomic():
+        report = month_report(warehouse.id, month)
+        if report is None:
+            report = Report.objects.create(
+                title=f"{warehouse.name}_{month.year}年{month.month}月报表",
+                warehouse=warehouse,
+                report_date=month
+            )
+        updated, added = apply_opening_balances(report, balances)
+
+    logger.info(f"期初库存更新完成: warehouse_id={warehouse.id}, month={month:%Y-%m}, 更新={updated}, 新增={added}")
+    return {'success': True, 'message': f'成功更新{month.year}年{month.month}月的期初库存数据'}
+
+
+def update_opening_balances(warehouse_id, month):
+    """
+    按仓库ID和YYYY-MM格式的月份更新期初库存，见refresh_opening_balances
+
+    返回{'success': True, 'message': ...}或{'error': ...}
+    """
+    if not warehouse_id or not month:
+        return {'error': '缺少必要参数'}
+    try:
+        month_date = datetime.strptime(f"{month}-01", "%Y-%m-%d").date()
+    except ValueError as e:
+        return {'error': f'月份格式错误，应为YYYY-MM: {str(e)}'}
+    try:
+        warehouse = Warehouse.objects.get(id=warehouse_id)
+    except Warehouse.DoesNotExist:
+        return {'error': f'仓库不存在(ID:{warehouse_id})'}
+
+    try:
+        return refresh_opening_balances(warehouse, month_date)
+    except Exception as e:
+        logger.error(f"更新期初库存出错: warehouse_id={warehouse_id}, month={month}, error={str(e)}", exc_info=True)
+        return {'error': f'更新期初库存数据出错: {str(e)}'}
+
+
+def close_warehouse(warehouse_id, month, force=False):
+    """
+    结账单个仓库的月份，返回MonthClose
+
+    参数:
+        month: 结账月份的任意一天
+        force: 已结账的月份先反结账再重新结账
+    """
+    month = month_start(month)
+    record, _ = MonthClose.objects.get_or_create(warehouse_id=warehouse_id, month=month)
+    if record.status == 'completed':
+        if not force:
+            return record
+        reopen_warehouse(warehouse_id, month)
+        record.refresh_from_db()
+
+    started = time.perf_counter()
+    record.status = 'running'
+    record.started_at = timezone.now()
+    record.save(update_fields=['status', 'started_at'])
+
+    try:
+        with transaction.atomic():
+            warehouse = Warehouse.objects.get(id=warehouse_id)
+            report = month_report(warehouse_id, month)
+            if report is None:
+                record.status = 'skipped'
+                record.message = f'{month:%Y-%m}没有月度报表'
+                record.counts = {}
+            else:
+                balances = report_balances(report)
+                BalanceSnapshot.objects.filter(warehouse_id=warehouse_id, month=month).delete()
+                BalanceSnapshot.objects.bulk_create(
+                    [BalanceSnapshot(warehouse_id=warehouse_id, month=month, **balance) for balance in balances],
+                    batch_size=BATCH_SIZE
+                )
+
+                next_month = month + relativedelta(months=1)
+                ensure_month_open(warehouse_id, next_month)
+                next_report = month_report(warehouse_id, next_month)
+                if next_report is None:
+                    next_report = Report.objects.create(
+                        title=f"{warehouse.name}_{next_month:%Y-%m}月度报表",
+                        warehouse=warehouse,
+                        report_date=next_month,
+                        description=f"月结自动创建的{next_month:%Y-%m}月度报表，基于{month:%Y-%m}月数据"
+                    )
+                updated, added = apply_opening_balances(next_report, balances)
+
+                record.status = 'completed'
+                record.next_report = next_report
+                record.message = ''
+                record.counts = {'snapshots': len(balances), 'updated': updated, 'added': added}
+    except Exception as e:
+        logger.error(f"月结失败: warehouse_id={warehouse_id}, month={month:%Y-%m}, error={str(e)}", exc_info=True)
+        record.status = 'failed'
+        record.message = str(e)
+
+    record.duration = time.perf_counter() - started
+    record.finished_at = timezone.now()
+    record.save()
+    logger.info(
+        f"月结完成: warehouse_id={warehouse_id}, month={month:%Y-%m}, status={record.status}, "
+        f"耗时={record.duration:.2f}s, counts={record.counts}"
+    )
+    return record
+
+
+def reopen_warehouse(warehouse_id, month):
+    """
+    反结账：删除期末结存，该月恢复为可修改
+
+    之后的月份已结账时不能反结账，需从最后一个已结账月份开始依次反结账
+    """
+    month = month_start(month)
+    with transaction.atomic():
+        later = MonthClose.objects.filter(warehouse_id=warehouse_id, month__gt=month, status='completed') \
+            .order_by('-month').first()
+        if later:
+            raise PeriodClosedError(f'{later.month:%Y-%m}已结账，请先反结账该月')
+        reopened = MonthClose.objects.filter(warehouse_id=warehouse_id, month=month, status='completed') \
+            .update(status='reopened', message='', finished_at=timezone.now())
+        if not reopened:
+            raise PeriodClosedError(f'{month:%Y-%m}未结账')
+        BalanceSnapshot.objects.filter(warehouse_id=warehouse_id, month=month).delete()
+    logger.info(f"反结账完成: warehouse_id={warehouse_id}, month={month:%Y-%m}")
+
+
+def _close_in_worker(warehouse_id, month, force):
+    """进程池中执行，返回可序列化的结果"""
+    try:
+        record = close_warehouse(warehouse_id, month, force)
+    except PeriodClosedError as e:
+        return {'warehouse_id': warehouse_id, 'status': 'failed', 'duration': 0, 'counts': {}, 'message': str(e)}
+    return {
+        'warehouse_id': warehouse_id,
+        'status': record.status,
+        'duration': record.duration,
+        'counts': record.counts,
+        'message': record.message,
+    }
+
+
+def _init_worker():
+    # 父进程在创建进程池前已关闭连接，这里再丢弃可能继承下来的连接对象（关闭会影响父进程），使用时重新连接
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+
+
+def close_month(month, warehouse_ids=None, processes=1, force=False):
+    """
+    结账多个仓库的月份，逐个返回结果字典
+
+    参数:
+        warehouse_ids: 默认为全部启用的仓库
+        processes: 并行进程数，1时在当前进程中依次执行
+    """
+    month = month_start(month)
+    if warehouse_ids is None:
+        warehouse_ids = list(Warehouse.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+
+    if not force:
+        done = set(MonthClose.objects.filter(
+            warehouse_id__in=warehouse_ids, month=month, status='completed'
+        ).values_list('warehouse_id', flat=True))
+        for warehouse_id in warehouse_ids:
+            if warehouse_id in done:
+                yield {'warehouse_id': warehouse_id, 'status': 'completed', 'duration': 0,
+                       'counts': {}, 'message': '已完成，跳过'}
+        warehouse_ids = [warehouse_id for warehouse_id in warehouse_ids if warehouse_id not in done]
+
+    if processes > 1 and connections['default'].vendor == 'sqlite':
+        # SQLite同一时间只允许一个写事务，并行结转只会互相等待或报database is locked
+        logger.warning("SQLite数据库不支持并行月结，改为单进程执行")
+        processes = 1
+
+    if processes <= 1 or len(warehouse_ids) <= 1:
+        for warehouse_id in warehouse_ids:
+            yield _close_in_worker(warehouse_id, month, force)
+        return
+
+    # 子进程通过fork继承已初始化的Django环境
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(_close_in_worker, warehouse_id, month, force): warehouse_id
+            for warehouse_id in warehouse_ids
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'warehouse_id': futures[future], 'status': 'failed', 'duration': 0,
+                       'counts': {}, 'message': str(e)}
@@ -0,0 +1,56 @@
+"""
+已结账月份的检查
+
+月结完成（MonthClose.status为completed）的月份不允许再修改报表明细和出入库记录，
+需要修改时先反结账。出入库变动会顺延到之后各月报表的期初和库存，
+因此之后有已结账月份时，之前月份的出入库记录同样不能修改。
+"""
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import MonthClose
+
+
+class PeriodClosedError(Exception):
+    """修改已结账月份的数据"""
+
+
+def closed_months(keys):
+    """返回keys中已结账的(仓库ID, 月份)，月份为当月第一天"""
+    keys = set(keys)
+    if not keys:
+        return set()
+    months = defaultdict(set)
+    for warehouse_id, month in keys:
+        months[warehouse_id].add(month)
+    closed = MonthClose.objects.filter(
+        warehouse_id__in=months.keys(),
+        month__in={month for _, month in keys},
+        status='completed'
+    ).values_list('warehouse_id', 'month')
+    return {key for key in closed if key in keys}
+
+
+def ensure_month_open(warehouse_id, month):
+    if closed_months([(warehouse_id, month)]):
+        raise PeriodClosedError(f'{month:%Y-%m}已结账，不能修改，如需修改请先反结账')
+
+
+def ensure_postings_open(*postings):
+    """检查出入库记录（transaction_posting的结果）所在月份及之后的月份是否已结账"""
+    earliest = {}
+    for posting in postings:
+        if posting:
+            warehouse_id, month = posting['warehouse_id'], posting['month']
+            if warehouse_id not in earliest or month < earliest[warehouse_id]:
+                earliest[warehouse_id] = month
+    if not earliest:
+        return
+    condition = Q()
+    for warehouse_id, month in earliest.items():
+        condition |= Q(warehouse_id=warehouse_id, month__gte=month)
+    month = MonthClose.objects.filter(condition, status='completed') \
+        .order_by('month').values_list('month', flat=True).first()
+    if month is not None:
+        raise PeriodClosedError(f'{month:%Y-%m}已结账，不能修改该月及之前月份的出入库记录，如需修改请先反结账')
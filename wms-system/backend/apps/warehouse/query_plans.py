@@ -0,0 +1,86 @@
+"""
+热点查询执行计划检查
+
+对导出、备份、月度报表和报表列表使用的ORM查询执行EXPLAIN，找出退化为全表扫描的查询。
+由check_query_plans命令和apps.warehouse.tests.test_query_plans共用。
+"""
+import re
+from datetime import date
+
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from apps.inventory.models import Inventory
+from .backup import WarehouseBackup
+from .models import Warehouse, Report, MonthlyLedgerLine
+
+# 各数据库执行计划中表示全表扫描的特征
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)(\w+)(?! USING)\s*$'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'mysql': re.compile(r'"access_type":\s*"ALL"'),
+}
+
+
+def hot_queries(warehouse_id):
+    """返回(名称, 查询集)列表，查询集与视图中实际使用的保持一致"""
+    from .views import ReportViewSet
+
+    warehouse = Warehouse(id=warehouse_id)
+    backup = WarehouseBackup(warehouse)
+    report_date = date.today().replace(day=1)
+    report_id = Report.objects.filter(warehouse_id=warehouse_id).values_list('id', flat=True).first() or 1
+
+    report_view = ReportViewSet()
+    report_view.request = Request(RequestFactory().get('/', {
+        'warehouse_id': warehouse_id,
+        'month': report_date.strftime('%Y-%m'),
+    }))
+
+    return [
+        ('export_excel 库存', Inventory.objects.filter(is_active=True, warehouse_id=warehouse_id)
+            .select_related('location', 'product', 'product__unit')
+            .order_by('location__code', 'product__code')),
+        ('backup 库存', backup.inventory_queryset()),
+        ('backup 出入库记录', backup.transaction_queryset()),
+        ('backup 报表', backup.report_queryset()),
+        ('monthly_report 报表', Report.objects.filter(warehouse_id=warehouse_id, report_date=report_date)),
+        ('monthly_report 明细', MonthlyLedgerLine.objects.filter(report_id=report_id, record_type='inventory')
+            .order_by('position', 'id')),
+        ('ReportViewSet 列表', report_view.get_queryset()),
+    ]
+
+
+def explain(queryset):
+    if connection.vendor == 'mysql':
+        return queryset.explain(format='json')
+    return queryset.explain()
+
+
+def check_query_plans(warehouse_id):
+    """
+    检查热点查询的执行计划
+
+    返回:
+        [(名称, 全表扫描的计划行列表, 完整执行计划), ...]，列表为空表示没有全表扫描
+
+    异常:
+        ValueError: 不支持的数据库
+    """
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise ValueError(f'不支持的数据库: {connection.vendor}')
+
+    results = []
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # 表数据较少时规划器倾向顺序扫描，关闭后才能看出是否有可用索引
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for name, queryset in hot_queries(warehouse_id):
+            plan = explain(queryset)
+            scans = [line.strip() for line in plan.splitlines() if pattern.search(line)]
+            results.append((name, scans, plan))
+    return results
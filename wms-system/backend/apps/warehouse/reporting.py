@@ -0,0 +1,254 @@
+"""
+月度报表增量维护
+
+出入库记录变化时，只把数量差额应用到受影响品项所在的报表明细行上：
+- 记录所在月份：累计入库/累计出库和库存
+- 之后的所有月份：期初库存和库存
+同一品项有多个库位的库存行时只更新序号最小的一行，报表合计与库存过账的数量一致。
+差额用F()表达式在数据库端直接更新，不读取整份报表；所有受影响的明细行合并为带Case/When的UPDATE，
+每条语句最多UPDATE_BATCH_SIZE行。
+"""
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Value, When
+from django.utils.dateparse import parse_date
+
+from apps.product.models import Product
+from .ledger import month_start, touch_reports
+from .models import Report, MonthlyLedgerLine
+
+logger = logging.getLogger(__name__)
+
+# 单条UPDATE语句中最多包含的明细行数
+UPDATE_BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+@contextmanager
+def report_updates_suspended():
+    """
+    暂停出入库记录信号对报表的逐条更新
+
+    用于批量写入或删除，调用方负责在结束后统一应用差额
+    """
+    previous = getattr(_local, 'suspended', False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+def report_updates_enabled():
+    return not getattr(_local, 'suspended', False)
+
+
+def report_item_key(product_name, spec):
+    """报表库存明细的品项键，与报表中的 品项_规格/型号 对应"""
+    return f"{product_name}_{spec or ''}"
+
+
+def _to_decimal(value):
+    try:
+        return Decimal(str(value or 0))
+    except (InvalidOperation, ValueError):
+        return Decimal('0')
+
+
+def transaction_posting(instance):
+    """
+    返回一条出入库记录对报表的影响，未完成的记录返回None
+
+    使用实例__dict__取值，避免延迟加载字段触发额外查询
+    """
+    values = instance.__dict__
+    transaction_date = values.get('transaction_date')
+    if isinstance(transaction_date, str):
+        transaction_date = parse_date(transaction_date)
+    elif isinstance(transaction_date, datetime):
+        transaction_date = transaction_date.date()
+    if values.get('status') != 'completed' or not transaction_date:
+        return None
+    return {
+        'warehouse_id': values.get('warehouse_id'),
+        'product_id': values.get('product_id'),
+        'spec': values.get('spec') or '',
+        'unit': values.get('unit') or '',
+        'unit_price': _to_decimal(values.get('unit_price')),
+        'transaction_type': values.get('transaction_type'),
+        'quantity': _to_decimal(values.get('quantity')),
+        'month': transaction_date.replace(day=1),
+    }
+
+
+class ReportDeltas:
+    """按(仓库, 月份, 品项)累计的报表差额"""
+
+    def __init__(self):
+        self._deltas = defaultdict(lambda: {'in': Decimal('0'), 'out': Decimal('0')})
+        self._meta = {}
+
+    def add(self, posting, sign=1):
+        if not posting:
+            return
+        key = (posting['warehouse_id'], posting['month'], posting['product_id'], posting['spec'])
+        field = 'in' if posting['transaction_type'] == 'IN' else 'out'
+        # 后台任务中的posting来自JSON，数量和单价为字符串
+        self._deltas[key][field] += sign * _to_decimal(posting['quantity'])
+        if key not in self._meta:
+            self._meta[key] = dict(posting, unit_price=_to_decimal(posting['unit_price']))
+
+    def add_transactions(self, transactions, sign=1):
+        for instance in transactions:
+            self.add(transaction_posting(instance), sign)
+
+    def __bool__(self):
+        return any(d['in'] or d['out'] for d in self._deltas.values())
+
+    def apply(self):
+        """把累计差额写入受影响的报表"""
+        if not self:
+            return 0
+
+        product_ids = {product_id for _, _, product_id, _ in self._deltas}
+        product_names = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'name'))
+
+        by_warehouse = defaultdict(list)
+        for (warehouse_id, month, product_id, spec), delta in self._deltas.items():
+            if not (delta['in'] or delta['out']) or product_id not in product_names:
+                continue
+            meta = self._meta[(warehouse_id, month, product_id, spec)]
+            by_warehouse[warehouse_id].append({
+                'month': month,
+                'name': product_names[product_id],
+                'spec': spec,
+                'unit': meta['unit'],
+                'unit_price': meta['unit_price'],
+                'in': delta['in'],
+                'out': delta['out'],
+            })
+
+        touched = 0
+        with transaction.atomic():
+            for warehouse_id, changes in by_warehouse.items():
+                touched += _apply_warehouse_changes(warehouse_id, changes)
+        return touched
+
+
+def _apply_warehouse_changes(warehouse_id, changes):
+    """在单个仓库的报表明细上应用差额，返回受影响的报表数量"""
+    first_month = min(change['month'] for change in changes)
+    reports = {
+        report_id: month_start(report_date)
+        for report_id, report_date in Report.objects.filter(
+            warehouse_id=warehouse_id, report_date__gte=first_month
+        ).values_list('id', 'report_date')
+    }
+    if not reports:
+        return 0
+
+    # 每份报表每个品项的差额：记录所在月份计入累计入库/累计出库，之后的月份计入期初库存
+    deltas = defaultdict(lambda: {'opening': Decimal('0'), 'in': Decimal('0'), 'out': Decimal('0')})
+    metas = {}
+    for change in changes:
+        key = (change['name'], change['spec'])
+        metas.setdefault(key, change)
+        for report_id, month in reports.items():
+            if month == change['month']:
+                deltas[report_id, key]['in'] += change['in']
+                deltas[report_id, key]['out'] += change['out']
+            elif month > change['month']:
+                deltas[report_id, key]['opening'] += change['in'] - change['out']
+
+    # 同一品项在多个库位都有库存行时，差额只记到序号最小的一行，与库存过账选取目标行的方式相同
+    lines = {}
+    for line_id, report_id, product, spec in MonthlyLedgerLine.objects.filter(
+        report_id__in=reports.keys(),
+        record_type='inventory',
+        product__in={name for name, _ in metas},
+    ).order_by('position', 'id').values_list('id', 'report_id', 'product', 'spec'):
+        lines.setdefault((report_id, (product, spec)), line_id)
+
+    # 后续报表中缺失的品项库存行直接按差额新建，缺失视为期初为0
+    missing = [(report_key, delta) for report_key, delta in deltas.items() if report_key not in lines]
+    if missing:
+        positions = dict(
+            MonthlyLedgerLine.objects.filter(
+                report_id__in={report_id for (report_id, _), _ in missing}, record_type='inventory'
+            ).order_by().values('report_id').annotate(count=Count('id')).values_list('report_id', 'count')
+        )
+        new_lines = []
+        for (report_id, key), delta in missing:
+            meta = metas[key]
+            positions[report_id] = positions.get(report_id, 0) + 1
+            closing = delta['opening'] + delta['in'] - delta['out']
+            new_lines.append(MonthlyLedgerLine(
+                report_id=report_id,
+                warehouse_id=warehouse_id,
+                month=reports[report_id],
+                record_type='inventory',
+                record_id=str(uuid.uuid4()),
+                position=positions[report_id],
+                product=meta['name'],
+                spec=meta['spec'],
+                unit=meta['unit'],
+                location='未分配',
+                opening_quantity=delta['opening'],
+                in_quantity=delta['in'],
+                out_quantity=delta['out'],
+                closing_quantity=closing,
+                unit_price=meta['unit_price'],
+                amount=closing * meta['unit_price'],
+                extra={'序号': positions[report_id]},
+            ))
+        MonthlyLedgerLine.objects.bulk_create(new_lines, batch_size=UPDATE_BATCH_SIZE)
+
+    updates = [
+        (lines[report_key], delta)
+        for report_key, delta in deltas.items()
+        if report_key in lines and (delta['opening'] or delta['in'] or delta['out'])
+    ]
+    for start in range(0, len(updates), UPDATE_BATCH_SIZE):
+        _update_lines(updates[start:start + UPDATE_BATCH_SIZE])
+
+    touch_reports(reports.keys())
+    logger.info(f"报表增量更新完成: warehouse_id={warehouse_id}, 报表数={len(reports)}")
+    return len(reports)
+
+
+def _update_lines(updates):
+    """用一条UPDATE把一批差额写入报表明细行"""
+    def case(values):
+        return Case(
+            *[When(id=line_id, then=Value(value)) for line_id, value in values],
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=16, decimal_places=4),
+        )
+
+    opening = case([(line_id, delta['opening']) for line_id, delta in updates])
+    total_in = case([(line_id, delta['in']) for line_id, delta in updates])
+    total_out = case([(line_id, delta['out']) for line_id, delta in updates])
+    net = case([(line_id, delta['opening'] + delta['in'] - delta['out']) for line_id, delta in updates])
+
+    MonthlyLedgerLine.objects.filter(id__in=[line_id for line_id, _ in updates]).update(
+        opening_quantity=F('opening_quantity') + opening,
+        in_quantity=F('in_quantity') + total_in,
+        out_quantity=F('out_quantity') + total_out,
+        closing_quantity=F('closing_quantity') + net,
+        amount=(F('closing_quantity') + net) * F('unit_price'),
+    )
+
+
+def apply_transaction_deltas(transactions, sign=1):
+    """把一批出入库记录的影响一次性应用到报表上"""
+    deltas = ReportDeltas()
+    deltas.add_transactions(transactions, sign)
+    return deltas.apply()
@@ -0,0 +1,25 @@
+"""
+库位解析缓存，缓存机制见apps.product.resolvers
+"""
+from apps.product.resolvers import Resolver
+from .models import WarehouseLocation
+
+
+class LocationResolver(Resolver):
+    """按(仓库ID, 库位编码)解析库位"""
+
+    def normalize(self, key):
+        warehouse_id, code = key
+        return warehouse_id, (code or '').strip()
+
+    def fetch(self, keys):
+        rows = WarehouseLocation.objects.filter(
+            area__warehouse_id__in={warehouse_id for warehouse_id, _ in keys},
+            code__in={code for _, code in keys}
+        ).order_by('id').values_list('area__warehouse_id', 'code', 'id')
+        for warehouse_id, code, pk in rows:
+            if (warehouse_id, code) in keys:
+                yield (warehouse_id, code), pk
+
+
+location_resolver = LocationResolver('location')
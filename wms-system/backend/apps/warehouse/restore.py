@@ -0,0 +1,371 @@
+"""
+仓库备份恢复
+
+按“解析 -> 批量解析主数据 -> 批量写入”处理备份文件：
+- load_backup按内容识别backup生成的json/ndjson格式和gzip压缩，ndjson逐行读取
+- 所有记录先在内存中校验，有错误时不修改任何数据
+- 商品、库位、经手人各用一次IN查询预加载，缺失的商品和库位批量补建
+- 库存和出入库记录分批bulk_create，出入库记录信号的库存过账和逐条报表更新被暂停
+- 库存按备份恢复期初库存和累计出入库；旧版备份没有这些字段时，按备份中的出入库记录重算
+- 出入库记录沿用备份中的编号，编号计数器推进到这些编号之后；没有编号的旧版备份重新分配编号
+- 备份中带有报表时按备份恢复报表；没有报表时，保留现有报表并在最后统一应用一次差额
+
+同一份备份重复恢复得到相同的结果（旧版备份的出入库编号除外）。
+"""
+import gzip
+import io
+import itertools
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.inventory.models import Inventory, Transaction
+from apps.inventory.posting import stock_posting_suspended
+from apps.inventory.sequences import advance_past, next_codes
+from apps.user.models import User
+from .importers import resolve_products, resolve_locations
+from .models import Report, MonthClose
+from .reporting import ReportDeltas, report_updates_suspended
+from .serializers import ReportSerializer
+
+logger = logging.getLogger(__name__)
+
+# 报表中只在备份时生成、恢复时应忽略的字段
+REPORT_READ_ONLY_FIELDS = ('id', 'creator', 'creator_name', 'warehouse_name', 'created_at', 'updated_at')
+# 库存记录中维持 库存 = 期初库存 + 累计入库 - 累计出库 的字段
+INVENTORY_TOTAL_FIELDS = ('initial_quantity', 'total_in', 'total_out')
+GZIP_MAGIC = b'\x1f\x8b'
+# ndjson备份中按行累积为列表的部分，其余类型的记录只有一行
+NDJSON_SECTIONS = ('inventory', 'transactions', 'reports')
+
+
+class RestoreError(Exception):
+    """备份数据无法恢复"""
+
+
+def _to_decimal(value):
+    if value is None or value == '':
+        return Decimal('0')
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'数值格式错误: {value}')
+
+
+def _to_date(value):
+    if not value:
+        raise ValueError('日期为空')
+    if isinstance(value, str):
+        parsed = parse_date(value[:10])
+        if parsed is None:
+            parsed_datetime = parse_datetime(value)
+            parsed = parsed_datetime.date() if parsed_datetime else None
+        if parsed is None:
+            raise ValueError(f'日期格式错误: {value}')
+        return parsed
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _inventory_totals(item):
+    """备份中的期初库存和累计出入库，旧版备份没有这些字段时返回None"""
+    if any(item.get(field) is None for field in INVENTORY_TOTAL_FIELDS):
+        return None
+    return {field: _to_decimal(item[field]) for field in INVENTORY_TOTAL_FIELDS}
+
+
+def _text(value, default=''):
+    if value is None:
+        return default
+    return str(value).strip() or default
+
+
+def load_backup(backup_file):
+    """
+    读取备份文件（二进制文件对象），返回WarehouseRestorer.parse使用的字典
+
+    backup生成的json、ndjson两种格式以及它们的gzip压缩文件都可以直接恢复
+    """
+    try:
+        magic = backup_file.read(2)
+        backup_file.seek(0)
+        if magic == GZIP_MAGIC:
+            backup_file = gzip.GzipFile(fileobj=backup_file)
+        lines = io.TextIOWrapper(backup_file, encoding='utf-8')
+
+        # json格式的备份只有一行；ndjson的每一行都是 {"type": ..., "data": ...}
+        first_line = lines.readline()
+        try:
+            record = json.loads(first_line)
+        except ValueError:
+            # 手工编辑过的多行json
+            return json.loads(first_line + lines.read())
+        if isinstance(record, dict) and set(record) == {'type', 'data'}:
+            return _load_ndjson(record, lines)
+        return record
+    except (OSError, EOFError, ValueError) as e:
+        raise RestoreError(f'无效的备份文件: {str(e)}')
+
+
+def _load_ndjson(first_record, lines):
+    backup_data = {name: [] for name in NDJSON_SECTIONS}
+    records = (json.loads(line) for line in lines if line.strip())
+    for record in itertools.chain([first_record], records):
+        if not isinstance(record, dict) or 'type' not in record:
+            raise ValueError('ndjson记录缺少type')
+        if record['type'] in NDJSON_SECTIONS:
+            backup_data[record['type']].append(record.get('data'))
+        else:
+            backup_data[record['type']] = record.get('data')
+    return backup_data
+
+
+class WarehouseRestorer:
+    """
+    把备份数据恢复到指定仓库
+
+    用法:
+        restorer = WarehouseRestorer(warehouse, batch_size=1000)
+        restorer.parse(backup_data)
+        restorer.run()
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, warehouse, batch_size=None):
+        self.warehouse = warehouse
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.inventory_rows = []
+        self.transaction_rows = []
+        self.reports = []
+        self.has_reports = False
+        self.errors = []
+        self.counts = {'inventory': 0, 'transactions': 0, 'reports': 0}
+
+    # ------------------------------------------------------------------
+    # 解析阶段：只处理内存数据
+    # ------------------------------------------------------------------
+    def parse(self, backup_data):
+        """校验备份数据，收集记录级错误"""
+        if not isinstance(backup_data, dict):
+            raise RestoreError('无效的备份数据格式')
+        if (backup_data.get('warehouse') or {}).get('code') != self.warehouse.code:
+            raise RestoreError('备份数据与目标仓库不匹配')
+        # 恢复会整体替换出入库记录和报表，已结账的月份需要先反结账
+        if MonthClose.objects.filter(warehouse=self.warehouse, status='completed').exists():
+            raise RestoreError('仓库存在已结账的月份，请先反结账后再恢复')
+
+        for index, item in enumerate(backup_data.get('inventory') or [], 1):
+            try:
+                self.inventory_rows.append({
+                    'product_key': (_text(item['product']), _text(item.get('specification', item.get('spec')))),
+                    'unit': _text(item.get('unit'), '个'),
+                    'location_code': _text(item.get('location')),
+                    'quantity': _to_decimal(item.get('quantity')),
+                    'unit_price': _to_decimal(item.get('unit_price')),
+                    'totals': _inventory_totals(item),
+                })
+            except (KeyError, TypeError, ValueError) as e:
+                self.errors.append(f"库存记录第 {index} 条无效: {str(e)}")
+
+        for index, item in enumerate(backup_data.get('transactions') or [], 1):
+            try:
+                transaction_type = item['type']
+                if transaction_type not in ('IN', 'OUT'):
+                    raise ValueError(f'事务类型错误: {transaction_type}')
+                self.transaction_rows.append({
+                    'transaction_code': _text(item.get('code')),
+                    'product_key': (_text(item['product']), _text(item.get('specification', item.get('spec')))),
+                    'unit': _text(item.get('unit'), '个'),
+                    'transaction_type': transaction_type,
+                    'transaction_date': _to_date(item.get('date')),
+                    'quantity': _to_decimal(item.get('quantity')),
+                    'unit_price': _to_decimal(item.get('unit_price')),
+                    'handler': _text(item.get('handler')),
+                })
+            except (KeyError, TypeError, ValueError) as e:
+                self.errors.append(f"交易记录第 {index} 条无效: {str(e)}")
+
+        self.has_reports = bool(backup_data.get('reports'))
+        for index, report in enumerate(backup_data.get('reports') or [], 1):
+            if not isinstance(report, dict):
+                self.errors.append(f"报表第 {index} 条无效")
+                continue
+            report = {key: value for key, value in report.items() if key not in REPORT_READ_ONLY_FIELDS}
+            report['warehouse'] = self.warehouse.id
+            self.reports.append(report)
+
+    # ------------------------------------------------------------------
+    # 写入阶段：一个事务内完成
+    # ------------------------------------------------------------------
+    def run(self):
+        """清除仓库现有数据并写入备份数据"""
+        if self.errors:
+            raise RestoreError('；'.join(self.errors[:20]))
+
+        deltas = ReportDeltas()
+        # 库存直接按备份快照写入，删除旧记录时无需冲回库存
+        with transaction.atomic(), report_updates_suspended(), stock_posting_suspended():
+            existing = Transaction.objects.filter(warehouse=self.warehouse)
+            if self.has_reports:
+                Report.objects.filter(warehouse=self.warehouse).delete()
+            else:
+                # 保留现有报表，扣除即将删除的出入库记录的影响
+                deltas.add_transactions(existing.iterator(chunk_size=self.batch_size), sign=-1)
+            self._delete_transactions(existing)
+            Inventory.objects.filter(warehouse=self.warehouse).delete()
+
+            product_keys = {}
+            for row in self.inventory_rows + self.transaction_rows:
+                product_keys.setdefault(row['product_key'], row['unit'])
+            products = resolve_products(product_keys, self.batch_size)
+            locations = resolve_locations(
+                self.warehouse, {row['location_code'] for row in self.inventory_rows}, self.batch_size
+            )
+
+            self._create_inventory(products, locations)
+            transactions = self._create_transactions(products)
+
+            if self.has_reports:
+                # 备份中的报表已包含这些出入库记录的影响，直接恢复
+                self._create_reports()
+            else:
+                deltas.add_transactions(transactions)
+                deltas.apply()
+
+        logger.info(
+            f"备份恢复完成: warehouse_id={self.warehouse.id}, 库存={self.counts['inventory']}, "
+            f"交易={self.counts['transactions']}, 报表={self.counts['reports']}"
+        )
+        return self.counts
+
+    def _create_reports(self):
+        """恢复报表，报表标识唯一，需在旧报表删除后再校验"""
+        for index, report in enumerate(self.reports, 1):
+            serializer = ReportSerializer(data=report)
+            if not serializer.is_valid():
+                raise RestoreError(f"报表第 {index} 条无效: {serializer.errors}")
+            serializer.save()
+        self.counts['reports'] = len(self.reports)
+
+    def _delete_transactions(self, existing):
+        """分批删除出入库记录，避免一次加载全部记录"""
+        while True:
+            ids = list(existing.order_by().values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                break
+            Transaction.objects.filter(id__in=ids).delete()
+
+    def _create_inventory(self, products, locations):
+        """批量写入库存记录，同一库位同一商品数量合并"""
+        moved = self._transaction_totals(products)
+        inventories = {}
+        for row in self.inventory_rows:
+            product_id = products[row['product_key']]
+            location_id = locations.get(row['location_code'])
+            totals = row['totals']
+            if totals is None:
+                # 与rebuild_stock相同，累计出入库记在该商品的第一条库存上，其余库存的期初即当前库存
+                total_in, total_out = moved.pop(product_id, (0, 0))
+                totals = {
+                    'initial_quantity': row['quantity'] - total_in + total_out,
+                    'total_in': total_in,
+                    'total_out': total_out,
+                }
+            key = (location_id, product_id)
+            if key in inventories:
+                inventory = inventories[key]
+                inventory.quantity += row['quantity']
+                inventory.amount = inventory.quantity * inventory.unit_price
+                for field, value in totals.items():
+                    setattr(inventory, field, getattr(inventory, field) + value)
+                continue
+            inventories[key] = Inventory(
+                warehouse=self.warehouse,
+                product_id=product_id,
+                location_id=location_id,
+                spec=row['product_key'][1],
+                unit=row['unit'],
+                quantity=row['quantity'],
+                unit_price=row['unit_price'],
+                amount=row['quantity'] * row['unit_price'],
+                is_active=True,
+                **totals,
+            )
+        Inventory.objects.bulk_create(inventories.values(), batch_size=self.batch_size)
+        self.counts['inventory'] = len(inventories)
+
+    def _transaction_totals(self, products):
+        """按商品汇总备份中出入库记录的数量，返回 {商品ID: (累计入库, 累计出库)}"""
+        totals = {}
+        for row in self.transaction_rows:
+            product_id = products[row['product_key']]
+            total_in, total_out = totals.get(product_id, (0, 0))
+            if row['transaction_type'] == 'IN':
+                total_in += row['quantity']
+            else:
+                total_out += row['quantity']
+            totals[product_id] = (total_in, total_out)
+        return totals
+
+    def _create_transactions(self, products):
+        """批量写入出入库记录"""
+        usernames = {row['handler'] for row in self.transaction_rows if row['handler']}
+        users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+
+        transactions = []
+        for row, code in zip(self.transaction_rows, self._transaction_codes()):
+            transactions.append(Transaction(
+                transaction_code=code,
+                transaction_date=row['transaction_date'],
+                warehouse=self.warehouse,
+                product_id=products[row['product_key']],
+                spec=row['product_key'][1],
+                unit=row['unit'],
+                transaction_type=row['transaction_type'],
+                quantity=row['quantity'],
+                unit_price=row['unit_price'],
+                amount=row['quantity'] * row['unit_price'],
+                operator=users.get(row['handler']),
+                status='completed',
+            ))
+        Transaction.objects.bulk_create(transactions, batch_size=self.batch_size)
+        self.counts['transactions'] = len(transactions)
+        return transactions
+
+    def _transaction_codes(self):
+        """
+        确定出入库记录的编号
+
+        沿用备份中的编号；旧版备份没有编号，或编号重复、已被其他仓库使用时，和导入一样按类型重新分配
+        """
+        backed_up = [row['transaction_code'] for row in self.transaction_rows if row['transaction_code']]
+        # 本仓库的出入库记录已删除，仍然存在的编号属于其他仓库
+        taken = set()
+        for start in range(0, len(backed_up), self.batch_size):
+            taken.update(Transaction.objects.filter(
+                transaction_code__in=backed_up[start:start + self.batch_size]
+            ).values_list('transaction_code', flat=True))
+
+        codes = []
+        missing = {'IN': [], 'OUT': []}
+        for index, row in enumerate(self.transaction_rows):
+            code = row['transaction_code']
+            if not code or code in taken:
+                missing[row['transaction_type']].append(index)
+                code = None
+            else:
+                taken.add(code)
+            codes.append(code)
+
+        # 先推进计数器，再分配新编号，避免新编号与沿用的编号相同
+        advance_past(self.warehouse, taken)
+        for transaction_type, indexes in missing.items():
+            if indexes:
+                for index, code in zip(indexes, next_codes(transaction_type, self.warehouse, len(indexes))):
+                    codes[index] = code
+        return codes
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Warehouse, WarehouseArea, WarehouseLocation, Report
+from . import ledger
 
 class WarehouseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,14 +20,45 @@ class WarehouseLocationSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['created_at', 'updated_at']
 
+class ReportDataField(serializers.JSONField):
+    """报表内容，读写时与明细表互相转换，不读取Report.data"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return ledger.get_report_data(instance)
+
+    def to_internal_value(self, data):
+        return {'data': super().to_internal_value(data)}
+
+
 class ReportSerializer(serializers.ModelSerializer):
     creator_name = serializers.SerializerMethodField()
     warehouse_name = serializers.SerializerMethodField()
+    # 报表内容存放在明细表中，读写时与明细表互相转换
+    data = ReportDataField(required=False)
     
     class Meta:
         model = Report
         fields = '__all__'
-        read_only_fields = ['created_at', 'updated_at', 'creator', 'creator_name', 'warehouse_name']
+        read_only_fields = [
+            'created_at', 'updated_at', 'creator', 'creator_name', 'warehouse_name', *ledger.SUMMARY_FIELDS
+        ]
+        
+    def create(self, validated_data):
+        data = validated_data.pop('data', None)
+        report = super().create(validated_data)
+        ledger.replace_report_data(report, data)
+        return report
+        
+    def update(self, instance, validated_data):
+        data = validated_data.pop('data', None)
+        report = super().update(instance, validated_data)
+        if data is not None:
+            ledger.replace_report_data(report, data)
+        return report
         
     def get_creator_name(self, obj):
         if obj.creator:
@@ -34,4 +66,14 @@ class ReportSerializer(serializers.ModelSerializer):
         return None
         
     def get_warehouse_name(self, obj):
-        return obj.warehouse.name 
\ No newline at end of file
+        return obj.warehouse.name
+
+
+class ReportSummarySerializer(serializers.ModelSerializer):
+    """报表列表使用的摘要，不包含报表内容"""
+    creator_name = serializers.CharField(source='creator.username', default=None, read_only=True)
+    warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
+
+    class Meta:
+        model = Report
+        exclude = ['data']
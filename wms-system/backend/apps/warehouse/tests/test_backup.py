@@ -0,0 +1,136 @@
+import gzip
+import io
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.inventory import sequences
+from apps.inventory.models import CodeSequence, Inventory, Transaction
+from apps.product.models import Product, Unit
+from apps.user.models import User
+from apps.warehouse.backup import WarehouseBackup
+from apps.warehouse.models import Warehouse, WarehouseArea, WarehouseLocation
+from apps.warehouse.restore import WarehouseRestorer, INVENTORY_TOTAL_FIELDS, load_backup
+
+INVENTORY_FIELDS = ('location__code', 'product__name', 'quantity') + INVENTORY_TOTAL_FIELDS
+
+
+@override_settings(REPORT_UPDATES_IN_BACKGROUND=False)
+class BackupRestoreTests(TestCase):
+    """备份后恢复得到相同的库存和出入库记录"""
+
+    def setUp(self):
+        sequences.reset_cache()
+        self.addCleanup(sequences.reset_cache)
+        self.warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        area = WarehouseArea.objects.create(warehouse=self.warehouse, name='A区', code='A')
+        unit = Unit.objects.create(name='个', code='PCS')
+        self.product = Product.objects.create(name='商品', code='P001', spec='红', unit=unit)
+        for code, quantity in (('A1', 10), ('A2', 5)):
+            location = WarehouseLocation.objects.create(area=area, code=code, name=code)
+            Inventory.objects.create(warehouse=self.warehouse, location=location, product=self.product,
+                                     spec='红', unit='个', initial_quantity=quantity, quantity=quantity,
+                                     unit_price=2)
+        for transaction_type, quantity in (('IN', 7), ('OUT', 3), ('IN', Decimal('1.5'))):
+            Transaction.objects.create(
+                warehouse=self.warehouse, product=self.product, spec='红', unit='个',
+                transaction_type=transaction_type, quantity=quantity, unit_price=2,
+                status='completed', transaction_date=date(2026, 9, 5)
+            )
+
+    def backup_file(self, backup_format='json', compress=False):
+        return b''.join(WarehouseBackup(self.warehouse).stream(backup_format, compress=compress))
+
+    def backup_data(self, backup_format='json'):
+        return json.loads(self.backup_file(backup_format))
+
+    def restore(self, backup_data):
+        restorer = WarehouseRestorer(self.warehouse)
+        restorer.parse(backup_data)
+        return restorer.run()
+
+    def codes(self):
+        return list(Transaction.objects.filter(warehouse=self.warehouse).order_by('id')
+                    .values_list('transaction_code', flat=True))
+
+    def inventory(self):
+        return list(Inventory.objects.filter(warehouse=self.warehouse).order_by('id').values_list(*INVENTORY_FIELDS))
+
+    def test_round_trip_keeps_inventory_totals(self):
+        before = self.inventory()
+        self.assertEqual(before[0], ('A1', '商品', Decimal('15.5'), 10, Decimal('8.5'), 3))
+
+        self.restore(self.backup_data())
+        self.assertEqual(self.inventory(), before)
+
+    def test_old_backup_totals_recomputed(self):
+        backup_data = self.backup_data()
+        for item in backup_data['inventory']:
+            for field in INVENTORY_TOTAL_FIELDS:
+                del item[field]
+
+        self.restore(backup_data)
+        # 与rebuild_stock一致：出入库累计在第一条库存上，库存 = 期初 + 累计入库 - 累计出库
+        self.assertEqual(self.inventory(), [
+            ('A1', '商品', Decimal('15.5'), 10, Decimal('8.5'), 3),
+            ('A2', '商品', 5, 5, 0, 0),
+        ])
+
+    def test_round_trip_keeps_transaction_codes(self):
+        before = self.codes()
+        backup_data = self.backup_data()
+        # 恢复到计数器从头开始的数据库，之后分配的编号不能与恢复的编号相同
+        CodeSequence.objects.all().delete()
+        sequences.reset_cache()
+
+        self.restore(backup_data)
+        self.assertEqual(self.codes(), before)
+
+        transaction = Transaction.objects.create(
+            warehouse=self.warehouse, product=self.product, spec='红', unit='个', transaction_type='IN',
+            quantity=1, unit_price=2, status='completed', transaction_date=date(2026, 9, 6)
+        )
+        self.assertNotIn(transaction.transaction_code, before)
+
+    def test_old_backup_codes_allocated(self):
+        backup_data = self.backup_data()
+        for item in backup_data['transactions']:
+            del item['code']
+
+        self.restore(backup_data)
+        codes = self.codes()
+        self.assertEqual(len(set(codes)), 3)
+        self.assertTrue(all(code.startswith(('IN', 'OUT')) for code in codes))
+
+    def test_load_all_backup_formats(self):
+        expected = self.backup_data()
+        del expected['backup_time']
+        for backup_format in ('json', 'ndjson'):
+            for compress in (False, True):
+                with self.subTest(backup_format=backup_format, compress=compress):
+                    loaded = load_backup(io.BytesIO(self.backup_file(backup_format, compress)))
+                    del loaded['backup_time']
+                    self.assertEqual(loaded, expected)
+
+    def test_restore_gzip_upload(self):
+        before = self.inventory()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='admin', password='admin', level=3))
+
+        response = client.post(
+            reverse('warehouse-restore', args=[self.warehouse.id]),
+            data=self.backup_file('ndjson', compress=True), content_type='application/gzip'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['counts']['transactions'], 3)
+        self.assertEqual(self.inventory(), before)
+
+        response = client.post(
+            reverse('warehouse-restore', args=[self.warehouse.id]),
+            data=gzip.compress(b'not a backup'), content_type='application/gzip'
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,25 @@
+from django.test import TestCase
+
+from apps.product.models import Product, Unit
+from apps.warehouse.importers import resolve_products, resolve_units
+
+
+class ResolveTests(TestCase):
+    """导入时按名称补建单位和商品"""
+
+    def test_created_codes_fit_columns(self):
+        # SQLite不检查CharField长度，这里按max_length检查，避免PostgreSQL/MySQL上导入失败
+        units = resolve_units({'个', '箱'})
+        products = resolve_products({('螺丝', 'M3'): '个', ('螺母', ''): '箱'})
+
+        self.assertEqual(len(units), 2)
+        self.assertEqual(len(products), 2)
+        for model in (Unit, Product):
+            max_length = model._meta.get_field('code').max_length
+            for code in model.objects.values_list('code', flat=True):
+                self.assertLessEqual(len(code), max_length, code)
+
+    def test_existing_names_reused(self):
+        unit = Unit.objects.create(name='个', code='PCS')
+        self.assertEqual(resolve_units({'个'}), {'个': unit.id})
+        self.assertEqual(Unit.objects.count(), 1)
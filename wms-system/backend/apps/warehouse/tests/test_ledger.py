@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.test import TestCase
+
+from apps.warehouse import ledger
+from apps.warehouse.models import Warehouse, Report, MonthlyLedgerLine
+
+
+class LedgerTests(TestCase):
+    """报表数据与明细行的转换"""
+
+    def test_long_text_kept_in_extra(self):
+        warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        report = Report.objects.create(title='9月', warehouse=warehouse, report_date=date(2026, 9, 1))
+        handler = '经' * 120
+        ledger.replace_report_data(report, {'inbound': [{'日期': '2026-09-05', '品项': '商品', '数量': 1, '经手人': handler}]})
+
+        line = MonthlyLedgerLine.objects.get(report=report)
+        self.assertEqual(len(line.handler), MonthlyLedgerLine._meta.get_field('handler').max_length)
+        self.assertEqual(ledger.get_report_data(report)['inbound'][0]['经手人'], handler)
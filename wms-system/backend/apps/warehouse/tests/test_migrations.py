@@ -0,0 +1,48 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+BEFORE = [('warehouse', '0005_monthlyledgerline')]
+AFTER = [('warehouse', '0006_backfill_monthly_ledger')]
+
+
+class BackfillLedgerMigrationTests(TransactionTestCase):
+    """0006把Report.data拆分为明细，回滚时写回Report.data"""
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_backfill_and_reverse(self):
+        apps = self.migrate(BEFORE)
+        Warehouse = apps.get_model('warehouse', 'Warehouse')
+        Report = apps.get_model('warehouse', 'Report')
+        warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        long_location = 'L' * 150
+        report = Report.objects.create(title='9月', warehouse=warehouse, report_date='2026-09-01', data={
+            'inventory': [{'id': 'r1', '位置': long_location, '品项': '商品', '期初库存': 10, '库存': 10, '单价': 2.5}],
+            'inbound': [],
+        })
+
+        apps = self.migrate(AFTER)
+        line = apps.get_model('warehouse', 'MonthlyLedgerLine').objects.get(report_id=report.id)
+        self.assertEqual(len(line.location), 100)
+        self.assertEqual(line.extra, {'位置': long_location})
+        # 迁移后报表只在明细中修改
+        line.closing_quantity = 12
+        line.save()
+
+        apps = self.migrate(BEFORE)
+        data = apps.get_model('warehouse', 'Report').objects.get(id=report.id).data
+        self.assertEqual(data['inbound'], [])
+        self.assertEqual(len(data['inventory']), 1)
+        record = data['inventory'][0]
+        self.assertEqual(record['id'], 'r1')
+        self.assertEqual(record['位置'], long_location)
+        self.assertEqual((record['期初库存'], record['库存'], record['单价']), (10, 12, 2.5))
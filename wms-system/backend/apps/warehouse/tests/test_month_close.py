@@ -0,0 +1,69 @@
+from datetime import date
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Transaction
+from apps.product.models import Product, Unit
+from apps.user.models import User
+from apps.warehouse import ledger
+from apps.warehouse.models import Warehouse, Report, MonthClose, MonthlyLedgerLine
+from apps.warehouse.periods import PeriodClosedError
+
+
+@override_settings(REPORT_UPDATES_IN_BACKGROUND=False)
+class MonthCloseTests(TestCase):
+    """月结、反结账和已结账月份的出入库限制"""
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        unit = Unit.objects.create(name='个', code='PCS')
+        self.product = Product.objects.create(name='商品', code='P001', spec='红', unit=unit)
+        report = Report.objects.create(title='9月', warehouse=self.warehouse, report_date=date(2026, 9, 1))
+        ledger.replace_report_data(report, {'inventory': [
+            {'位置': 'A1', '品项': '商品', '规格/型号': '红', '期初库存': 10, '库存': 10, '单价': 2},
+        ]})
+        self.client = APIClient()
+        self.users = {level: User.objects.create_user(username=f'user{level}', password='password', level=level)
+                      for level in (1, 3)}
+
+    def post(self, action, level):
+        self.client.force_authenticate(self.users[level])
+        return self.client.post(reverse(f"warehouse-{action.replace('_', '-')}", args=[self.warehouse.id]), {'month': '2026-09'},
+                                format='json')
+
+    def create_transaction(self, day):
+        return Transaction.objects.create(
+            warehouse=self.warehouse, product=self.product, spec='红', unit='个', transaction_type='IN',
+            quantity=1, unit_price=2, status='completed', transaction_date=day
+        )
+
+    def test_close_and_reopen_require_level_3(self):
+        for action in ('close_month', 'reopen_month'):
+            with self.subTest(action=action):
+                self.assertEqual(self.post(action, 1).status_code, 403)
+        self.assertFalse(MonthClose.objects.filter(status='completed').exists())
+
+        response = self.post('close_month', 3)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['status'], 'completed')
+        # 期末库存结转为10月的期初库存
+        line = MonthlyLedgerLine.objects.get(report__report_date=date(2026, 10, 1))
+        self.assertEqual((line.opening_quantity, line.closing_quantity), (10, 10))
+
+        self.assertEqual(self.post('reopen_month', 1).status_code, 403)
+        self.assertEqual(self.post('reopen_month', 3).status_code, 200)
+        self.assertEqual(MonthClose.objects.get().status, 'reopened')
+
+    def test_closed_period_rejects_postings(self):
+        self.assertEqual(self.post('close_month', 3).status_code, 200)
+
+        # 结账月份及之前月份的出入库记录都会改变期末结存
+        for day in (date(2026, 9, 5), date(2026, 8, 5)):
+            with self.subTest(day=day), self.assertRaises(PeriodClosedError):
+                self.create_transaction(day)
+        self.create_transaction(date(2026, 10, 5))
+
+        self.assertEqual(self.post('reopen_month', 3).status_code, 200)
+        self.create_transaction(date(2026, 9, 5))
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.test import TestCase
+
+from apps.warehouse import ledger
+from apps.warehouse.models import Warehouse, Report
+from apps.warehouse.query_plans import check_query_plans
+
+
+class QueryPlanTests(TestCase):
+    """导出、备份、月度报表等热点查询不能退化为全表扫描"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        report = Report.objects.create(
+            title='测试报表', warehouse=cls.warehouse, report_date=date.today().replace(day=1)
+        )
+        ledger.replace_report_data(report, {'inventory': [{'品项': '商品', '库存': 1}]})
+
+    def test_hot_queries_use_indexes(self):
+        results = check_query_plans(self.warehouse.id)
+        self.assertTrue(results)
+        for name, scans, plan in results:
+            with self.subTest(query=name):
+                self.assertEqual(scans, [], f'{name}使用了全表扫描:\n{plan}')
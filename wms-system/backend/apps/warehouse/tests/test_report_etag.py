@@ -0,0 +1,50 @@
+from datetime import date
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.inventory.models import Transaction
+from apps.product.models import Product, Unit
+from apps.user.models import User
+from apps.warehouse import ledger
+from apps.warehouse.models import Warehouse, Report
+
+
+@override_settings(REPORT_UPDATES_IN_BACKGROUND=False)
+class ReportETagTests(TestCase):
+    """月度报表未变化时返回304"""
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        unit = Unit.objects.create(name='个', code='PCS')
+        self.product = Product.objects.create(name='商品', code='P001', spec='红', unit=unit)
+        report = Report.objects.create(title='9月', warehouse=self.warehouse, report_date=date(2026, 9, 1))
+        ledger.replace_report_data(report, {'inventory': [
+            {'位置': 'A1', '品项': '商品', '规格/型号': '红', '期初库存': 10, '库存': 10, '单价': 2},
+        ]})
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='admin', level=3))
+        self.url = reverse('monthly-report-list') + f'?warehouse_id={self.warehouse.id}&month=2026-09'
+
+    def test_not_modified_until_report_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        # 304不读取报表明细
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        Transaction.objects.create(
+            warehouse=self.warehouse, product=self.product, spec='红', unit='个', transaction_type='IN',
+            quantity=3, unit_price=2, status='completed', transaction_date=date(2026, 9, 5)
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['inventory'][0]['库存'], 13)
@@ -0,0 +1,81 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from apps.inventory.models import Inventory, Transaction
+from apps.product.models import Product, Unit
+from apps.warehouse import ledger
+from apps.warehouse.models import Warehouse, WarehouseArea, WarehouseLocation, Report, MonthlyLedgerLine
+from apps.warehouse.reporting import apply_transaction_deltas
+
+
+@override_settings(REPORT_UPDATES_IN_BACKGROUND=False)
+class ReportDeltaTests(TestCase):
+    """出入库记录对月度报表明细的增量更新"""
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='测试仓库', code='TEST')
+        area = WarehouseArea.objects.create(warehouse=self.warehouse, name='A区', code='A')
+        self.locations = [
+            WarehouseLocation.objects.create(area=area, code=code, name=code) for code in ('A1', 'A2')
+        ]
+        unit = Unit.objects.create(name='个', code='PCS')
+        self.product = Product.objects.create(name='商品', code='P001', spec='红', unit=unit)
+        self.reports = {}
+        for month in (9, 10):
+            report = Report.objects.create(title=f'{month}月', warehouse=self.warehouse, report_date=date(2026, month, 1))
+            ledger.replace_report_data(report, {'inventory': [
+                {'位置': 'A1', '品项': '商品', '规格/型号': '红', '期初库存': 10, '库存': 10, '单价': 2},
+                {'位置': 'A2', '品项': '商品', '规格/型号': '红', '期初库存': 5, '库存': 5, '单价': 2},
+            ]})
+            self.reports[month] = report
+
+    def create_transaction(self, transaction_type, quantity, day=date(2026, 9, 5), **kwargs):
+        return Transaction.objects.create(
+            warehouse=self.warehouse, product=self.product, spec='红', unit='个',
+            transaction_type=transaction_type, quantity=quantity, unit_price=Decimal('2'),
+            status='completed', transaction_date=day, **kwargs
+        )
+
+    def inventory_lines(self, month):
+        return list(MonthlyLedgerLine.objects.filter(report=self.reports[month], record_type='inventory')
+                    .order_by('position').values_list('location', 'opening_quantity', 'closing_quantity'))
+
+    def test_delta_applied_to_one_line_per_item(self):
+        for location, quantity in zip(self.locations, (10, 5)):
+            Inventory.objects.create(warehouse=self.warehouse, location=location, product=self.product,
+                                     spec='红', unit='个', quantity=quantity, unit_price=2)
+
+        self.create_transaction('IN', 3)
+
+        self.assertEqual(self.inventory_lines(9), [('A1', 10, 13), ('A2', 5, 5)])
+        self.assertEqual(self.inventory_lines(10), [('A1', 13, 13), ('A2', 5, 5)])
+        # 报表合计与库存过账增加的数量相同
+        self.assertEqual(sum(Inventory.objects.values_list('quantity', flat=True)), 18)
+
+    def test_later_months_carry_opening(self):
+        transaction = self.create_transaction('OUT', 4)
+        self.assertEqual(self.inventory_lines(10)[0], ('A1', 6, 6))
+
+        transaction.delete()
+        self.assertEqual(self.inventory_lines(9)[0], ('A1', 10, 10))
+        self.assertEqual(self.inventory_lines(10)[0], ('A1', 10, 10))
+
+    def test_decimal_deltas_are_exact(self):
+        transactions = [self.create_transaction('IN', Decimal('0.1'), transaction_code=f'T{i}') for i in range(10)]
+        # 整批冲回再重新应用，累计的差额不能经过浮点数
+        apply_transaction_deltas(transactions, sign=-1)
+        apply_transaction_deltas(transactions)
+        line = MonthlyLedgerLine.objects.get(report=self.reports[9], record_type='inventory', location='A1')
+        self.assertEqual(line.in_quantity, Decimal('1'))
+        self.assertEqual(line.closing_quantity, Decimal('11'))
+
+    def test_missing_item_line_created(self):
+        other = Product.objects.create(name='新商品', code='P002', spec='')
+        Transaction.objects.create(
+            warehouse=self.warehouse, product=other, transaction_type='IN', quantity=2, unit_price=1,
+            status='completed', transaction_date=date(2026, 9, 5)
+        )
+        line = MonthlyLedgerLine.objects.get(report=self.reports[10], record_type='inventory', product='新商品')
+        self.assertEqual((line.opening_quantity, line.closing_quantity, line.position), (2, 2, 3))
@@ -1,6 +1,7 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.pagination import PageNumberPagination
 from django.db.models import Count, Q, Sum, F
 from django.db import transaction
 import logging
@@ -13,6 +14,8 @@ from rest_framework.permissions import IsAuthenticated
 from django.utils.timezone import now
 from openpyxl.styles import Font, Alignment, PatternFill
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.cache import get_conditional_response, patch_cache_control
 import uuid
 from django.http import Http404
 from django.conf import settings
@@ -20,14 +23,44 @@ from django.db import models
 from django.db.models.functions import TruncMonth, Concat
 from dateutil.relativedelta import relativedelta
 from decimal import Decimal
-from .models import Warehouse, WarehouseArea, WarehouseLocation, Report
+from .models import Warehouse, WarehouseArea, WarehouseLocation, Report, MonthlyLedgerLine
 from apps.inventory.models import Transaction, Inventory, Product
-from .serializers import WarehouseSerializer, WarehouseAreaSerializer, WarehouseLocationSerializer, ReportSerializer
+from .serializers import (
+    WarehouseSerializer, WarehouseAreaSerializer, WarehouseLocationSerializer, ReportSerializer, ReportSummarySerializer
+)
+from .importers import WarehouseExcelImporter
+from .restore import WarehouseRestorer, RestoreError, load_backup
+from . import ledger
+from .backup import WarehouseBackup, BACKUP_FORMATS, backup_filename
+from .dashboard import get_dashboard_data
+from .month_close import update_opening_balances, close_warehouse, reopen_warehouse
+from .periods import PeriodClosedError
+from .exporters import (
+    xlsx_response, report_sheet, inventory_list_sheet, inventory_list_queryset, inventory_list_filename
+)
+from . import jobs
+from apps.job.tasks import enqueue
+from apps.job.views import job_accepted, run_in_background
 from ..user.views import WarehouseViewPermission, BasePermission
 import json
 
 logger = logging.getLogger(__name__)
 
+def report_not_modified(request, report):
+    """请求的If-None-Match与报表当前ETag一致时返回304响应，否则返回None"""
+    response = get_conditional_response(request, etag=ledger.report_etag(report))
+    if response is not None:
+        return with_report_etag(response, report)
+    return None
+
+
+def with_report_etag(response, report):
+    """设置报表ETag，要求浏览器每次使用前向服务器验证"""
+    response['ETag'] = ledger.report_etag(report)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 class ExcelRenderer(BaseRenderer):
     media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     format = 'xlsx'
@@ -95,67 +128,7 @@ class WarehouseViewSet(viewsets.ModelViewSet):
     def dashboard(self, request):
         """获取仪表盘数据"""
         try:
-            logger.info("开始获取仪表盘数据")
-            
-            # 获取基础统计数据
-            warehouse_count = Warehouse.objects.filter(is_active=True).count()
-            logger.info(f"Active warehouse count: {warehouse_count}")
-
-            area_count = WarehouseArea.objects.filter(is_active=True).count()
-            logger.info(f"Active area count: {area_count}")
-
-            location_count = WarehouseLocation.objects.filter(is_active=True).count()
-            used_location_count = WarehouseLocation.objects.filter(is_active=True, is_empty=False).count()
-            try:
-                location_usage = round(used_location_count / location_count * 100, 2) if location_count > 0 else 0
-            except Exception as e:
-                logger.error(f"计算库位使用率时出错: {str(e)}")
-                location_usage = 0
-            logger.info(f"Location stats - total: {location_count}, used: {used_location_count}, usage: {location_usage}%")
-
-            # 获取每个仓库的库位统计
-            warehouse_stats = []
-            try:
-                warehouses = Warehouse.objects.filter(is_active=True)
-                for warehouse in warehouses:
-                    try:
-                        location_count = WarehouseLocation.objects.filter(
-                            area__warehouse=warehouse,
-                            is_active=True
-                        ).count()
-                        warehouse_stats.append({
-                            'name': warehouse.name,
-                            'location_count': location_count
-                        })
-                    except Exception as e:
-                        logger.error(f"获取仓库 {warehouse.name} 的库位统计时出错: {str(e)}")
-                        continue
-                logger.info(f"Warehouse stats: {warehouse_stats}")
-            except Exception as e:
-                logger.error(f"获取仓库统计时出错: {str(e)}")
-
-            # 获取库区类型分布
-            area_stats = []
-            area_types = WarehouseArea.objects.filter(is_active=True).values('area_type').annotate(
-                count=Count('id')
-            )
-            for area_type in area_types:
-                area_stats.append({
-                    'name': area_type['area_type'] or '未分类',
-                    'count': area_type['count']
-                })
-            logger.info(f"Area stats: {area_stats}")
-
-            response_data = {
-                'warehouse_count': warehouse_count,
-                'area_count': area_count,
-                'location_count': location_count,
-                'location_usage': location_usage,
-                'warehouse_stats': warehouse_stats,
-                'area_stats': area_stats
-            }
-            logger.info(f"Dashboard data retrieved successfully: {response_data}")
-            return Response(response_data)
+            return Response(get_dashboard_data())
 
         except Exception as e:
             logger.error(f"Error retrieving dashboard data: {str(e)}", exc_info=True)
@@ -215,18 +188,18 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                 report_date = f"{year}-{month:02d}-01"
                 logger.info(f"生成报表日期: {report_date}")
                 
-                # 先查找已存在的报表
+                # 先查找已存在的报表，明细从明细表读取，这里只需要id和更新时间
                 report = Report.objects.filter(
                     warehouse=warehouse,
                     report_date=report_date
-                ).first()
+                ).only('id', 'updated_at').first()
                 
                 # 如果需要JSON格式且报表已存在
                 if response_format.lower() == 'json':
                     logger.info("准备返回JSON格式数据")
                     
                     if report:
-                        logger.info(f"找到已存在的报表: id={report.id}, data_keys={report.data.keys() if report.data else None}")
+                        logger.info(f"找到已存在的报表: id={report.id}")
                         # 只检查数据是否存在
                         if check_only:
                             return Response({
@@ -234,18 +207,16 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                                 "report_id": report.id
                             })
                         
-                        # 直接返回报表数据
-                        # 确保含有所有必要的字段
-                        report_data = report.data.copy() if report.data else {}
-                        if 'inbound' not in report_data:
-                            report_data['inbound'] = []
-                        if 'outbound' not in report_data:
-                            report_data['outbound'] = []
-                        if 'inventory' not in report_data:
-                            report_data['inventory'] = []
+                        # 报表未变化时直接返回304，不读取明细
+                        not_modified = report_not_modified(request, report)
+                        if not_modified is not None:
+                            return not_modified
+
+                        # 从报表明细表读取数据
+                        report_data = ledger.get_report_data(report)
                             
                         logger.info(f"返回报表数据: inbound={len(report_data['inbound'])}条, outbound={len(report_data['outbound'])}条, inventory={len(report_data['inventory'])}条")
-                        return Response(report_data)
+                        return with_report_etag(Response(report_data), report)
                     else:
                         logger.info("未找到报表，返回空数据")
                         # 返回空数据结构
@@ -260,7 +231,7 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                 elif response_format.lower() == 'excel':
                     logger.info("准备生成Excel报表")
                     
-                    if report and report.data:
+                    if report:
                         logger.info(f"使用已存在的报表生成Excel: id={report.id}")
                         return self.generate_excel_report(report, warehouse, year, month)
                     else:
@@ -282,48 +253,15 @@ class WarehouseViewSet(viewsets.ModelViewSet):
         生成空的Excel模板
         """
         try:
-            excel_file = io.BytesIO()
-            
-            # 创建工作簿
-            workbook = pd.ExcelWriter(excel_file, engine='openpyxl')
-            
-            # 创建入库明细表
-            inbound_df = pd.DataFrame(columns=self.DEFAULT_TRANSACTION_COLUMNS)
-            inbound_df.to_excel(workbook, sheet_name=self.DEFAULT_SHEET_NAMES['inbound'], index=False)
-            
-            # 创建出库明细表
-            outbound_df = pd.DataFrame(columns=self.DEFAULT_TRANSACTION_COLUMNS)
-            outbound_df.to_excel(workbook, sheet_name=self.DEFAULT_SHEET_NAMES['outbound'], index=False)
-            
-            # 创建库存明细表
-            inventory_df = pd.DataFrame(columns=self.DEFAULT_INVENTORY_COLUMNS)
-            inventory_df.to_excel(workbook, sheet_name=self.DEFAULT_SHEET_NAMES['inventory'], index=False)
-            
-            # 设置每个sheet的格式
-            for sheet_name in self.DEFAULT_SHEET_NAMES.values():
-                worksheet = workbook.sheets[sheet_name]
-                # 设置标题行格式
-                for cell in worksheet[1]:
-                    cell.font = Font(bold=True)
-                    cell.alignment = Alignment(horizontal='center')
-                    cell.fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
-            
-            # Workaround for Python context behavior
-            workbook._cleanup()
-            workbook.close()
-            
-            excel_file.seek(0)
+            sheets = [
+                (self.DEFAULT_SHEET_NAMES['inbound'], self.DEFAULT_TRANSACTION_COLUMNS, []),
+                (self.DEFAULT_SHEET_NAMES['outbound'], self.DEFAULT_TRANSACTION_COLUMNS, []),
+                (self.DEFAULT_SHEET_NAMES['inventory'], self.DEFAULT_INVENTORY_COLUMNS, []),
+            ]
             
             # 生成文件名
             filename = f"{warehouse.name}_月度报表_{year}年{month:02d}月.xlsx"
-            
-            # 返回文件
-            response = HttpResponse(
-                excel_file.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            return xlsx_response(sheets, filename)
             
         except Exception as e:
             logger.error(f"生成Excel模板失败: {str(e)}", exc_info=True)
@@ -332,77 +270,18 @@ class WarehouseViewSet(viewsets.ModelViewSet):
     def generate_excel_report(self, report, warehouse, year, month):
         """
         根据报表数据生成Excel文件
+        
+        明细行从报表明细表分批读取并逐行写入，导出过程中内存占用与报表行数无关
         """
         try:
-            excel_file = io.BytesIO()
-            
-            # 创建工作簿
-            workbook = pd.ExcelWriter(excel_file, engine='openpyxl')
-            
-            # 处理入库明细数据
-            inbound_data = report.data.get('inbound', [])
-            if inbound_data:
-                # 移除id字段，不显示在Excel中
-                for item in inbound_data:
-                    if 'id' in item:
-                        del item['id']
-                inbound_df = pd.DataFrame(inbound_data)
-            else:
-                inbound_df = pd.DataFrame(columns=self.DEFAULT_TRANSACTION_COLUMNS)
-            
-            inbound_df.to_excel(workbook, sheet_name=self.DEFAULT_SHEET_NAMES['inbound'], index=False)
-            
-            # 处理出库明细数据
-            outbound_data = report.data.get('outbound', [])
-            if outbound_data:
-                # 移除id字段，不显示在Excel中
-                for item in outbound_data:
-                    if 'id' in item:
-                        del item['id']
-                outbound_df = pd.DataFrame(outbound_data)
-            else:
-                outbound_df = pd.DataFrame(columns=self.DEFAULT_TRANSACTION_COLUMNS)
-            
-            outbound_df.to_excel(workbook, sheet_name=self.DEFAULT_SHEET_NAMES['outbound'], index=False)
-            
-            # 处理库存明细数据
-            inventory_data = report.data.get('inventory', [])
-            if inventory_data:
-                # 移除id字段，不显示在Excel中
-                for item in inventory_data:
-                    if 'id' in item:
-                        del item['id']
-                inventory_df = pd.DataFrame(inventory_data)
-            else:
-                inventory_df = pd.DataFrame(columns=self.DEFAULT_INVENTORY_COLUMNS)
-            
-            inventory_df.to_excel(workbook, sheet_name=self.DEFAULT_SHEET_NAMES['inventory'], index=False)
-            
-            # 设置每个sheet的格式
-            for sheet_name in self.DEFAULT_SHEET_NAMES.values():
-                worksheet = workbook.sheets[sheet_name]
-                # 设置标题行格式
-                for cell in worksheet[1]:
-                    cell.font = Font(bold=True)
-                    cell.alignment = Alignment(horizontal='center')
-                    cell.fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
-            
-            # Workaround for Python context behavior
-            workbook._cleanup()
-            workbook.close()
-            
-            excel_file.seek(0)
+            sheets = [
+                report_sheet(report, record_type, self.DEFAULT_SHEET_NAMES[record_type])
+                for record_type in ('inbound', 'outbound', 'inventory')
+            ]
             
             # 生成文件名
             filename = f"{warehouse.name}_月度报表_{year}年{month:02d}月.xlsx"
-            
-            # 返回文件
-            response = HttpResponse(
-                excel_file.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            return xlsx_response(sheets, filename)
             
         except Exception as e:
             logger.error(f"生成Excel报表失败: {str(e)}", exc_info=True)
@@ -410,7 +289,7 @@ class WarehouseViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def import_excel(self, request):
-        """导入Excel文件"""
+        """导入Excel文件，带?async=1时提交为后台任务"""
         try:
             excel_file = request.FILES.get('file')
             if not excel_file:
@@ -424,233 +303,50 @@ class WarehouseViewSet(viewsets.ModelViewSet):
             # 生成仓库编码（使用时间戳）
             warehouse_code = f"WH{datetime.now().strftime('%Y%m%d%H%M%S')}"
             
-            # 创建新仓库
-            try:
-                warehouse = Warehouse.objects.create(
-                    name=warehouse_name,
-                    code=warehouse_code,
-                    is_active=True
+            # 大文件在后台导入，上传的文件随任务保存
+            if run_in_background(request):
+                job = enqueue(
+                    jobs.import_excel,
+                    {
+                        'warehouse_name': warehouse_name,
+                        'warehouse_code': warehouse_code,
+                        'sheet_names': self.DEFAULT_SHEET_NAMES,
+                        'transaction_columns': self.DEFAULT_TRANSACTION_COLUMNS,
+                        'inventory_columns': self.DEFAULT_INVENTORY_COLUMNS,
+                    },
+                    user=request.user,
+                    name=f'导入仓库 {warehouse_name}',
+                    input_file=excel_file
                 )
-            except Exception as e:
-                return Response({'error': f'创建仓库失败: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
-            
+                return job_accepted(request, job)
+
             # 读取所有sheet
             excel_data = pd.read_excel(excel_file, sheet_name=None)
             
+            # 先解析全部数据，再在一个事务中批量写入
+            importer = WarehouseExcelImporter(
+                operator=request.user,
+                sheet_names=self.DEFAULT_SHEET_NAMES,
+                transaction_columns=self.DEFAULT_TRANSACTION_COLUMNS,
+                inventory_columns=self.DEFAULT_INVENTORY_COLUMNS
+            )
+
             # 验证sheet名称是否符合默认模板
-            required_sheets = set(self.DEFAULT_SHEET_NAMES.values())
-            if not all(sheet in excel_data for sheet in required_sheets):
-                missing_sheets = required_sheets - set(excel_data.keys())
+            missing_sheets = importer.missing_sheets(excel_data)
+            if missing_sheets:
                 return Response(
                     {'error': f'Excel文件缺少必要的sheet: {", ".join(missing_sheets)}'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            success_count = {
-                'outbound': 0,
-                'inbound': 0,
-                'inventory': 0
-            }
-            error_records = []
-            
-            # 获取当前用户作为操作人
-            operator = request.user
-            
-            # 处理月出库详情
-            outbound_df = excel_data[self.DEFAULT_SHEET_NAMES['outbound']]
-            if not all(col in outbound_df.columns for col in self.DEFAULT_TRANSACTION_COLUMNS):
-                missing_cols = set(self.DEFAULT_TRANSACTION_COLUMNS) - set(outbound_df.columns)
-                error_records.append(f'出库明细缺少必要的列: {", ".join(missing_cols)}')
-            else:
-                for index, row in outbound_df.iterrows():
-                    try:
-                        # 处理出库数据
-                        product_name = str(row['品项']).strip()
-                        spec = str(row['规格/型号']).strip()
-                        unit_name = str(row['单位']).strip()
-                        
-                        # 获取或创建商品
-                        try:
-                            product = Product.objects.get(name=product_name, spec=spec)
-                        except Product.DoesNotExist:
-                            # 获取或创建单位
-                            try:
-                                unit = Unit.objects.get(name=unit_name)
-                            except Unit.DoesNotExist:
-                                unit = Unit.objects.create(
-                                    name=unit_name,
-                                    code=f"U{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                                )
-                            
-                            # 创建商品
-                            product = Product.objects.create(
-                                name=product_name,
-                                spec=spec,
-                                unit=unit,
-                                code=f"P{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                                is_active=True
-                            )
-                        
-                        # 创建出库记录
-                        transaction_data = {
-                            'warehouse': warehouse,
-                            'product': product,
-                            'transaction_type': 'OUT',
-                            'quantity': float(row['数量']),
-                            'unit_price': float(row['单价']),
-                            'amount': float(row['金额']),
-                            'operator': operator,
-                            'transaction_date': pd.to_datetime(row['日期']),
-                            'status': 'completed',
-                            'is_active': True
-                        }
-                        Transaction.objects.create(**transaction_data)
-                        success_count['outbound'] += 1
-                    except Exception as e:
-                        error_records.append(f"出库明细第 {index + 2} 行处理失败: {str(e)}")
-            
-            # 处理月入库详情
-            inbound_df = excel_data[self.DEFAULT_SHEET_NAMES['inbound']]
-            if not all(col in inbound_df.columns for col in self.DEFAULT_TRANSACTION_COLUMNS):
-                missing_cols = set(self.DEFAULT_TRANSACTION_COLUMNS) - set(inbound_df.columns)
-                error_records.append(f'入库明细缺少必要的列: {", ".join(missing_cols)}')
-            else:
-                for index, row in inbound_df.iterrows():
-                    try:
-                        # 处理入库数据
-                        product_name = str(row['品项']).strip()
-                        spec = str(row['规格/型号']).strip()
-                        unit_name = str(row['单位']).strip()
-                        
-                        # 获取或创建商品
-                        try:
-                            product = Product.objects.get(name=product_name, spec=spec)
-                        except Product.DoesNotExist:
-                            # 获取或创建单位
-                            try:
-                                unit = Unit.objects.get(name=unit_name)
-                            except Unit.DoesNotExist:
-                                unit = Unit.objects.create(
-                                    name=unit_name,
-                                    code=f"U{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                                )
-                            
-                            # 创建商品
-                            product = Product.objects.create(
-                                name=product_name,
-                                spec=spec,
-                                unit=unit,
-                                code=f"P{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                                is_active=True
-                            )
-                        
-                        # 创建入库记录
-                        transaction_data = {
-                            'warehouse': warehouse,
-                            'product': product,
-                            'transaction_type': 'IN',
-                            'quantity': float(row['数量']),
-                            'unit_price': float(row['单价']),
-                            'amount': float(row['金额']),
-                            'operator': operator,
-                            'transaction_date': pd.to_datetime(row['日期']),
-                            'status': 'completed',
-                            'is_active': True
-                        }
-                        Transaction.objects.create(**transaction_data)
-                        success_count['inbound'] += 1
-                    except Exception as e:
-                        error_records.append(f"入库明细第 {index + 2} 行处理失败: {str(e)}")
-            
-            # 处理库存明细
-            inventory_df = excel_data[self.DEFAULT_SHEET_NAMES['inventory']]
-            if not all(col in inventory_df.columns for col in self.DEFAULT_INVENTORY_COLUMNS):
-                missing_cols = set(self.DEFAULT_INVENTORY_COLUMNS) - set(inventory_df.columns)
-                error_records.append(f'库存明细缺少必要的列: {", ".join(missing_cols)}')
-            else:
-                for index, row in inventory_df.iterrows():
-                    try:
-                        # 处理库存数据
-                        product_name = str(row['品项']).strip()
-                        spec = str(row['规格/型号']).strip()
-                        unit_name = str(row['单位']).strip()
-                        location_code = str(row['位置']).strip()
-                        
-                        # 获取或创建商品
-                        try:
-                            product = Product.objects.get(name=product_name, spec=spec)
-                        except Product.DoesNotExist:
-                            # 获取或创建单位
-                            try:
-                                unit = Unit.objects.get(name=unit_name)
-                            except Unit.DoesNotExist:
-                                unit = Unit.objects.create(
-                                    name=unit_name,
-                                    code=f"U{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                                )
-                            
-                            # 创建商品
-                            product = Product.objects.create(
-                                name=product_name,
-                                spec=spec,
-                                unit=unit,
-                                code=f"P{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                                is_active=True
-                            )
-                        
-                        # 获取或创建库位
-                        try:
-                            location = WarehouseLocation.objects.get(code=location_code, area__warehouse=warehouse)
-                        except WarehouseLocation.DoesNotExist:
-                            # 创建默认库区
-                            default_area = WarehouseArea.objects.create(
-                                warehouse=warehouse,
-                                name='默认库区',
-                                code=f"A{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                                is_active=True
-                            )
-                            # 创建库位
-                            location = WarehouseLocation.objects.create(
-                                area=default_area,
-                                code=location_code,
-                                name=f"库位{location_code}",
-                                is_active=True
-                            )
-                        
-                        # 创建库存记录
-                        inventory_data = {
-                            'warehouse': warehouse,
-                            'product': product,
-                            'location': location,
-                            'quantity': float(row['库存']),
-                            'unit_price': float(row['单价']),
-                            'amount': float(row['库存金额']),
-                            'status': 'normal',
-                            'is_active': True
-                        }
-                        Inventory.objects.create(**inventory_data)
-                        success_count['inventory'] += 1
-                    except Exception as e:
-                        error_records.append(f"库存明细第 {index + 2} 行处理失败: {str(e)}")
+
+            importer.parse(excel_data)
+            warehouse = importer.run(warehouse_name, warehouse_code)
             
             # 返回导入结果
-            response_data = {
-                'message': f'Excel导入完成，成功创建仓库 "{warehouse_name}"',
-                'warehouse_id': warehouse.id,
-                'warehouse_name': warehouse.name,
-                'warehouse_code': warehouse.code,
-                'success_count': {
-                    '出库记录': success_count['outbound'],
-                    '入库记录': success_count['inbound'],
-                    '库存记录': success_count['inventory']
-                }
-            }
-            if error_records:
-                response_data['errors'] = error_records
-            
-            return Response(response_data)
+            return Response(importer.result(warehouse))
             
         except Exception as e:
+            logger.error(f"Excel导入失败: {str(e)}", exc_info=True)
             return Response(
                 {'error': f'Excel导入失败: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -661,84 +357,17 @@ class WarehouseViewSet(viewsets.ModelViewSet):
         try:
             # 获取仓库ID（如果指定）
             warehouse_id = request.query_params.get('warehouse_id')
-            
-            # 准备查询条件
-            query_params = {'is_active': True}
-            if warehouse_id:
-                query_params['warehouse_id'] = warehouse_id
-            
+
+            if run_in_background(request):
+                job = enqueue(jobs.export_excel, {'warehouse_id': warehouse_id}, user=request.user, name='导出库存清单')
+                return job_accepted(request, job)
+
             # 获取库存记录
-            inventory_records = Inventory.objects.filter(
-                **query_params
-            ).select_related(
-                'warehouse',
-                'product',
-                'location'
-            ).order_by('location__code', 'product__code')
-            
-            # 准备数据列表
-            data_list = []
-            for index, record in enumerate(inventory_records, 1):
-                # 获取该商品的入库和出库统计
-                inbound_total = Transaction.objects.filter(
-                    warehouse=record.warehouse,
-                    product=record.product,
-                    transaction_type='IN',
-                    status='completed'
-                ).aggregate(total=models.Sum('quantity'))['total'] or 0
-                
-                outbound_total = Transaction.objects.filter(
-                    warehouse=record.warehouse,
-                    product=record.product,
-                    transaction_type='OUT',
-                    status='completed'
-                ).aggregate(total=models.Sum('quantity'))['total'] or 0
-                
-                # 计算金额
-                unit_price = record.product.price or 0
-                amount = unit_price * record.quantity
-                
-                data_list.append({
-                    '序号': index,
-                    '位置': record.location.code if record.location else '未分配',
-                    '品项': record.product.name,
-                    '规格/型号': record.product.spec or '',
-                    '单位': record.product.unit.name if record.product.unit else '',
-                    '期初库存': record.quantity - inbound_total + outbound_total,  # 当前库存 - 入库 + 出库
-                    '累计入库': inbound_total,
-                    '累计出库': outbound_total,
-                    '库存': record.quantity,
-                    '单价': unit_price,
-                    '金额': amount
-                })
-            
-            # 创建DataFrame
-            df = pd.DataFrame(data_list)
-            
-            # 创建一个BytesIO对象
-            excel_file = io.BytesIO()
-            
-            # 将DataFrame写入Excel
-            df.to_excel(excel_file, index=False, engine='openpyxl')
-            
-            # 设置文件指针到开始
-            excel_file.seek(0)
-            
-            # 生成文件名
-            filename = f'inventory_list_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            
-            # 创建FileResponse
-            response = FileResponse(
-                excel_file,
-                as_attachment=True,
-                filename=filename,
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            
-            # 设置响应头
-            response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+            inventory_records = inventory_list_queryset(warehouse_id)
+
+            response = xlsx_response([inventory_list_sheet(inventory_records)], inventory_list_filename())
             response['Access-Control-Allow-Origin'] = '*'
-            
+
             return response
             
         except Exception as e:
@@ -854,6 +483,8 @@ class WarehouseViewSet(viewsets.ModelViewSet):
 
             if not all([warehouse_id, month, record_type, record_data]):
                 return Response({'error': '缺少必要参数'}, status=status.HTTP_400_BAD_REQUEST)
+            if record_type not in ledger.RECORD_TYPES:
+                return Response({'error': '记录类型错误'}, status=status.HTTP_400_BAD_REQUEST)
 
             # 获取或创建报表
             try:
@@ -871,22 +502,15 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                         title=f"{warehouse.name}_{year}年{month}月报表",
                         warehouse=warehouse,
                         report_date=report_date,
-                        data={
-                            'inbound': [],
-                            'outbound': [],
-                            'inventory': []
-                        },
                         creator=request.user if request.user.is_authenticated else None
                     )
                 
-                # 添加新记录
-                report_data['id'] = str(uuid.uuid4())  # 生成唯一ID
-                report.data[record_type].append(record_data)
-                report.save()
+                # 添加新记录，只写入一行明细
+                record_id = ledger.add_record(report, record_type, {**record_data, 'id': str(uuid.uuid4())})
                 
                 return Response({
                     'message': '创建成功',
-                    'id': report_data['id']
+                    'id': record_id
                 })
                 
             except Warehouse.DoesNotExist:
@@ -920,14 +544,10 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                     report_date=report_date
                 )
                 
-                # 更新记录
-                records = report.data[record_type]
-                for i, record in enumerate(records):
-                    if record['id'] == record_id:
-                        records[i] = {**record_data, 'id': record_id}
-                        break
+                # 更新记录，只更新对应的一行明细
+                if not ledger.update_record(report, record_type, record_id, record_data):
+                    return Response({'error': '记录不存在'}, status=status.HTTP_404_NOT_FOUND)
                 
-                report.save()
                 return Response({'message': '更新成功'})
                 
             except Warehouse.DoesNotExist:
@@ -962,10 +582,9 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                     report_date=report_date
                 )
                 
-                # 删除记录
-                records = report.data[record_type]
-                report.data[record_type] = [r for r in records if r['id'] != record_id]
-                report.save()
+                # 删除记录，只删除对应的一行明细
+                if not ledger.delete_record(report, record_type, record_id):
+                    return Response({'error': '记录不存在'}, status=status.HTTP_404_NOT_FOUND)
                 
                 return Response({'message': '删除成功'})
                 
@@ -1048,21 +667,17 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                     key=report_key,
                     warehouse=warehouse,
                     report_date=report_date,
-                    data={},
                     creator=request.user if hasattr(request, 'user') and request.user.is_authenticated else None
                 )
-            
-            # 更新报表数据
-            report_data = report.data or {}
+            else:
+                report.save(update_fields=['key', 'updated_at'])
             
             # 完全替换入库、出库和库存数据
-            report_data['inbound'] = inbound_data
-            report_data['outbound'] = outbound_data
-            report_data['inventory'] = inventory_data
-            
-            # 保存更新后的数据
-            report.data = report_data
-            report.save()
+            ledger.replace_report_data(report, {
+                'inbound': inbound_data,
+                'outbound': outbound_data,
+                'inventory': inventory_data
+            })
             
             return Response({
                 'status': 'success', 
@@ -1073,10 +688,10 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                     'inventory': inventory_data
                 }
             }, status=status.HTTP_200_OK)
+        except PeriodClosedError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            import traceback
-            print(f"更新月度报表出错: {str(e)}")
-            print(traceback.format_exc())
+            logger.error(f"更新月度报表出错: {str(e)}", exc_info=True)
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
     @action(detail=False, methods=['post'])
@@ -1123,7 +738,7 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                 month_num = int(month_num)
                 
                 # 获取上月报表数据
-                prev_month_data = self.get_monthly_report_data(warehouse, year, month_num)
+                prev_month_data = ledger.get_month_data(warehouse, year, month_num)
                 
                 if not prev_month_data.get('inventory'):
                     return Response({
@@ -1160,20 +775,18 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                 
                 if existing_report:
                     # 更新已有报表
-                    existing_report.data = new_month_data
-                    existing_report.updated_at = datetime.now()
-                    existing_report.save()
+                    ledger.replace_report_data(existing_report, new_month_data)
                     message = f'已更新{target_month}月度报表'
                 else:
                     # 创建新报表
-                    Report.objects.create(
+                    new_report = Report.objects.create(
                         title=report_title,
                         warehouse=warehouse,
                         report_date=report_date,
-                        data=new_month_data,
                         creator=request.user if request.user.is_authenticated else None,
                         description=f"系统自动创建的{target_month}月度报表，基于{prev_month}月数据"
                     )
+                    ledger.replace_report_data(new_report, new_month_data)
                     message = f'已自动创建{target_month}月度报表'
                 
                 return Response({
@@ -1187,6 +800,8 @@ class WarehouseViewSet(viewsets.ModelViewSet):
                     }
                 }, status=status.HTTP_200_OK)
                 
+            except PeriodClosedError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 return Response({
                     'error': f'获取上月报表数据失败: {str(e)}'
@@ -1195,325 +810,6 @@ class WarehouseViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def update_initial_inventory_for_month(self, warehouse_id, month):
-        """
-        更新指定月份报表的期初库存数据，基于上月的期末库存
-        
-        参数:
-            warehouse_id: 仓库ID
-            month: 目标月份，格式：YYYY-MM
-        """
-        try:
-            # 参数校验
-            if not warehouse_id or not month:
-                return {'error': '缺少必要参数'}
-                
-            # 解析月份
-            try:
-                year, month_num = month.split('-')
-                year = int(year)
-                month_num = int(month_num)
-                
-                # 计算上个月的日期
-                first_day_of_month = datetime(year, month_num, 1)
-                last_day_of_prev_month = first_day_of_month - timedelta(days=1)
-                prev_month = last_day_of_prev_month.strftime("%Y-%m")
-                prev_year = last_day_of_prev_month.year
-                prev_month_num = last_day_of_prev_month.month
-                
-                print(f"正在处理月份: 当前月={year}-{month_num}, 上个月={prev_year}-{prev_month_num}")
-            except (ValueError, IndexError) as e:
-                print(f"月份格式解析错误: {str(e)}")
-                return {'error': f'月份格式错误，应为YYYY-MM: {str(e)}'}
-                
-            # 获取仓库对象
-            try:
-                warehouse = Warehouse.objects.get(id=warehouse_id)
-                print(f"已找到仓库: ID={warehouse_id}, 名称={warehouse.name}")
-            except Warehouse.DoesNotExist:
-                print(f"仓库不存在: ID={warehouse_id}")
-                return {'error': f'仓库不存在(ID:{warehouse_id})'}
-                
-            # 检查上月报表是否存在
-            try:
-                from apps.warehouse.models import Report
-                prev_report_date = date(prev_year, prev_month_num, 1)
-                prev_report_exists = Report.objects.filter(
-                    warehouse=warehouse, 
-                    report_date=prev_report_date
-                ).exists()
-                
-                if not prev_report_exists:
-                    print(f"上月报表不存在: {prev_month}")
-                    # 尝试使用库存数据创建上月报表
-                    prev_month_inventory = self._generate_prev_month_inventory(warehouse_id, prev_year, prev_month_num)
-                    if prev_month_inventory and len(prev_month_inventory) > 0:
-                        print(f"已根据库存数据生成上月报表，物品数量: {len(prev_month_inventory)}")
-                        prev_month_data = {
-                            'inbound': [],
-                            'outbound': [],
-                            'inventory': prev_month_inventory
-                        }
-                        self._save_monthly_report_data(warehouse, prev_year, prev_month_num, prev_month_data)
-                    else:
-                        print(f"无法生成上月库存数据或物品数量为0")
-                else:
-                    print(f"已找到上月报表: {prev_month}")
-            except Exception as e:
-                print(f"检查上月报表出错: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-            
-            # 获取上个月的报表数据
-            prev_month_data = self.get_monthly_report_data(warehouse, prev_year, prev_month_num)
-            if not prev_month_data:
-                print(f"上月报表数据为空: {prev_month}")
-                return {'error': f'上个月({prev_month})没有任何报表数据，无法更新本月期初库存'}
-                
-            if 'inventory' not in prev_month_data:
-                print(f"上月报表缺少库存数据: {prev_month}, 报表结构: {list(prev_month_data.keys() if isinstance(prev_month_data, dict) else [])}")
-                return {'error': f'上个月({prev_month})没有库存数据，无法更新本月期初库存'}
-                
-            if not prev_month_data['inventory']:
-                print(f"上月报表库存数据为空数组: {prev_month}")
-                return {'error': f'上个月({prev_month})库存数据为空，无法更新本月期初库存'}
-                
-            print(f"成功获取上月库存数据: {prev_month}, 物品数量: {len(prev_month_data['inventory'])}")
-                
-            # 获取当前月的报表数据
-            current_month_data = self.get_monthly_report_data(warehouse, year, month_num)
-            if not current_month_data:
-                # 如果当前月没有报表数据，则创建一个空的报表数据结构
-                print(f"当前月没有报表数据，创建新的空报表: {year}-{month_num}")
-                current_month_data = {
-                    'inbound': [],
-                    'outbound': [],
-                    'inventory': []
-                }
-            else:
-                print(f"已找到当前月报表数据: {year}-{month_num}")
-                
-            # 更新当前月报表的期初库存
-            self._update_initial_inventory(current_month_data, prev_month_data)
-            
-            # 保存更新后的报表数据
-            save_result = self._save_monthly_report_data(warehouse, year, month_num, current_month_data)
-            if not save_result:
-                return {'error': f'保存更新后的报表数据失败'}
-                
-            return {'success': True, 'message': f'成功更新{year}年{month_num}月的期初库存数据'}
-            
-        except Exception as e:
-            import traceback
-            print(f"更新期初库存出错: {str(e)}")
-            print(traceback.format_exc())
-            return {'error': f'更新期初库存数据出错: {str(e)}'}
-
-    def get_monthly_report_data(self, warehouse, year, month):
-        """
-        获取指定月份的报表数据
-        """
-        try:
-            from apps.warehouse.models import Report
-            
-            # 查询月度报表
-            report_date = date(year, month, 1)
-            try:
-                report = Report.objects.get(warehouse=warehouse, report_date=report_date)
-                # 如果报表存在但内容为空，返回空对象
-                if not report.data or report.data == '{}':
-                    print(f"找到报表但数据为空: {year}-{month}")
-                    return {}
-                print(f"成功获取报表数据: {year}-{month}")
-                return report.data
-            except Report.DoesNotExist:
-                print(f"报表不存在: {year}-{month}")
-                # 如果报表不存在，返回空对象
-                return {}
-                
-        except Exception as e:
-            print(f"获取月度报表数据出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return {}
-
-    def _save_monthly_report_data(self, warehouse, year, month, data):
-        """
-        保存月度报表数据
-        """
-        try:
-            from apps.warehouse.models import Report
-            
-            # 构建报表日期
-            report_date = date(year, month, 1)
-            
-            # 查找或创建报表
-            report, created = Report.objects.get_or_create(
-                warehouse=warehouse,
-                report_date=report_date,
-                defaults={
-                    'title': f"{warehouse.name}_{year}年{month}月报表",
-                    'data': data
-                }
-            )
-            
-            # 如果报表已存在，更新内容
-            if not created:
-                report.title = f"{warehouse.name}_{year}年{month}月报表"
-                report.data = data
-                report.save()
-                print(f"更新已存在的报表: {year}-{month}")
-            else:
-                print(f"创建新报表: {year}-{month}")
-                
-            return True
-                
-        except Exception as e:
-            print(f"保存月度报表数据出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return False
-
-    def _update_initial_inventory(self, current_month_data, prev_month_data):
-        """
-        使用上月期末库存更新当月期初库存
-        """
-        try:
-            # 如果当前月没有库存数据，则初始化
-            if 'inventory' not in current_month_data:
-                current_month_data['inventory'] = []
-                
-            print(f"开始更新期初库存: 当前月有 {len(current_month_data['inventory'])} 条记录，上月有 {len(prev_month_data['inventory'])} 条记录")
-                
-            # 创建当前库存记录的映射，用于快速查找
-            current_inventory_map = {}
-            for item in current_month_data['inventory']:
-                key = f"{item.get('品项')}_{item.get('规格/型号')}"
-                current_inventory_map[key] = item
-                
-            # 处理上月库存数据
-            items_updated = 0
-            items_added = 0
-            
-            for prev_item in prev_month_data['inventory']:
-                try:
-                    product_name = prev_item.get('品项')
-                    spec = prev_item.get('规格/型号', '')
-                    key = f"{product_name}_{spec}"
-                    
-                    # 上月期末库存
-                    prev_ending_stock = float(prev_item.get('库存', 0))
-                    
-                    if key in current_inventory_map:
-                        # 更新已存在的库存记录
-                        current_item = current_inventory_map[key]
-                        
-                        # 保存原始的累计入库和累计出库数量
-                        total_in = float(current_item.get('累计入库', 0))
-                        total_out = float(current_item.get('累计出库', 0))
-                        
-                        # 更新期初库存
-                        current_item['期初库存'] = prev_ending_stock
-                        
-                        # 重新计算当前库存数量
-                        current_item['库存'] = prev_ending_stock + total_in - total_out
-                        
-                        # 更新库存金额
-                        current_item['库存金额'] = float(current_item.get('库存', 0)) * float(current_item.get('单价', 0))
-                        
-                        items_updated += 1
-                    else:
-                        # 创建新的库存记录
-                        new_item = prev_item.copy()
-                        new_item['期初库存'] = prev_ending_stock
-                        new_item['累计入库'] = 0
-                        new_item['累计出库'] = 0
-                        new_item['库存'] = prev_ending_stock  # 初始库存等于期初库存
-                        
-                        current_month_data['inventory'].append(new_item)
-                        current_inventory_map[key] = new_item
-                        
-                        items_added += 1
-                except Exception as e:
-                    print(f"处理物品 [{product_name}] 的期初库存时出错: {str(e)}")
-                    continue
-            
-            print(f"期初库存更新完成: 更新了 {items_updated} 条记录，新增了 {items_added} 条记录")
-            
-        except Exception as e:
-            print(f"更新期初库存过程中出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            
-    def _generate_prev_month_inventory(self, warehouse_id, year, month):
-        """
-        当上月报表不存在时，尝试根据系统当前库存生成上月库存数据
-        """
-        try:
-            print(f"正在尝试为 {year}-{month} 月生成库存数据...")
-            from apps.inventory.models import Inventory
-            
-            # 获取当前系统中的库存数据
-            inventory_records = Inventory.objects.filter(
-                warehouse_id=warehouse_id,
-                is_active=True
-            ).select_related('product', 'location')
-            
-            if not inventory_records.exists():
-                print(f"未找到仓库ID={warehouse_id}的任何库存记录")
-                return []
-            
-            print(f"找到 {inventory_records.count()} 条库存记录，开始生成库存数据")
-                
-            # 转换为报表格式的库存数据
-            inventory_list = []
-            for record in inventory_records:
-                try:
-                    if not record.product:
-                        print(f"库存记录 ID={record.id} 没有关联的产品信息，跳过")
-                        continue
-                        
-                    location_code = '未分配'
-                    if record.location:
-                        location_code = record.location.code
-                        
-                    # 获取产品单位
-                    unit_name = '个'
-                    if hasattr(record.product, 'unit') and record.product.unit:
-                        unit_name = record.product.unit.name
-                        
-                    # 处理规格信息    
-                    spec = record.spec or (record.product.spec if hasattr(record.product, 'spec') else '')
-                    
-                    inventory_item = {
-                        '序号': len(inventory_list) + 1,
-                        '位置': location_code,
-                        '品项': record.product.name,
-                        '规格/型号': spec,
-                        '单位': record.unit or unit_name,
-                        '期初库存': float(record.quantity),  # 使用当前库存作为上月期初
-                        '累计入库': 0,
-                        '累计出库': 0,
-                        '库存': float(record.quantity),  # 当前库存
-                        '单价': float(record.unit_price),
-                        '库存金额': float(record.amount)
-                    }
-                    
-                    inventory_list.append(inventory_item)
-                    
-                except Exception as e:
-                    print(f"处理单个库存记录时出错: {str(e)}")
-                    continue
-                
-            print(f"成功生成库存记录 {len(inventory_list)} 条")
-            return inventory_list
-            
-        except Exception as e:
-            print(f"生成上月库存数据出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return []
-
     @action(detail=True, methods=['post'])
     def update_initial_stock(self, request, pk=None):
         """
@@ -1528,8 +824,8 @@ class WarehouseViewSet(viewsets.ModelViewSet):
             if not month:
                 return Response({'error': '缺少月份参数'}, status=status.HTTP_400_BAD_REQUEST)
                 
-            # 调用内部方法更新期初库存
-            result = self.update_initial_inventory_for_month(warehouse.id, month)
+            # 用上月期末库存更新期初库存
+            result = update_opening_balances(warehouse.id, month)
             
             if 'error' in result:
                 return Response({'error': result['error']}, status=status.HTTP_400_BAD_REQUEST)
@@ -1540,206 +836,109 @@ class WarehouseViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
-            import traceback
-            print(f"更新期初库存失败: {str(e)}")
-            print(traceback.format_exc())
+            logger.error(f"更新期初库存失败: {str(e)}", exc_info=True)
             return Response({'error': f'更新期初库存失败: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['post'])
+    def close_month(self, request, pk=None):
+        """
+        月结：把指定月份的期末库存写入结存快照并结转到下月报表，结账后该月不能再修改，只允许3级用户操作
+
+        参数: month 结账月份，格式YYYY-MM
+        """
+        if request.user.level < 3:
+            return Response({'error': '权限不足，月结需要3级权限'}, status=status.HTTP_403_FORBIDDEN)
+        warehouse = self.get_object()
+        try:
+            month = datetime.strptime(f"{request.data.get('month')}-01", "%Y-%m-%d").date()
+        except ValueError:
+            return Response({'error': '月份格式错误，应为YYYY-MM'}, status=status.HTTP_400_BAD_REQUEST)
+
+        record = close_warehouse(warehouse.id, month)
+        if record.status == 'failed':
+            return Response({'error': f'月结失败: {record.message}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'status': record.status,
+            'month': month.strftime('%Y-%m'),
+            'counts': record.counts,
+            'message': record.message or f"{month:%Y-%m}已结账",
+        })
+
+    @action(detail=True, methods=['post'])
+    def reopen_month(self, request, pk=None):
+        """
+        反结账：删除指定月份的结存快照，该月恢复为可修改，只允许3级用户操作
+
+        参数: month 月份，格式YYYY-MM
+        """
+        if request.user.level < 3:
+            return Response({'error': '权限不足，反结账需要3级权限'}, status=status.HTTP_403_FORBIDDEN)
+        warehouse = self.get_object()
+        try:
+            month = datetime.strptime(f"{request.data.get('month')}-01", "%Y-%m-%d").date()
+        except ValueError:
+            return Response({'error': '月份格式错误，应为YYYY-MM'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            reopen_warehouse(warehouse.id, month)
+        except PeriodClosedError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': f"{month:%Y-%m}已反结账"})
+
     @action(detail=True, methods=['get'])
     def backup(self, request, pk=None):
         """
         备份仓库数据
+
+        以流的方式输出备份文件，支持参数：
+        - backup_format: json（默认，与原备份文件结构相同）或 ndjson
+        - compress: gzip 时输出gzip压缩文件
+        - async: 1 时提交为后台任务，完成后通过任务接口下载备份文件
         """
         try:
             logger.info(f"开始备份仓库数据处理: warehouse_id={pk}, 请求来源={request.META.get('REMOTE_ADDR')}")
             warehouse = self.get_object()
-            logger.info(f"成功获取仓库信息: warehouse_id={pk}, name={warehouse.name}, code={warehouse.code}")
-            
-            # 获取仓库相关的所有数据
-            data = {
-                'warehouse': WarehouseSerializer(warehouse).data,
-                'inventory': [],
-                'transactions': [],
-                'reports': [],
-                'backup_time': timezone.now().isoformat()
-            }
-            logger.info(f"已初始化备份数据结构: warehouse_id={pk}")
-            
-            # 获取库存数据
-            try:
-                logger.info(f"开始查询库存数据: warehouse_id={pk}")
-                inventory_items = Inventory.objects.filter(
-                    warehouse=warehouse,
-                    is_active=True  # 使用 is_active 字段
-                ).select_related('product', 'location')
-                
-                logger.info(f"查询到库存记录数: warehouse_id={pk}, count={inventory_items.count()}")
-                
-                data['inventory'] = []
-                inventory_count = 0
-                error_count = 0
-                
-                for item in inventory_items:
-                    try:
-                        # 安全地获取产品信息
-                        product = item.product
-                        if not product:
-                            logger.warning(f"库存记录 {item.id} 没有关联的产品信息, warehouse_id={pk}")
-                            continue
-                            
-                        # 获取产品属性
-                        spec = ''
-                        unit = '个'
-                        try:
-                            spec = product.spec
-                        except AttributeError:
-                            logger.debug(f"产品 {product.id} 没有spec属性，尝试使用specification属性")
-                            try:
-                                spec = product.specification
-                            except AttributeError:
-                                logger.debug(f"产品 {product.id} 没有specification属性")
-                                pass
-                                
-                        try:
-                            if hasattr(product, 'unit') and isinstance(product.unit, str):
-                                unit = product.unit
-                            elif hasattr(product, 'unit') and hasattr(product.unit, 'name'):
-                                unit = product.unit.name
-                        except Exception as e:
-                            logger.debug(f"获取产品 {product.id} 单位信息出错: {str(e)}")
-                            pass
-                            
-                        inventory_data = {
-                            'location': item.location.code if item.location else None,
-                            'product': product.name,
-                            'specification': spec,
-                            'unit': unit,
-                            'quantity': str(item.quantity or 0),
-                            'unit_price': str(item.unit_price or 0),
-                            'total_value': str(item.amount or 0),  # 使用 amount 字段
-                        }
-                        data['inventory'].append(inventory_data)
-                        inventory_count += 1
-                        if inventory_count % 100 == 0:
-                            logger.info(f"已处理 {inventory_count} 条库存记录")
-                    except Exception as e:
-                        error_count += 1
-                        logger.error(f"处理单个库存记录时出错: inventory_id={item.id}, error={str(e)}", exc_info=True)
-                        continue
-                        
-                logger.info(f"成功获取库存数据: warehouse_id={pk}, 成功={inventory_count}条, 失败={error_count}条")
-            except Exception as e:
-                logger.error(f"获取库存数据时出错: warehouse_id={pk}, error={str(e)}", exc_info=True)
-                data['inventory'] = []
-            
-            # 获取交易记录
-            try:
-                logger.info(f"开始查询交易记录: warehouse_id={pk}")
-                transactions = Transaction.objects.filter(
-                    warehouse=warehouse,
-                    status='completed'  # 使用 status 字段
-                ).select_related('product')
-                
-                logger.info(f"查询到交易记录数: warehouse_id={pk}, count={transactions.count()}")
-                
-                data['transactions'] = []
-                transaction_count = 0
-                error_count = 0
-                
-                for transaction in transactions:
-                    try:
-                        # 安全地获取产品信息
-                        product = transaction.product
-                        if not product:
-                            logger.warning(f"交易记录 {transaction.id} 没有关联的产品信息")
-                            continue
-                            
-                        # 获取产品属性
-                        spec = ''
-                        unit = '个'
-                        try:
-                            spec = product.spec
-                        except AttributeError:
-                            try:
-                                spec = product.specification
-                            except AttributeError:
-                                pass
-                                
-                        try:
-                            if hasattr(product, 'unit') and isinstance(product.unit, str):
-                                unit = product.unit
-                            elif hasattr(product, 'unit') and hasattr(product.unit, 'name'):
-                                unit = product.unit.name
-                        except Exception as e:
-                            logger.debug(f"获取产品 {product.id} 单位信息出错: {str(e)}")
-                            pass
-                            
-                        transaction_data = {
-                            'date': transaction.transaction_date.isoformat() if transaction.transaction_date else None,
-                            'type': transaction.transaction_type,
-                            'product': product.name,
-                            'specification': spec,
-                            'unit': unit,
-                            'quantity': str(transaction.quantity or 0),
-                            'unit_price': str(transaction.unit_price or 0),
-                            'total_value': str(transaction.amount or 0),  # 使用 amount 字段
-                            'handler': transaction.operator.username if transaction.operator else '',  # 使用 operator 字段
-                        }
-                        data['transactions'].append(transaction_data)
-                        transaction_count += 1
-                        if transaction_count % 100 == 0:
-                            logger.info(f"已处理 {transaction_count} 条交易记录")
-                    except Exception as e:
-                        error_count += 1
-                        logger.error(f"处理单个交易记录时出错: transaction_id={transaction.id}, error={str(e)}", exc_info=True)
-                        continue
-                        
-                logger.info(f"成功获取交易记录: warehouse_id={pk}, 成功={transaction_count}条, 失败={error_count}条")
-            except Exception as e:
-                logger.error(f"获取交易记录时出错: warehouse_id={pk}, error={str(e)}", exc_info=True)
-                data['transactions'] = []
-            
-            # 获取报表数据
-            try:
-                logger.info(f"开始获取报表数据: warehouse_id={pk}")
-                reports = Report.objects.filter(warehouse=warehouse)
-                data['reports'] = ReportSerializer(reports, many=True).data
-                logger.info(f"成功获取报表数据: warehouse_id={pk}, 共{len(data['reports'])}条记录")
-            except Exception as e:
-                logger.error(f"获取报表数据时出错: warehouse_id={pk}, error={str(e)}", exc_info=True)
-                data['reports'] = []
-            
-            # 将数据转换为JSON并返回
-            try:
-                logger.info(f"开始生成JSON备份文件: warehouse_id={pk}")
-                try:
-                    data_size = len(str(data))
-                    logger.info(f"备份数据大小估计: warehouse_id={pk}, size={data_size}字节")
-                except Exception as size_e:
-                    logger.warning(f"无法估计备份数据大小: {str(size_e)}")
-                
-                json_data = json.dumps(data, ensure_ascii=False, indent=2)
-                logger.info(f"JSON序列化完成: warehouse_id={pk}, size={len(json_data)}字节")
-                
-                response = HttpResponse(json_data, content_type='application/json')
-                filename = f'warehouse_{warehouse.code}_backup_{timezone.now().strftime("%Y%m%d_%H%M%S")}.json'
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                
-                # 添加额外的响应头，确保浏览器正确处理
-                response['Access-Control-Expose-Headers'] = 'Content-Disposition'
-                response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                response['Pragma'] = 'no-cache'
-                response['Expires'] = '0'
-                
-                logger.info(f"备份数据生成成功: warehouse_id={pk}, filename={filename}, size={len(json_data)}字节")
-                return response
-            except Exception as e:
-                logger.error(f"生成备份文件时出错: warehouse_id={pk}, error={str(e)}", exc_info=True)
+
+            backup_format = request.query_params.get('backup_format', 'json')
+            if backup_format not in BACKUP_FORMATS:
                 return Response(
-                    {'error': f'生成备份文件失败: {str(e)}'}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    {'error': f'不支持的备份格式: {backup_format}'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-            
+            compress = request.query_params.get('compress') == 'gzip'
+
+            if run_in_background(request):
+                job = enqueue(
+                    jobs.backup,
+                    {'warehouse_id': warehouse.id, 'backup_format': backup_format, 'compress': compress},
+                    user=request.user,
+                    name=f'备份仓库 {warehouse.name}'
+                )
+                return job_accepted(request, job)
+
+            filename = backup_filename(warehouse, backup_format, compress)
+            if compress:
+                content_type = 'application/gzip'
+            elif backup_format == 'ndjson':
+                content_type = 'application/x-ndjson'
+            else:
+                content_type = 'application/json'
+
+            response = StreamingHttpResponse(
+                WarehouseBackup(warehouse).stream(backup_format, compress=compress),
+                content_type=content_type
+            )
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+            # 添加额外的响应头，确保浏览器正确处理
+            response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+            response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+            response['Pragma'] = 'no-cache'
+            response['Expires'] = '0'
+
+            logger.info(f"开始输出备份数据: warehouse_id={pk}, filename={filename}")
+            return response
+
         except Http404:
             logger.error(f"仓库不存在: warehouse_id={pk}")
             return Response(
@@ -1748,9 +947,6 @@ class WarehouseViewSet(viewsets.ModelViewSet):
             )
         except Exception as e:
             logger.error(f"备份仓库数据失败: warehouse_id={pk}, error={str(e)}", exc_info=True)
-            import traceback
-            trace = traceback.format_exc()
-            logger.error(f"详细错误堆栈: {trace}")
             return Response(
                 {'error': f'备份失败: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -1760,79 +956,35 @@ class WarehouseViewSet(viewsets.ModelViewSet):
     def restore(self, request, pk=None):
         """
         从备份恢复仓库数据
+
+        请求体为备份文件内容，json、ndjson及其gzip压缩格式均可；
+        带?async=1时提交为后台任务，立即返回任务ID
         """
         try:
             warehouse = self.get_object()
-            backup_data = request.data
-            
-            if not isinstance(backup_data, dict):
-                return Response({'error': '无效的备份数据格式'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            with transaction.atomic():
-                # 验证备份数据中的仓库信息
-                if backup_data.get('warehouse', {}).get('code') != warehouse.code:
-                    return Response({'error': '备份数据与目标仓库不匹配'}, status=status.HTTP_400_BAD_REQUEST)
-                
-                # 清除现有数据
-                Inventory.objects.filter(warehouse=warehouse).delete()
-                Transaction.objects.filter(warehouse=warehouse).delete()
-                Report.objects.filter(warehouse=warehouse).delete()
-                
-                # 恢复库存数据
-                for item in backup_data.get('inventory', []):
-                    location = None
-                    if item.get('location'):
-                        location = WarehouseLocation.objects.filter(code=item['location'], warehouse=warehouse).first()
-                    
-                    product = Product.objects.filter(name=item['product']).first()
-                    if not product:
-                        product = Product.objects.create(
-                            name=item['product'],
-                            specification=item.get('specification', ''),
-                            unit=item.get('unit', '个')
-                        )
-                    
-                    Inventory.objects.create(
-                        warehouse=warehouse,
-                        location=location,
-                        product=product,
-                        quantity=item['quantity'],
-                        unit_price=item['unit_price'],
-                        total_value=item['total_value']
-                    )
-                
-                # 恢复交易记录
-                for trans in backup_data.get('transactions', []):
-                    product = Product.objects.filter(name=trans['product']).first()
-                    if not product:
-                        product = Product.objects.create(
-                            name=trans['product'],
-                            specification=trans.get('specification', ''),
-                            unit=trans.get('unit', '个')
-                        )
-                    
-                    Transaction.objects.create(
-                        warehouse=warehouse,
-                        transaction_date=timezone.parse_datetime(trans['date']) if trans.get('date') else None,
-                        transaction_type=trans['type'],
-                        product=product,
-                        quantity=trans['quantity'],
-                        unit_price=trans['unit_price'],
-                        total_value=trans['total_value'],
-                        handler=trans['handler']
-                    )
-                
-                # 恢复报表数据
-                for report_data in backup_data.get('reports', []):
-                    report_data['warehouse'] = warehouse.id
-                    serializer = ReportSerializer(data=report_data)
-                    if serializer.is_valid():
-                        serializer.save()
-                
-                return Response({'message': '恢复备份成功'}, status=status.HTTP_200_OK)
-                
+
+            # 后台恢复时保存原始请求体，由任务解析
+            if run_in_background(request):
+                job = enqueue(
+                    jobs.restore,
+                    {'warehouse_id': warehouse.id},
+                    user=request.user,
+                    name=f'恢复仓库 {warehouse.name}',
+                    input_file=request.body,
+                    input_filename=f'warehouse_{warehouse.code}_restore.json'
+                )
+                return job_accepted(request, job)
+
+            restorer = WarehouseRestorer(warehouse)
+            restorer.parse(load_backup(io.BytesIO(request.body)))
+            counts = restorer.run()
+            return Response({'message': '恢复备份成功', 'counts': counts}, status=status.HTTP_200_OK)
+
+        except RestoreError as e:
+            logger.warning(f"恢复备份失败: warehouse_id={pk}, error={str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            logger.error(f"恢复备份失败: {str(e)}")
+            logger.error(f"恢复备份失败: {str(e)}", exc_info=True)
             return Response({'error': f'恢复失败: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class WarehouseAreaViewSet(viewsets.ModelViewSet):
@@ -1858,12 +1010,18 @@ class ReportViewSet(viewsets.ModelViewSet):
     报表管理视图集
     提供报表的CRUD功能
     """
-    queryset = Report.objects.all().order_by('-created_at')
+    queryset = Report.objects.select_related('creator', 'warehouse').defer('data').order_by('-created_at')
     serializer_class = ReportSerializer
     permission_classes = [WarehouseViewPermission]
     filterset_fields = ['warehouse', 'report_date', 'creator']
     search_fields = ['title', 'description']
 
+    def get_serializer_class(self):
+        """列表只返回报表摘要，完整内容通过详情接口获取"""
+        if self.action == 'list':
+            return ReportSummarySerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
         """根据查询参数过滤报表"""
         queryset = super().get_queryset()
@@ -1873,17 +1031,29 @@ class ReportViewSet(viewsets.ModelViewSet):
         if warehouse_id:
             queryset = queryset.filter(warehouse_id=warehouse_id)
             
-        # 按月份过滤
+        # 按月份过滤，使用日期范围以便命中(仓库, 报表日期)索引
         month = self.request.query_params.get('month')
         if month:
             try:
                 year, month = month.split('-')
+                first_day = date(int(year), int(month), 1)
                 queryset = queryset.filter(
-                    report_date__year=int(year), 
-                    report_date__month=int(month)
+                    report_date__gte=first_day,
+                    report_date__lt=first_day + relativedelta(months=1)
                 )
             except ValueError:
                 pass
+
+        # 按日期范围过滤
+        try:
+            start_date = parse_date(self.request.query_params.get('start_date') or '')
+            end_date = parse_date(self.request.query_params.get('end_date') or '')
+        except ValueError:
+            start_date = end_date = None
+        if start_date:
+            queryset = queryset.filter(report_date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(report_date__lte=end_date)
                 
         return queryset
 
@@ -1891,6 +1061,16 @@ class ReportViewSet(viewsets.ModelViewSet):
         """创建报表时设置创建者"""
         serializer.save(creator=self.request.user)
 
+    def perform_destroy(self, instance):
+        ledger.ensure_report_open(instance)
+        instance.delete()
+
+    def handle_exception(self, exc):
+        # 修改已结账月份的报表
+        if isinstance(exc, PeriodClosedError):
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().handle_exception(exc)
+
 class MonthlyReportViewSet(viewsets.ViewSet):
     """
     月度报表视图集
@@ -1900,10 +1080,14 @@ class MonthlyReportViewSet(viewsets.ViewSet):
     
     # 添加基本查询方法
     def list(self, request):
-        """获取月度报表列表"""
+        """
+        获取月度报表列表
+        传入record_type时只返回该类明细，支持keyword按品项过滤，并按page/page_size分页
+        """
         try:
             warehouse_id = request.query_params.get('warehouse_id')
             month = request.query_params.get('month')
+            record_type = request.query_params.get('record_type')
             
             if not warehouse_id or not month:
                 return Response({'error': '缺少必要参数'}, status=status.HTTP_400_BAD_REQUEST)
@@ -1920,25 +1104,51 @@ class MonthlyReportViewSet(viewsets.ViewSet):
             except Warehouse.DoesNotExist:
                 return Response({'error': '仓库不存在'}, status=status.HTTP_404_NOT_FOUND)
             
-            # 获取月度报表数据
-            monthly_data = self.get_monthly_report_data(warehouse, year, month_num)
+            if record_type:
+                return self._list_ledger_lines(request, warehouse, year, month_num, record_type)
+            
+            report = Report.objects.filter(
+                warehouse=warehouse,
+                report_date=date(year, month_num, 1)
+            ).only('id', 'updated_at').first()
             
             # 如果没有数据，返回空对象而不是错误
-            if not monthly_data:
-                monthly_data = {
-                    'inbound': [],
-                    'outbound': [],
-                    'inventory': []
-                }
+            if report is None:
+                return Response({'inbound': [], 'outbound': [], 'inventory': []}, status=status.HTTP_200_OK)
             
-            return Response(monthly_data, status=status.HTTP_200_OK)
+            # 报表未变化时直接返回304，不读取明细
+            not_modified = report_not_modified(request, report)
+            if not_modified is not None:
+                return not_modified
+            
+            monthly_data = ledger.get_report_data(report)
+            return with_report_etag(Response(monthly_data, status=status.HTTP_200_OK), report)
             
         except Exception as e:
-            import traceback
-            print(f"获取月度报表失败: {str(e)}")
-            print(traceback.format_exc())
+            logger.error(f"获取月度报表失败: {str(e)}", exc_info=True)
             return Response({'error': f'获取月度报表失败: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _list_ledger_lines(self, request, warehouse, year, month, record_type):
+        """在数据库端过滤并分页读取某一类报表明细"""
+        if record_type not in ledger.RECORD_TYPES:
+            return Response({'error': '记录类型错误'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        lines = MonthlyLedgerLine.objects.filter(
+            warehouse=warehouse,
+            month=date(year, month, 1),
+            record_type=record_type
+        ).order_by('position', 'id')
+        
+        keyword = request.query_params.get('keyword')
+        if keyword:
+            lines = lines.filter(Q(product__icontains=keyword) | Q(spec__icontains=keyword))
+        
+        paginator = PageNumberPagination()
+        paginator.page_size_query_param = 'page_size'
+        paginator.max_page_size = 1000
+        page = paginator.paginate_queryset(lines, request, view=self)
+        return paginator.get_paginated_response([ledger.line_to_record(line) for line in page])
+
     @action(detail=False, methods=['post'])
     def update_initial_stock(self, request):
         """
@@ -1953,8 +1163,8 @@ class MonthlyReportViewSet(viewsets.ViewSet):
             if not warehouse_id or not month:
                 return Response({'error': '缺少必要参数'}, status=status.HTTP_400_BAD_REQUEST)
                 
-            # 调用内部方法更新期初库存
-            result = self.update_initial_inventory_for_month(warehouse_id, month)
+            # 用上月期末库存更新期初库存
+            result = update_opening_balances(warehouse_id, month)
             
             if 'error' in result:
                 return Response({'error': result['error']}, status=status.HTTP_400_BAD_REQUEST)
@@ -1965,326 +1175,5 @@ class MonthlyReportViewSet(viewsets.ViewSet):
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
-            import traceback
-            print(f"更新期初库存失败: {str(e)}")
-            print(traceback.format_exc())
+            logger.error(f"更新期初库存失败: {str(e)}", exc_info=True)
             return Response({'error': f'更新期初库存失败: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-    def get_monthly_report_data(self, warehouse, year, month):
-        """
-        获取指定月份的报表数据
-        """
-        try:
-            from apps.warehouse.models import Report
-            
-            # 查询月度报表
-            report_date = date(year, month, 1)
-            try:
-                report = Report.objects.get(warehouse=warehouse, report_date=report_date)
-                # 如果报表存在但内容为空，返回空对象
-                if not report.data or report.data == '{}':
-                    print(f"找到报表但数据为空: {year}-{month}")
-                    return {}
-                print(f"成功获取报表数据: {year}-{month}")
-                return report.data
-            except Report.DoesNotExist:
-                print(f"报表不存在: {year}-{month}")
-                # 如果报表不存在，返回空对象
-                return {}
-                
-        except Exception as e:
-            print(f"获取月度报表数据出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return {}
-
-    def _save_monthly_report_data(self, warehouse, year, month, data):
-        """
-        保存月度报表数据
-        """
-        try:
-            from apps.warehouse.models import Report
-            
-            # 构建报表日期
-            report_date = date(year, month, 1)
-            
-            # 查找或创建报表
-            report, created = Report.objects.get_or_create(
-                warehouse=warehouse,
-                report_date=report_date,
-                defaults={
-                    'title': f"{warehouse.name}_{year}年{month}月报表",
-                    'data': data
-                }
-            )
-            
-            # 如果报表已存在，更新内容
-            if not created:
-                report.title = f"{warehouse.name}_{year}年{month}月报表"
-                report.data = data
-                report.save()
-                print(f"更新已存在的报表: {year}-{month}")
-            else:
-                print(f"创建新报表: {year}-{month}")
-                
-            return True
-                
-        except Exception as e:
-            print(f"保存月度报表数据出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return False
-
-    def _update_initial_inventory(self, current_month_data, prev_month_data):
-        """
-        使用上月期末库存更新当月期初库存
-        """
-        try:
-            # 如果当前月没有库存数据，则初始化
-            if 'inventory' not in current_month_data:
-                current_month_data['inventory'] = []
-                
-            print(f"开始更新期初库存: 当前月有 {len(current_month_data['inventory'])} 条记录，上月有 {len(prev_month_data['inventory'])} 条记录")
-                
-            # 创建当前库存记录的映射，用于快速查找
-            current_inventory_map = {}
-            for item in current_month_data['inventory']:
-                key = f"{item.get('品项')}_{item.get('规格/型号')}"
-                current_inventory_map[key] = item
-                
-            # 处理上月库存数据
-            items_updated = 0
-            items_added = 0
-            
-            for prev_item in prev_month_data['inventory']:
-                try:
-                    product_name = prev_item.get('品项')
-                    spec = prev_item.get('规格/型号', '')
-                    key = f"{product_name}_{spec}"
-                    
-                    # 上月期末库存
-                    prev_ending_stock = float(prev_item.get('库存', 0))
-                    
-                    if key in current_inventory_map:
-                        # 更新已存在的库存记录
-                        current_item = current_inventory_map[key]
-                        
-                        # 保存原始的累计入库和累计出库数量
-                        total_in = float(current_item.get('累计入库', 0))
-                        total_out = float(current_item.get('累计出库', 0))
-                        
-                        # 更新期初库存
-                        current_item['期初库存'] = prev_ending_stock
-                        
-                        # 重新计算当前库存数量
-                        current_item['库存'] = prev_ending_stock + total_in - total_out
-                        
-                        # 更新库存金额
-                        current_item['库存金额'] = float(current_item.get('库存', 0)) * float(current_item.get('单价', 0))
-                        
-                        items_updated += 1
-                    else:
-                        # 创建新的库存记录
-                        new_item = prev_item.copy()
-                        new_item['期初库存'] = prev_ending_stock
-                        new_item['累计入库'] = 0
-                        new_item['累计出库'] = 0
-                        new_item['库存'] = prev_ending_stock  # 初始库存等于期初库存
-                        
-                        current_month_data['inventory'].append(new_item)
-                        current_inventory_map[key] = new_item
-                        
-                        items_added += 1
-                except Exception as e:
-                    print(f"处理物品 [{product_name}] 的期初库存时出错: {str(e)}")
-                    continue
-            
-            print(f"期初库存更新完成: 更新了 {items_updated} 条记录，新增了 {items_added} 条记录")
-            
-        except Exception as e:
-            print(f"更新期初库存过程中出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            
-    def _generate_prev_month_inventory(self, warehouse_id, year, month):
-        """
-        当上月报表不存在时，尝试根据系统当前库存生成上月库存数据
-        """
-        try:
-            print(f"正在尝试为 {year}-{month} 月生成库存数据...")
-            from apps.inventory.models import Inventory
-            
-            # 获取当前系统中的库存数据
-            inventory_records = Inventory.objects.filter(
-                warehouse_id=warehouse_id,
-                is_active=True
-            ).select_related('product', 'location')
-            
-            if not inventory_records.exists():
-                print(f"未找到仓库ID={warehouse_id}的任何库存记录")
-                return []
-            
-            print(f"找到 {inventory_records.count()} 条库存记录，开始生成库存数据")
-                
-            # 转换为报表格式的库存数据
-            inventory_list = []
-            for record in inventory_records:
-                try:
-                    if not record.product:
-                        print(f"库存记录 ID={record.id} 没有关联的产品信息，跳过")
-                        continue
-                        
-                    location_code = '未分配'
-                    if record.location:
-                        location_code = record.location.code
-                        
-                    # 获取产品单位
-                    unit_name = '个'
-                    if hasattr(record.product, 'unit') and record.product.unit:
-                        unit_name = record.product.unit.name
-                        
-                    # 处理规格信息    
-                    spec = record.spec or (record.product.spec if hasattr(record.product, 'spec') else '')
-                    
-                    inventory_item = {
-                        '序号': len(inventory_list) + 1,
-                        '位置': location_code,
-                        '品项': record.product.name,
-                        '规格/型号': spec,
-                        '单位': record.unit or unit_name,
-                        '期初库存': float(record.quantity),  # 使用当前库存作为上月期初
-                        '累计入库': 0,
-                        '累计出库': 0,
-                        '库存': float(record.quantity),  # 当前库存
-                        '单价': float(record.unit_price),
-                        '库存金额': float(record.amount)
-                    }
-                    
-                    inventory_list.append(inventory_item)
-                    
-                except Exception as e:
-                    print(f"处理单个库存记录时出错: {str(e)}")
-                    continue
-                
-            print(f"成功生成库存记录 {len(inventory_list)} 条")
-            return inventory_list
-            
-        except Exception as e:
-            print(f"生成上月库存数据出错: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            return []
-
-    def update_initial_inventory_for_month(self, warehouse_id, month):
-        """
-        更新指定月份报表的期初库存数据，基于上月的期末库存
-        
-        参数:
-            warehouse_id: 仓库ID
-            month: 目标月份，格式：YYYY-MM
-        """
-        try:
-            # 参数校验
-            if not warehouse_id or not month:
-                return {'error': '缺少必要参数'}
-                
-            # 解析月份
-            try:
-                year, month_num = month.split('-')
-                year = int(year)
-                month_num = int(month_num)
-                
-                # 计算上个月的日期
-                first_day_of_month = datetime(year, month_num, 1)
-                last_day_of_prev_month = first_day_of_month - timedelta(days=1)
-                prev_month = last_day_of_prev_month.strftime("%Y-%m")
-                prev_year = last_day_of_prev_month.year
-                prev_month_num = last_day_of_prev_month.month
-                
-                print(f"正在处理月份: 当前月={year}-{month_num}, 上个月={prev_year}-{prev_month_num}")
-            except (ValueError, IndexError) as e:
-                print(f"月份格式解析错误: {str(e)}")
-                return {'error': f'月份格式错误，应为YYYY-MM: {str(e)}'}
-                
-            # 获取仓库对象
-            try:
-                warehouse = Warehouse.objects.get(id=warehouse_id)
-                print(f"已找到仓库: ID={warehouse_id}, 名称={warehouse.name}")
-            except Warehouse.DoesNotExist:
-                print(f"仓库不存在: ID={warehouse_id}")
-                return {'error': f'仓库不存在(ID:{warehouse_id})'}
-                
-            # 检查上月报表是否存在
-            try:
-                from apps.warehouse.models import Report
-                prev_report_date = date(prev_year, prev_month_num, 1)
-                prev_report_exists = Report.objects.filter(
-                    warehouse=warehouse, 
-                    report_date=prev_report_date
-                ).exists()
-                
-                if not prev_report_exists:
-                    print(f"上月报表不存在: {prev_month}")
-                    # 尝试使用库存数据创建上月报表
-                    prev_month_inventory = self._generate_prev_month_inventory(warehouse_id, prev_year, prev_month_num)
-                    if prev_month_inventory and len(prev_month_inventory) > 0:
-                        print(f"已根据库存数据生成上月报表，物品数量: {len(prev_month_inventory)}")
-                        prev_month_data = {
-                            'inbound': [],
-                            'outbound': [],
-                            'inventory': prev_month_inventory
-                        }
-                        self._save_monthly_report_data(warehouse, prev_year, prev_month_num, prev_month_data)
-                    else:
-                        print(f"无法生成上月库存数据或物品数量为0")
-                else:
-                    print(f"已找到上月报表: {prev_month}")
-            except Exception as e:
-                print(f"检查上月报表出错: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-            
-            # 获取上个月的报表数据
-            prev_month_data = self.get_monthly_report_data(warehouse, prev_year, prev_month_num)
-            if not prev_month_data:
-                print(f"上月报表数据为空: {prev_month}")
-                return {'error': f'上个月({prev_month})没有任何报表数据，无法更新本月期初库存'}
-                
-            if 'inventory' not in prev_month_data:
-                print(f"上月报表缺少库存数据: {prev_month}, 报表结构: {list(prev_month_data.keys() if isinstance(prev_month_data, dict) else [])}")
-                return {'error': f'上个月({prev_month})没有库存数据，无法更新本月期初库存'}
-                
-            if not prev_month_data['inventory']:
-                print(f"上月报表库存数据为空数组: {prev_month}")
-                return {'error': f'上个月({prev_month})库存数据为空，无法更新本月期初库存'}
-                
-            print(f"成功获取上月库存数据: {prev_month}, 物品数量: {len(prev_month_data['inventory'])}")
-                
-            # 获取当前月的报表数据
-            current_month_data = self.get_monthly_report_data(warehouse, year, month_num)
-            if not current_month_data:
-                # 如果当前月没有报表数据，则创建一个空的报表数据结构
-                print(f"当前月没有报表数据，创建新的空报表: {year}-{month_num}")
-                current_month_data = {
-                    'inbound': [],
-                    'outbound': [],
-                    'inventory': []
-                }
-            else:
-                print(f"已找到当前月报表数据: {year}-{month_num}")
-                
-            # 更新当前月报表的期初库存
-            self._update_initial_inventory(current_month_data, prev_month_data)
-            
-            # 保存更新后的报表数据
-            save_result = self._save_monthly_report_data(warehouse, year, month_num, current_month_data)
-            if not save_result:
-                return {'error': f'保存更新后的报表数据失败'}
-                
-            return {'success': True, 'message': f'成功更新{year}年{month_num}月的期初库存数据'}
-            
-        except Exception as e:
-            import traceback
-            print(f"更新期初库存出错: {str(e)}")
-            print(traceback.format_exc())
-            return {'error': f'更新期初库存数据出错: {str(e)}'}
\ No newline at end of file
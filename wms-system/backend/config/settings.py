@@ -4,6 +4,7 @@ Django settings for wms project.
 
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -40,10 +41,14 @@ INSTALLED_APPS = [
     'apps.inventory',
     'apps.product',
     'apps.order',
+    'apps.job',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'utils.middleware.RequestMetricsMiddleware',
+    'utils.middleware.StatementTimeoutMiddleware',
+    'utils.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,40 +81,72 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-# 数据库配置 - 使用SQLite
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# 数据库配置
+# DB_ENGINE选择数据库：sqlite（默认）、postgresql、mysql，也可以写完整的后端路径如django.db.backends.postgresql
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite').rsplit('.', 1)[-1]
+if DB_ENGINE == 'sqlite3':
+    DB_ENGINE = 'sqlite'
+
+# SQLITE_TUNED=True时启用WAL等连接参数（见utils/db.py）并默认复用连接
+SQLITE_TUNED = os.getenv('SQLITE_TUNED', 'False') == 'True'
+# 写锁等待时间（毫秒）
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+# 内存映射大小（字节）
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+# 每个连接的页缓存大小（KiB）
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', 64 * 1024))
+
+# 连接保持的秒数，0为每个请求结束后关闭；PostgreSQL/MySQL和调优后的SQLite默认复用连接
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 0 if DB_ENGINE == 'sqlite' and not SQLITE_TUNED else 600))
+# API请求中单条SQL的超时（毫秒），0为不限制；只对PostgreSQL/MySQL生效，管理命令和后台任务不受限制
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'wms_db'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # 复用连接前检查连接是否可用，数据库重启后不会把断开的连接交给请求
+            'CONN_HEALTH_CHECKS': True,
+            # .iterator()默认使用服务端游标分批读取；经PgBouncer事务池连接时必须关闭
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
+        }
     }
-}
-
-# 如果需要使用PostgreSQL，取消下面的注释并注释上面的SQLite配置
-# DATABASES = {
-#     'default': {
-#         'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
-#         'NAME': os.getenv('DB_NAME', 'wms_db'),
-#         'USER': os.getenv('DB_USER', 'postgres'),
-#         'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
-#         'HOST': os.getenv('DB_HOST', 'localhost'),
-#         'PORT': os.getenv('DB_PORT', '5432'),
-#     }
-# }
-
-# 如果需要使用MySQL，取消下面的注释并注释上面的配置
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.mysql',
-#         'NAME': os.getenv('DB_NAME', 'wms_db'),
-#         'USER': os.getenv('DB_USER', 'root'),
-#         'PASSWORD': os.getenv('DB_PASSWORD', 'root'),
-#         'HOST': os.getenv('DB_HOST', 'localhost'),
-#         'PORT': os.getenv('DB_PORT', '3306'),
-#         'OPTIONS': {
-#             'charset': 'utf8mb4',
-#         },
-#     }
-# }
+elif DB_ENGINE == 'mysql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.getenv('DB_NAME', 'wms_db'),
+            'USER': os.getenv('DB_USER', 'root'),
+            'PASSWORD': os.getenv('DB_PASSWORD', 'root'),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '3306'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'charset': 'utf8mb4',
+            },
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            # 调优模式下事务以BEGIN IMMEDIATE开始，避免先读后写的事务升级写锁失败
+            'ENGINE': 'utils.sqlite' if SQLITE_TUNED else 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT / 1000,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'不支持的DB_ENGINE: {DB_ENGINE}')
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -157,6 +194,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 可浏览API（HTML调试页面），默认跟随DEBUG，生产环境只返回JSON
+API_BROWSABLE = os.getenv('API_BROWSABLE', str(DEBUG)) == 'True'
+
 # REST Framework 配置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -173,9 +213,15 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    # orjson渲染和解析，未安装orjson时使用DRF自带的实现
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'utils.renderers.FastJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if API_BROWSABLE else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'utils.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
@@ -209,6 +255,52 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', 'your-email-password')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'WMS System <your-email@example.com>')
 
+# 缓存配置，多进程部署时应配置为共享缓存（如Redis），使缓存失效在各进程间生效
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'wms-default'),
+    }
+}
+
+# 请求性能统计（Server-Timing响应头和request_metrics日志）
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'False') == 'True'
+REQUEST_METRICS_TOP_N = int(os.getenv('REQUEST_METRICS_TOP_N', 5))
+
+# 响应压缩（gzip，安装Brotli后优先使用br）
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True') == 'True'
+# 小于该字节数的响应不压缩
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+# brotli质量越高压缩率越高，11比4慢数十倍，不适合实时压缩
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+
+# 单据编号每次向数据库领取的号段大小
+CODE_SEQUENCE_BLOCK_SIZE = int(os.getenv('CODE_SEQUENCE_BLOCK_SIZE', 100))
+
+# 只在本进程内有效的缓存后端，缓存失效无法通知其他进程
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# 商品、单位、库位解析缓存每类保留的最大条目数，0为不缓存；
+# 多进程间靠CACHES同步失效，CACHES为进程内缓存时默认不缓存
+RESOLVER_CACHE_SIZE = int(os.getenv(
+    'RESOLVER_CACHE_SIZE', 0 if CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS else 10000
+))
+
+# 后台任务（python manage.py run_jobs）
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+# 执行超过该时间（秒）的任务由worker在启动时和运行中定期标记为失败
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 3600))
+# 已结束任务及其文件的保留天数
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+# 出入库记录变化后的报表更新交给后台任务执行
+REPORT_UPDATES_IN_BACKGROUND = os.getenv('REPORT_UPDATES_IN_BACKGROUND', 'False') == 'True'
+
+# 月结（python manage.py close_month）的并行进程数
+MONTH_CLOSE_PROCESSES = int(os.getenv('MONTH_CLOSE_PROCESSES', 4))
+
 # 日志配置
 LOGGING = {
     'version': 1,
@@ -242,5 +334,15 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'utils.middleware': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'apps.job': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 } 
\ No newline at end of file
@@ -32,6 +32,7 @@ api_v1_patterns = [
     path('product/', include('apps.product.urls')),
     path('user/', include('apps.user.urls')),
     path('order/', include('apps.order.urls')),
+    path('job/', include('apps.job.urls')),
 ]
 
 urlpatterns = [
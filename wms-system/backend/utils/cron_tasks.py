@@ -15,8 +15,8 @@ import django
 django.setup()
 
 # 导入项目相关模块
-from django.apps import apps
-from apps.warehouse.views import WarehouseViewSet
+from django.conf import settings
+from apps.warehouse.month_close import close_month, previous_month
 
 # 配置日志
 logging.basicConfig(
@@ -29,31 +29,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def create_monthly_reports():
+def create_monthly_reports(force=False):
     """
-    该功能已禁用：不再自动创建月度报表
+    月结：把上个月的期末库存结转为本月报表的期初库存，每月1日执行
+
+    已完成的仓库自动跳过，重复执行不会重复结转
     """
-    logger.info("每月自动创建月度报表功能已被禁用")
-    logger.info("如需手动创建报表，请使用前端界面的'补创建当月报表'功能")
+    month = previous_month()
+    logger.info(f"开始月结: month={month:%Y-%m}, processes={settings.MONTH_CLOSE_PROCESSES}")
+
+    success_count = 0
+    error_count = 0
+    for result in close_month(month, processes=settings.MONTH_CLOSE_PROCESSES, force=force):
+        if result['status'] == 'failed':
+            error_count += 1
+            logger.error(f"仓库月结失败: warehouse_id={result['warehouse_id']}, error={result['message']}")
+        else:
+            success_count += 1
+
+    message = f'{month:%Y-%m}月结完成: 成功{success_count}个仓库，失败{error_count}个仓库'
+    logger.info(message)
     return {
-        'success_count': 0,
-        'error_count': 0,
-        'message': '自动创建月度报表功能已禁用'
+        'success_count': success_count,
+        'error_count': error_count,
+        'message': message
     }
     
 def main():
     """主函数，处理命令行参数"""
     parser = argparse.ArgumentParser(description='WMS系统自动化任务脚本')
     parser.add_argument('task', choices=['create_monthly_reports'], help='要执行的任务名称')
-    parser.add_argument('--force', action='store_true', help='强制执行任务，忽略时间检查')
+    parser.add_argument('--force', action='store_true', help='已完成月结的仓库也重新结转')
     
     args = parser.parse_args()
     
     logger.info(f"准备执行任务: {args.task}")
     
     if args.task == 'create_monthly_reports':
-        logger.info("每月自动创建月度报表功能已被禁用")
-        logger.info("如需手动创建报表，请使用前端界面的功能")
+        result = create_monthly_reports(force=args.force)
+        if result['error_count']:
+            sys.exit(1)
     
 if __name__ == '__main__':
     main() 
\ No newline at end of file
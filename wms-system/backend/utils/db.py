@@ -0,0 +1,41 @@
+"""
+数据库连接配置
+
+SQLite默认使用回滚日志，写事务期间其他连接无法读取，导入和报表信号并发写入时容易出现database is locked。
+SQLITE_TUNED开启后，每个新建的SQLite连接执行以下PRAGMA：
+- journal_mode=WAL：读写互不阻塞，同一时间仍只有一个写事务
+- synchronous=NORMAL：WAL模式下只在检查点时同步磁盘，断电最多丢失最后几个事务，不会损坏数据库
+- busy_timeout：写锁被占用时等待而不是立即报错
+- mmap_size、cache_size、temp_store：加大内存映射和页缓存，临时表放在内存中
+同时使用utils.sqlite数据库后端，事务以BEGIN IMMEDIATE开始。
+配合CONN_MAX_AGE复用连接，PRAGMA只在建立连接时执行一次。
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def sqlite_pragmas():
+    """按配置生成的PRAGMA列表"""
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', settings.SQLITE_BUSY_TIMEOUT),
+        ('mmap_size', settings.SQLITE_MMAP_SIZE),
+        # 负数表示以KiB为单位
+        ('cache_size', -settings.SQLITE_CACHE_SIZE),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def apply_sqlite_pragmas(cursor, pragmas=None):
+    for name, value in sqlite_pragmas() if pragmas is None else pragmas:
+        cursor.execute(f'PRAGMA {name}={value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNED:
+        return
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor)
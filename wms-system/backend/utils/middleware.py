@@ -0,0 +1,331 @@
+"""
+请求级中间件
+
+- RequestMetricsMiddleware：统计每个请求的总耗时、SQL数量、SQL总耗时以及最慢的若干条SQL，
+  通过Server-Timing响应头返回，并按DRF视图和action名称输出结构化日志。
+  由settings.REQUEST_METRICS_ENABLED开启。
+- StatementTimeoutMiddleware：限制API请求中单条SQL的执行时间。
+  由settings.DB_STATEMENT_TIMEOUT开启。
+- CompressionMiddleware：按Accept-Encoding压缩JSON等文本响应，流式响应逐块压缩。
+  由settings.RESPONSE_COMPRESSION开启。
+"""
+import heapq
+import json
+import logging
+import time
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 日志中单条SQL保留的最大长度
+SQL_PREVIEW_LENGTH = 300
+
+
+class QueryRecorder:
+    """通过connection.execute_wrapper记录SQL数量和耗时"""
+
+    def __init__(self, top_n):
+        self.top_n = top_n
+        self.count = 0
+        self.duration = 0.0
+        self._slowest = []
+        self._seq = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if self.top_n:
+                self._seq += 1
+                item = (duration, self._seq, sql)
+                if len(self._slowest) < self.top_n:
+                    heapq.heappush(self._slowest, item)
+                else:
+                    heapq.heappushpop(self._slowest, item)
+
+    def slowest(self):
+        return [
+            {'ms': round(duration * 1000, 2), 'sql': sql[:SQL_PREVIEW_LENGTH]}
+            for duration, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+
+def _view_name(view_func, method):
+    """返回 视图类.action 形式的视图名称，非DRF视图返回函数路径"""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f"{view_func.__module__}.{getattr(view_func, '__name__', type(view_func).__name__)}"
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower())
+    return f"{view_class.__name__}.{action}" if action else view_class.__name__
+
+
+class RequestMetricsMiddleware:
+    """
+    请求性能统计
+
+    相关配置:
+        REQUEST_METRICS_ENABLED: 是否开启
+        REQUEST_METRICS_TOP_N: 日志中记录的最慢SQL条数
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.top_n = getattr(settings, 'REQUEST_METRICS_TOP_N', 5)
+
+    def __call__(self, request):
+        recorder = QueryRecorder(self.top_n)
+        start = time.perf_counter()
+        with self._recording(recorder):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        response['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"'
+        )
+
+        if getattr(response, 'streaming', False):
+            # 流式响应的查询发生在发送内容时，内容发送完毕后再记录日志
+            response.streaming_content = self._stream(
+                response.streaming_content, request, response, recorder, start
+            )
+        else:
+            self._log(request, response, recorder, elapsed)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = _view_name(view_func, request.method)
+
+    def _recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def _stream(self, content, request, response, recorder, start):
+        try:
+            with self._recording(recorder):
+                yield from content
+        finally:
+            self._log(request, response, recorder, time.perf_counter() - start, streaming=True)
+
+    def _log(self, request, response, recorder, elapsed, streaming=False):
+        metrics = {
+            'view': getattr(request, '_metrics_view', None),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 2),
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'streaming': streaming,
+            'slowest': recorder.slowest(),
+        }
+        logger.info(f"request_metrics {json.dumps(metrics, ensure_ascii=False)}")
+
+
+class StatementTimeoutMiddleware:
+    """
+    API请求的SQL超时
+
+    PostgreSQL设置statement_timeout，MySQL设置max_execution_time（只对SELECT生效），SQLite不支持。
+    超时只设置在web进程的连接上，管理命令和后台任务的长查询不受影响；
+    持久连接上只在连接建立后的第一个请求中设置一次。
+
+    相关配置:
+        DB_STATEMENT_TIMEOUT: 超时毫秒数，0为不限制
+    """
+    STATEMENTS = {
+        'postgresql': 'SET statement_timeout = %s',
+        'mysql': 'SET SESSION max_execution_time = %s',
+    }
+
+    def __init__(self, get_response):
+        self.timeout = getattr(settings, 'DB_STATEMENT_TIMEOUT', 0)
+        if not self.timeout or connection.vendor not in self.STATEMENTS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        connection.ensure_connection()
+        # 按底层连接对象判断，重新连接后会再次设置
+        if getattr(connection, '_statement_timeout_connection', None) is not connection.connection:
+            with connection.cursor() as cursor:
+                cursor.execute(self.STATEMENTS[connection.vendor], [self.timeout])
+            connection._statement_timeout_connection = connection.connection
+        return self.get_response(request)
+
+
+# 可压缩的内容类型，另外压缩+json结尾的类型；xlsx、gzip备份等已压缩的内容不在其中。
+# text/html等页面不压缩，避免页面中的CSRF令牌受BREACH攻击
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript', 'application/xml')
+# 流式响应累计输入达到该字节数时刷新压缩器，把已压缩的数据发给客户端
+STREAM_FLUSH_SIZE = 64 * 1024
+
+
+def accepted_encodings(header):
+    """Accept-Encoding中q值大于0的编码"""
+    encodings = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        coding = coding.strip().lower()
+        if coding and quality > 0:
+            encodings.add(coding)
+    return encodings
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def compress_sequence(compressor, chunks):
+    """逐块压缩，不缓冲整个响应；每累计STREAM_FLUSH_SIZE字节输入刷新一次"""
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    响应压缩
+
+    客户端接受br且安装了Brotli时使用brotli，否则使用gzip。
+    只压缩2xx、内容类型可压缩、没有Content-Encoding的响应，非流式响应还须不小于COMPRESSION_MIN_SIZE；
+    压缩后没有变小的非流式响应原样返回。
+    压缩后的字节与原响应不同，强ETag改为弱ETag；If-None-Match按弱比较，月度报表的304不受影响。
+
+    相关配置:
+        RESPONSE_COMPRESSION: 是否开启
+        COMPRESSION_MIN_SIZE: 非流式响应的最小压缩字节数
+        COMPRESSION_GZIP_LEVEL: gzip压缩级别（1-9）
+        COMPRESSION_BROTLI_QUALITY: brotli压缩质量（0-11）
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'RESPONSE_COMPRESSION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        encoding = self.get_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if response.status_code == 304:
+            # 304与压缩后的200使用相同的ETag
+            if encoding is not None:
+                self._weaken_etag(response)
+            return response
+        if not self._compressible(response):
+            return response
+
+        # 内容随Accept-Encoding变化，缓存需要区分
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding is None:
+            return response
+
+        compressor = self.get_compressor(encoding)
+        if response.streaming:
+            response.streaming_content = compress_sequence(compressor, response.streaming_content)
+            del response['Content-Length']
+        else:
+            content = compressor.compress(response.content) + compressor.finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        response['Content-Encoding'] = encoding
+        self._weaken_etag(response)
+        return response
+
+    def get_encoding(self, accept_encoding):
+        """按Accept-Encoding选择压缩编码，客户端不接受压缩时返回None"""
+        encodings = accepted_encodings(accept_encoding)
+        if brotli is not None and 'br' in encodings:
+            return 'br'
+        if 'gzip' in encodings:
+            return 'gzip'
+        return None
+
+    def get_compressor(self, encoding):
+        if encoding == 'br':
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    def _weaken_etag(self, response):
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+
+    def _compressible(self, response):
+        if not 200 <= response.status_code < 300 or response.status_code in (204, 206):
+            return False
+        if response.has_header('Content-Encoding'):
+            return False
+        if response.streaming:
+            # 异步迭代器由ASGI处理，这里只压缩同步流
+            if getattr(response, 'is_async', False):
+                return False
+        elif len(response.content) < self.min_size:
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        return content_type in COMPRESSIBLE_TYPES or content_type.endswith('+json')
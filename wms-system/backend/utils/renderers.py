@@ -0,0 +1,68 @@
+"""
+基于orjson的DRF JSON渲染器和解析器
+
+报表等大响应中有大量Decimal和中文键，标准库json编码耗时明显。
+orjson未安装时退回DRF自带的实现。日期时间、UUID、惰性翻译字符串等交给DRF的JSONEncoder处理，
+格式与JSONRenderer相同；与JSONRenderer的差异：
+- 浮点数的指数写法不同，如1e16（JSONRenderer为1e+16）、1.5e-7（为1.5e-07），数值相同
+- NaN和Infinity输出为null，JSONRenderer会报错
+- Decimal与DRF的JSONEncoder一样转为float，超出float精度的部分丢失；
+  需要保留精度的字段应由序列化器的DecimalField输出（按COERCE_DECIMAL_TO_STRING转为字符串）
+"""
+from decimal import Decimal
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 日期时间交给DRF的JSONEncoder，保持UTC时间以Z结尾等格式；非字符串键与标准库一样转为字符串
+DUMPS_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Decimal最常见，先于JSONEncoder的逐类型判断处理，与JSONEncoder一样转为float
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    orjson渲染器
+
+    请求指定了缩进（如Accept: application/json; indent=4）时使用DRF的实现
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None \
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_default, option=DUMPS_OPTIONS)
+        # 与JSONRenderer一致，转义JavaScript中不能出现在字符串字面量里的两个字符
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """orjson解析器，请求体不是UTF-8编码时使用DRF的实现"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,14 @@
+"""
+SQLite数据库后端，事务以BEGIN IMMEDIATE开始
+
+默认的BEGIN（DEFERRED）在第一次写入时才申请写锁，事务中先读后写时，
+若其他连接已提交了写入，升级写锁会立即失败（database is locked），busy_timeout对此无效。
+IMMEDIATE在事务开始时即申请写锁，等待遵循busy_timeout。
+WAL模式下只读查询不受影响。
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
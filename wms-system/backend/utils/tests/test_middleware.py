@@ -0,0 +1,45 @@
+import gzip
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from utils.middleware import CompressionMiddleware
+
+BODY = b'{"items": [' + b', '.join(b'{"name": "item"}' for _ in range(200)) + b']}'
+
+
+@override_settings(RESPONSE_COMPRESSION=True, COMPRESSION_MIN_SIZE=100)
+class CompressionTests(SimpleTestCase):
+    """响应压缩"""
+
+    def get(self, response, accept_encoding='gzip'):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_json_compressed(self):
+        response = HttpResponse(BODY, content_type='application/json')
+        response['ETag'] = '"abc"'
+        response = self.get(response)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streaming_ndjson_compressed(self):
+        response = self.get(StreamingHttpResponse(iter([BODY, b'\n', BODY]), content_type='application/x-ndjson'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), BODY + b'\n' + BODY)
+
+    def test_other_types_not_compressed(self):
+        # 页面中的CSRF令牌不能与压缩一起出现（BREACH），已压缩的内容再压缩没有意义
+        for content_type in ('text/html; charset=utf-8', 'text/plain', 'application/gzip'):
+            with self.subTest(content_type=content_type):
+                response = self.get(HttpResponse(BODY, content_type=content_type))
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, BODY)
+
+    def test_client_without_gzip(self):
+        response = self.get(HttpResponse(BODY, content_type='application/json'), accept_encoding='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])